@@ -1,25 +1,50 @@
 # loader.py
-from loader import Loader
-from loader import LoaderHDF
-from loader import LoaderTxt
-from loader import LoaderRinex
+from .loader import Loader
+from .loader import LoaderHDF
+from .loader import LoaderTxt
+from .loader import LoaderRinex
+from .loader import parse_dat
+
+# rinex.py
+from .rinex import read_obs
+from .rinex import read_nav
+
+# cache.py
+from .cache import ParsedCache
+
+# arcs.py
+from .arcs import ArcStore
+from .arcs import ArcChunks
+
+# manifest.py
+from .manifest import Manifest
 
 #tec_prepare.py
 #classses
-from tec_prepare import DataSourceType
-from tec_prepare import MagneticCoordType
-from tec_prepare import ProcessingType
+from .tec_prepare import DataSourceType
+from .tec_prepare import MagneticCoordType
+from .tec_prepare import ProcessingType
 
 #functions
-from tec_prepare import process_data
-from tec_prepare import get_continuos_intervals
-from tec_prepare import process_intervals
-from tec_prepare import combine_data
-from tec_prepare import get_chunk_indexes
-from tec_prepare import calc_mag
-from tec_prepare import calc_mag_ref
-from tec_prepare import save_data
-from tec_prepare import get_data
-from tec_prepare import calculate_seed_mag_coordinates_parallel
-
-from tec_prepare import sites
\ No newline at end of file
+from .tec_prepare import process_data
+from .tec_prepare import process_data_days
+from .tec_prepare import prepare_arcs
+from .tec_prepare import get_continuos_intervals
+from .tec_prepare import getContInt
+from .tec_prepare import getContIntBatched
+from .tec_prepare import process_intervals
+from .tec_prepare import combine_data
+from .tec_prepare import get_chunk_indexes
+from .tec_prepare import calc_mag
+from .tec_prepare import calc_mag_ref
+from .tec_prepare import save_data
+from .tec_prepare import get_data
+from .tec_prepare import read_data
+from .tec_prepare import calc_mag_coordinates
+from .tec_prepare import mag_fields
+from .tec_prepare import calculate_seed_mag_coordinates_parallel
+
+from .tec_prepare import sites
+
+# stream.py
+from .stream import StreamIngestor
@@ -0,0 +1,143 @@
+import numpy as np
+
+# columns of prepared observations, same names as in chunks of combine_data:
+# tec is dtec of observation relative to its reference, iref is index of the
+# reference in reference columns
+OBS_DTYPES = {'tec': float,
+              'time': 'datetime64[s]', 'lon': float, 'lat': float, 'el': float,
+              'iref': 'int64'}
+# columns of references, one row per arc if all its observations share
+# reference point, or one per observation
+REF_DTYPES = {'rtime': 'datetime64[s]', 'rlon': float, 'rlat': float, 'rel': float}
+# loader fields that fill observation and reference columns
+ARC_SOURCES = {'time': 'datetime', 'lon': 'ipp_lon', 'lat': 'ipp_lat', 'el': 'el'}
+
+
+class ArcStore():
+    """
+    Columnar ragged store of prepared arcs. Every observation column keeps
+    rows of all arcs back to back, arc k is rows offsets[k]:offsets[k+1].
+    References are kept in separate columns and referred by iref, so shared
+    reference of an arc is stored once. Columns grow geometrically, so
+    appending arc by arc is amortized O(rows). Chunks are handed out as
+    views, no copies are made.
+    """
+
+    def __init__(self, capacity:int=1024):
+        self.size = 0
+        self.nrefs = 0
+        self.capacity = max(capacity, 1)
+        self.ref_capacity = max(capacity // 16, 1)
+        self.columns = {f: np.empty(self.capacity, dt)
+                        for f, dt in OBS_DTYPES.items()}
+        self.columns.update({f: np.empty(self.ref_capacity, dt)
+                             for f, dt in REF_DTYPES.items()})
+        self.offsets = [0]
+
+    @property
+    def narcs(self)->int:
+        return len(self.offsets) - 1
+
+    def __len__(self)->int:
+        return self.size
+
+    def __getitem__(self, name:str)->np.array:
+        """
+        Column of all stored observations or references, view
+        """
+        if name in REF_DTYPES:
+            return self.columns[name][:self.nrefs]
+        return self.columns[name][:self.size]
+
+    def __grow(self, fields:dict, used:int, capacity:int, size:int)->int:
+        if size <= capacity:
+            return capacity
+        capacity = max(size, int(capacity * 1.5))
+        for f in fields:
+            grown = np.empty(capacity, self.columns[f].dtype)
+            grown[:used] = self.columns[f][:used]
+            self.columns[f] = grown
+        return capacity
+
+    def reserve(self, size:int, nrefs:int=0):
+        self.capacity = self.__grow(OBS_DTYPES, self.size, self.capacity, size)
+        self.ref_capacity = self.__grow(REF_DTYPES, self.nrefs,
+                                        self.ref_capacity, nrefs)
+
+    def append(self, dtec:np.array, out:np.array, ref:np.array):
+        """
+        Adds one arc
+        :param dtec: tec difference of observation and reference
+        :param out: observations, loader dtype
+        :param ref: single reference of all observations or reference of
+            every observation, loader dtype
+        """
+        n = len(dtec)
+        m = len(ref)
+        if m != 1 and m != n:
+            raise ValueError(f'{m} references for {n} observations')
+        self.reserve(self.size + n, self.nrefs + m)
+        rows = slice(self.size, self.size + n)
+        self.columns['tec'][rows] = dtec
+        self.columns['iref'][rows] = self.nrefs + (np.arange(n) if m > 1 else 0)
+        refs = slice(self.nrefs, self.nrefs + m)
+        for f, source in ARC_SOURCES.items():
+            self.columns[f][rows] = out[source]
+            self.columns['r' + f][refs] = ref[source]
+        self.size += n
+        self.nrefs += m
+        self.offsets.append(self.size)
+
+    def extend(self, prepared:dict[str,list[np.array]]):
+        """
+        Adds arcs of prepare_arcs result or of other store
+        """
+        if isinstance(prepared, ArcStore):
+            self.reserve(self.size + prepared.size, self.nrefs + prepared.nrefs)
+            rows = slice(self.size, self.size + prepared.size)
+            for f in OBS_DTYPES:
+                self.columns[f][rows] = prepared[f]
+            self.columns['iref'][rows] += self.nrefs
+            refs = slice(self.nrefs, self.nrefs + prepared.nrefs)
+            for f in REF_DTYPES:
+                self.columns[f][refs] = prepared[f]
+            self.offsets.extend(o + self.size for o in prepared.offsets[1:])
+            self.size += prepared.size
+            self.nrefs += prepared.nrefs
+            return
+        for dtec, out, ref in zip(prepared['dtec'], prepared['out'],
+                                  prepared['ref']):
+            self.append(dtec, out, ref)
+
+    def chunk(self, start:int, fin:int)->dict[str,np.array]:
+        """
+        Views of observations start:fin, iref of them points to all
+        references, which are given as views as well
+        """
+        chunk = {f: self.columns[f][start:fin] for f in OBS_DTYPES}
+        chunk.update({f: self[f] for f in REF_DTYPES})
+        return chunk
+
+
+class ArcChunks(list):
+    """
+    Chunks of ArcStore made by combine_data. Store and bounds of chunks 
+    are kept, so all chunks together are taken as a slice of the store
+    instead of joining them.
+    """
+
+    def __init__(self, store:ArcStore, bounds:list[tuple[int,int]]):
+        """
+        :param bounds: (start, fin) of consecutive chunks
+        """
+        super().__init__(store.chunk(start, fin) for start, fin in bounds)
+        self.store = store
+        self.bounds = bounds
+
+    def joined(self)->dict[str,np.array]:
+        """
+        Views of observations of all chunks and of references
+        """
+        start = self.bounds[0][0] if self.bounds else 0
+        fin = self.bounds[-1][1] if self.bounds else 0
+        return self.store.chunk(start, fin)
@@ -0,0 +1,61 @@
+import os
+import hashlib
+import numpy as np
+
+from pathlib import Path
+
+
+class ParsedCache():
+    """
+    Persistent cache of parsed per-satellite data. Every entry is a single
+    .npy file with structured array, so it is loaded with memory mapping.
+    Entries are keyed by source path, size and mtime, any change of these
+    makes the entry stale.
+    """
+
+    def __init__(self, cache_dir:Path):
+        self.cache_dir = Path(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __path_hash(self, filepath:Path, item:str='')->str:
+        source = str(Path(filepath).resolve()) + '::' + item
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def entry(self, filepath:Path, item:str='')->Path:
+        """
+        :param filepath: source file
+        :param item: part of the file, e.g. site/sat inside hdf
+        :return: path of the entry for current size and mtime of filepath
+        """
+        stat = os.stat(filepath)
+        name = f'{self.__path_hash(filepath, item)}_{stat.st_size}_{stat.st_mtime_ns}.npy'
+        return self.cache_dir / name
+
+    def get(self, filepath:Path, item:str='')->np.memmap|None:
+        entry = self.entry(filepath, item)
+        if not entry.exists():
+            return None
+        return np.load(entry, mmap_mode='r')
+
+    def put(self, filepath:Path, data:np.array, item:str=''):
+        entry = self.entry(filepath, item)
+        prefix = self.__path_hash(filepath, item)
+        for stale in self.cache_dir.glob(prefix + '_*.npy'):
+            if stale != entry:
+                stale.unlink(missing_ok=True)
+        # several workers could write the same entry, replace is atomic
+        tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp, entry)
+
+    def load(self, filepath:Path, parser, item:str='')->np.array:
+        """
+        Returns cached data or parses filepath with parser and stores result
+        """
+        data = self.get(filepath, item)
+        if data is not None:
+            return data
+        data = parser(filepath)
+        self.put(filepath, data, item)
+        return data
@@ -4,6 +4,7 @@ import numpy as np
 import re
 import h5py
 import concurrent.futures
+from abc import ABC, abstractmethod
 from datetime import datetime
 from warnings import warn
 from collections import defaultdict
@@ -14,27 +15,258 @@ arctan, arctan2, rad2deg)
 
 from mosgim.geo.geo import HM
 from mosgim.geo.geo import sub_ionospheric
+from mosgim.data.cache import ParsedCache
+from mosgim.data import rinex
+from mosgim.utils.shm import SharedColumns
 
+DAT_FIELDS = ['datetime', 'el', 'ipp_lat', 'ipp_lon', 'tec']
+# timestamps are kept as raw ISO bytes while reading, numpy parses them 
+# to datetime64 for the whole column at once
+DAT_RAW_DTYPE = list(zip(DAT_FIELDS, ('S19', float, float, float, float)))
+DAT_DTYPE = list(zip(DAT_FIELDS, ('datetime64[s]', float, float, float, float)))
+# shortest possible line of *.dat file, bounds number of rows by file size
+DAT_MIN_ROW_BYTES = 28
+# raw chunk cache per opened hdf file, bytes
+HDF_CHUNK_CACHE = 64 * 1024**2
+# version of parsed RINEX stations in cache, entries of other versions
+# are not used (2: datetime is UTC instead of GPS time)
+RINEX_CACHE_VERSION = 2
 
-class Loader():
+
+def parse_dat(source)->np.array:
+    """
+    Reads five-column *.dat file in bulk: ISO datetime, el, ipp_lat, ipp_lon, 
+    tec. Lines starting with '#' are comments.
+    :param source: path to file, file object or list of lines
+    :return: structured array with DAT_FIELDS, datetime is datetime64[s]
+    """
+    raw = np.loadtxt(source, comments='#', dtype=DAT_RAW_DTYPE, ndmin=1)
+    data = np.empty(raw.shape, DAT_DTYPE)
+    data['datetime'] = raw['datetime'].astype('datetime64[s]')
+    for field in DAT_FIELDS[1:]:
+        data[field] = raw[field]
+    return data
+
+
+class Loader(ABC):
     
-    def __init__(self):
+    def __init__(self, cache_dir:Path=None, manifest=None, 
+                 day:datetime=None):
+        """
+        :param cache_dir: folder for persistent cache of parsed data, 
+            no caching if None
+        :param manifest: manifest.Manifest of data folder, files are selected
+            from it instead of walking the folder
+        :param day: with manifest only files with data in this UTC day
+            are loaded
+        """
         self.FIELDS = ['datetime', 'el', 'ipp_lat', 'ipp_lon', 'tec']
-        self.DTYPE = (object, float, float, float, float)
+        self.DTYPE = ('datetime64[s]', float, float, float, float)
         self.not_found_sites = []
+        self.cache = ParsedCache(cache_dir) if cache_dir else None
+        self.manifest = manifest
+        self.day = day
+
+    def to_loader_dtype(self, data:np.array)->np.array:
+        """
+        Converts array with same fields (e.g. from parse_dat) to loader DTYPE,
+        array already in loader DTYPE (e.g. cached memmap) is returned as is
+        """
+        dtype = np.dtype(list(zip(self.FIELDS, self.DTYPE)))
+        if data.dtype == dtype:
+            return data
+        arr = np.empty(data.shape, dtype)
+        for field in self.FIELDS:
+            arr[field] = data[field]
+        return arr
+
+    def transport_dtypes(self, prepared:bool=False)->dict[str,any]:
+        """
+        Columns to pass data through SharedColumns: loader fields for raw 
+        data, dtec and out_/ref_ fields for prepared arcs
+        """
+        if not prepared:
+            return dict(DAT_DTYPE)
+        dtypes = {'dtec': float}
+        for prefix in ['out_', 'ref_']:
+            dtypes.update({prefix + f: dt for f, dt in DAT_DTYPE})
+        return dtypes
+
+    def pack_columns(self, data:any)->tuple[dict[str,np.array],list|None]:
+        """
+        Flattens raw array or prepared arcs to columns of transport_dtypes
+        :return: columns and lengths of arcs, (observations, references) 
+            per arc (None for raw array)
+        """
+        if not isinstance(data, dict):
+            return {f: data[f] for f in self.FIELDS}, None
+        lengths = [(len(dtec), len(ref)) 
+                   for dtec, ref in zip(data.get('dtec', []), data.get('ref', []))]
+        if not lengths:
+            return {}, lengths
+        columns = {'dtec': np.concatenate(data['dtec'])}
+        for prefix, key in [('out_', 'out'), ('ref_', 'ref')]:
+            arcs = np.concatenate(data[key])
+            columns.update({prefix + f: arcs[f] for f in self.FIELDS})
+        return columns, lengths
+
+    @staticmethod
+    def packed_size(data:any, lengths:list|None)->int:
+        """
+        Rows taken in shared columns by result of pack_columns
+        """
+        if lengths is None:
+            return data.shape[0]
+        if not lengths:
+            return 0
+        return int(max(np.sum(lengths, axis=0)))
+
+    def unpack_columns(self, shared:SharedColumns, start:int, size:int,
+                       lengths:list|None)->any:
+        """
+        Reverse of pack_columns, copies rows from shared columns
+        """
+        dtype = list(zip(self.FIELDS, self.DTYPE))
+        if lengths is None:
+            arr = np.empty((size,), dtype)
+            for f in self.FIELDS:
+                arr[f] = shared[f][start:start + size]
+            return arr
+        result = defaultdict(list)
+        if not lengths:
+            return result
+        nobs, nrefs = np.array(lengths).T
+        splits = np.cumsum(nobs)[:-1]
+        fin = start + nobs.sum()
+        result['dtec'] = np.split(shared['dtec'][start:fin].copy(), splits)
+        for prefix, key, counts in [('out_', 'out', nobs), ('ref_', 'ref', nrefs)]:
+            count = counts.sum()
+            arr = np.empty((count,), dtype)
+            for f in self.FIELDS:
+                arr[f] = shared[prefix + f][start:start + count]
+            result[key] = np.split(arr, np.cumsum(counts)[:-1])
+        return result
+
+    @abstractmethod
+    def load_task(self, task:any, preprocess=None)->list[tuple[any,any]]:
+        """
+        Loads one task of generate_pool in worker
+        :return: list of (data, data_id)
+        """
+
+    @abstractmethod
+    def task_size(self, task:any)->int:
+        """
+        Upper bound of number of rows returned by load_task
+        """
+
+    def load_task_shared(self, task:any, spec:dict, preprocess=None)->list[tuple]:
+        """
+        Same as load_task, but writes results to shared columns given by spec
+        :return: (data_id, start, size, lengths) per result or 
+            (data, data_id) if rows do not fit in shared columns
+        """
+        result = []
+        start = 0
+        with SharedColumns.attach(spec) as shared:
+            for data, data_id in self.load_task(task, preprocess):
+                columns, lengths = self.pack_columns(data)
+                size = self.packed_size(data, lengths)
+                if start + size > shared.size:
+                    result.append((data, data_id))
+                    continue
+                shared.write(start, **columns)
+                result.append((data_id, start, size, lengths))
+                start += size
+        return result
+
+    def shared_slot(self, task:any, prepared:bool)->SharedColumns:
+        """
+        Allocates shared columns large enough for all rows of the task
+        """
+        return SharedColumns.create(self.transport_dtypes(prepared), 
+                                    self.task_size(task))
+
+    def generate_pool(self, tasks, nworkers:int=1, max_inflight:int=0, 
+                      preprocess=None, shared:bool=True):
+        """
+        Runs load_task in worker processes for every task, ready (data, 
+        data_id) tuples in tasks are yielded as is. At most max_inflight 
+        tasks (2 * nworkers by default) are submitted before results are 
+        consumed, so memory does not grow with number of tasks and slow 
+        consumer holds back loading.
+        If preprocess (e.g. tec_prepare.prepare_arcs) is given, it runs in 
+        workers and its results are yielded instead of raw data.
+        If shared, workers write results to SharedColumns allocated per 
+        task instead of pickling arrays back.
+        """
+        max_inflight = max_inflight if max_inflight > 0 else 2 * nworkers
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            inflight = {}
+            exhausted = False
+            try:
+                while inflight or not exhausted:
+                    while not exhausted and len(inflight) < max_inflight:
+                        task = next(tasks, None)
+                        if task is None:
+                            exhausted = True
+                        elif isinstance(task, tuple):
+                            yield task
+                        elif shared:
+                            slot = self.shared_slot(task, preprocess is not None)
+                            query = executor.submit(self.load_task_shared, task, 
+                                                    slot.spec, preprocess)
+                            inflight[query] = slot
+                        else:
+                            query = executor.submit(self.load_task, task, 
+                                                    preprocess)
+                            inflight[query] = None
+                    if not inflight:
+                        continue
+                    done, _ = concurrent.futures.wait(
+                        inflight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for cur_future in done:
+                        slot = inflight.pop(cur_future)
+                        try:
+                            for item in cur_future.result():
+                                if len(item) == 2:
+                                    yield item
+                                    continue
+                                data_id, start, size, lengths = item
+                                data = self.unpack_columns(slot, start, size, lengths)
+                                yield data, data_id
+                        finally:
+                            if slot is not None:
+                                slot.close()
+            finally:
+                for slot in inflight.values():
+                    if slot is not None:
+                        slot.close()
+
 
 class LoaderTxt(Loader):
     
-    def __init__(self, root_dir:Path):
-        super().__init__()
+    def __init__(self, root_dir:Path, fast:bool=True, cache_dir:Path=None,
+                 manifest=None, day:datetime=None):
+        """
+        :param root_dir: folder with site subfolders
+        :param fast: use columnar parse_dat instead of np.genfromtxt
+        :param cache_dir: folder for persistent cache of parsed files
+        :param manifest: see Loader
+        :param day: see Loader
+        """
+        super().__init__(cache_dir=cache_dir, manifest=manifest, day=day)
         self.dformat = "%Y-%m-%dT%H:%M:%S"
         self.root_dir = root_dir
+        self.fast = fast
 
     def get_files(self, rootdir:Path)->defaultdict[str,list[str]]:
         """
         Root directroy must contain folders with site name 
         Inside subfolders are *.dat files for every satellite
         """
+        if self.manifest is not None:
+            return self.manifest.select('dat', day=self.day)
         result = defaultdict(list)
         for subdir, _, files in os.walk(rootdir):
             for filename in files:
@@ -51,6 +283,14 @@ class LoaderTxt(Loader):
         return result
 
     def load_data(self, filepath:Path)->tuple[np.array,Path]:
+        if self.cache is not None:
+            data = self.cache.load(filepath, parse_dat)
+            return self.to_loader_dtype(data), filepath
+        if self.fast:
+            return self.to_loader_dtype(parse_dat(filepath)), filepath
+        return self.load_data_genfromtxt(filepath)
+
+    def load_data_genfromtxt(self, filepath:Path)->tuple[np.array,Path]:
         convert = lambda x: datetime.strptime(x.decode("utf-8"), self.dformat)
         data = np.genfromtxt(filepath, 
                              comments='#', 
@@ -84,107 +324,385 @@ class LoaderTxt(Loader):
                     print(f'{sat_file} not processed. Reason: {e}')
             print(f'{site} contribute {count} files, takes {time.time() - st}')
             
-    def generate_data_pool(self, sites:list[str]=[], nworkers:int=1):
-        files = self.get_files(self.root_dir)
-        print(f'Collected {len(files)} sites')
+    def load_batch(self, filepaths:list[Path], preprocess=None)->list[tuple[any,Path]]:
+        """
+        Loads several files in one task, broken files are reported and skipped
+        :param preprocess: callable (data, filepath), its result is returned 
+            instead of data, None result means file is skipped
+        """
+        result = []
+        for filepath in filepaths:
+            try:
+                data, _ = self.load_data(filepath)
+            except Exception as e:
+                print(f'{filepath} not processed. Reason: {e}')
+                continue
+            if preprocess is not None:
+                data = preprocess(data, filepath)
+                if data is None:
+                    continue
+            result.append((data, filepath))
+        return result
+
+    def load_task(self, task:list[Path], preprocess=None)->list[tuple[any,Path]]:
+        return self.load_batch(task, preprocess)
+
+    def task_size(self, task:list[Path])->int:
+        """
+        Upper bound of number of rows in files of the task
+        """
+        nbytes = sum(os.stat(f).st_size for f in task)
+        return nbytes // DAT_MIN_ROW_BYTES + 1
+
+    def generate_batches(self, files:dict[str,list[Path]], sites:list[str]=[], 
+                         batch_size:int=0, cached_raw:bool=True):
+        """
+        Splits files of selected sites into loading tasks: all site files at 
+        once if batch_size < 1, otherwise by batch_size files. 
+        :param cached_raw: files found in cache are yielded as (data, 
+            filepath) instead of a task, otherwise they are left to tasks,
+            so workers read them from cache and preprocess
+        """
         self.not_found_sites = sites[:]
-        with ProcessPoolExecutor(max_workers=nworkers) as executor:
-            queue = []
-            for site, site_files in files.items():
-                if sites and not site in sites:
+        for site, site_files in files.items():
+            if sites and not site in sites:
+                continue
+            self.not_found_sites.remove(site)
+            batch = []
+            for sat_file in site_files:
+                cached = self.__get_cached(sat_file) if cached_raw else None
+                if cached is not None:
+                    yield self.to_loader_dtype(cached), sat_file
                     continue
-                self.not_found_sites.remove(site)
-                count = 0
-                st = time.time()
-                for sat_file in site_files:
-                    try:
-                        query = executor.submit(self.load_data, sat_file)
-                        queue.append(query)
-                    except Exception as e:
-                        print(f'{sat_file} not processed. Reason: {e}')
-                print(site)
-            for cur_future in concurrent.futures.as_completed(queue):
-                yield cur_future.result()
+                batch.append(sat_file)
+                if batch_size > 0 and len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            print(site)
+
+    def generate_data_pool(self, sites:list[str]=[], nworkers:int=1, 
+                           batch_size:int=0, max_inflight:int=0, 
+                           preprocess=None, shared:bool=True):
+        """
+        Loads files in worker processes, task is a site or batch_size files,
+        see generate_pool for other parameters. Cached files are yielded raw
+        without preprocess, with it they are prepared in workers as others.
+        """
+        files = self.get_files(self.root_dir)
+        print(f'Collected {len(files)} sites')
+        tasks = self.generate_batches(files, sites, batch_size, 
+                                      cached_raw=preprocess is None)
+        yield from self.generate_pool(tasks, nworkers, max_inflight, 
+                                      preprocess, shared)
+
+    def __get_cached(self, sat_file:Path)->np.memmap|None:
+        if self.cache is None:
+            return None
+        return self.cache.get(sat_file)
 
 
 class LoaderHDF(Loader):
     
-    def __init__(self, hdf_path:Path):
-        super().__init__()
+    def __init__(self, hdf_path:Path, cache_dir:Path=None, manifest=None,
+                 day:datetime=None):
+        """
+        :param hdf_path: hdf file or folder with several hdf files, e.g. one 
+            per network or per hour
+        :param cache_dir: folder for persistent cache of parsed data
+        :param manifest: see Loader
+        :param day: see Loader
+        """
+        super().__init__(cache_dir=cache_dir, manifest=manifest, day=day)
         self.hdf_path = hdf_path
+        self.site_files = defaultdict(list)
+        self.site_rows = defaultdict(int)
         
     def get_files(self)->list[Path]:
+        if Path(self.hdf_path).is_file():
+            return [Path(self.hdf_path)]
         result = []
         for subdir, _, files in os.walk(self.hdf_path):
             for filename in files:
                 filepath = Path(subdir) / filename
                 if str(filepath).endswith(".h5"):
                     result.append(filepath)
-        if len(result) != 1:
-            msg = f'Must be exactly one hdf in {self.hdf_path} or subfolders'
+        if len(result) == 0:
+            msg = f'No hdf in {self.hdf_path} or subfolders'
             raise ValueError(msg)
+        result.sort()
         return result
-    
-    def __get_hdf_file(self)->Path:
-        return self.get_files()[0]
-    
-    def generate_data(self, sites:list[str]=[]):
-        hdf_file = h5py.File(self.__get_hdf_file(), 'r')
+
+    def collect_sites(self)->dict[str,list[Path]]:
+        """
+        Finds hdf files for every site and number of rows in them, only
+        metadata is read
+        """
+        self.site_files = defaultdict(list)
+        self.site_rows = defaultdict(int)
+        if self.manifest is not None:
+            self.site_files = self.manifest.select('hdf', day=self.day)
+            for site, files in self.site_files.items():
+                self.site_rows[site] = sum(self.manifest.rows(f, site) 
+                                           for f in files)
+            return self.site_files
+        for hdf_path in self.get_files():
+            with h5py.File(hdf_path, 'r') as hdf_file:
+                for site in hdf_file:
+                    self.site_files[site].append(hdf_path)
+                    for sat in hdf_file[site]:
+                        self.site_rows[site] += hdf_file[site][sat]['tec'].shape[0]
+        return self.site_files
+
+    def generate_sites(self, sites:list[str]=[]):
+        self.collect_sites()
+        print(f'Collected {len(self.site_files)} sites')
         self.not_found_sites = sites[:]
-        for site in hdf_file:
+        for site in self.site_files:
             if sites and not site in sites:
                 continue
             self.not_found_sites.remove(site)
-            slat = hdf_file[site].attrs['lat']
-            slon = hdf_file[site].attrs['lon']
+            yield site
+    
+    def generate_data(self, sites:list[str]=[]):
+        for site in self.generate_sites(sites):
             st = time.time()
             count = 0
-            for sat in hdf_file[site]:
-                sat_data = hdf_file[site][sat]
-                arr = np.empty((len(sat_data['tec']),), 
-                               list(zip(self.FIELDS,self.DTYPE)))
-                el = sat_data['elevation'][:]
-                az = sat_data['azimuth'][:]
-                ts = sat_data['timestamp'][:]
-                ipp_lat, ipp_lon = sub_ionospheric(slat, slon, HM, az, el)
-                
-                arr['datetime'] = np.array([datetime.fromtimestamp(float(t)) for t in ts])
-                arr['el'] = np.rad2deg(el)
-                arr['ipp_lat'] = np.rad2deg(ipp_lat)
-                arr['ipp_lon'] = np.rad2deg(ipp_lon)
-                arr['tec'] = sat_data['tec'][:]
+            for data, data_id in self.load_site(site):
                 count += 1
-                yield arr, sat + '_' + site
+                yield data, data_id
             print(f'{site} contribute {count} files, takes {time.time() - st}')
 
+    def generate_data_pool(self, sites:list[str]=[], nworkers:int=1, 
+                           max_inflight:int=0, preprocess=None, 
+                           shared:bool=True):
+        """
+        Loads sites in worker processes, every worker opens hdf files 
+        itself, see generate_pool for other parameters
+        """
+        tasks = self.generate_sites(sites)
+        yield from self.generate_pool(tasks, nworkers, max_inflight, 
+                                      preprocess, shared)
+
+    def load_task(self, task:str, preprocess=None)->list[tuple[any,str]]:
+        return self.load_site(task, preprocess)
+
+    def task_size(self, task:str)->int:
+        return self.site_rows[task] + 1
+
+    def load_site(self, site:str, preprocess=None)->list[tuple[any,str]]:
+        """
+        Reads all satellites of the site from every hdf file it is found in,
+        parts of the same satellite are merged in time order
+        :param preprocess: callable (data, data_id), see LoaderTxt.load_batch
+        """
+        parts = defaultdict(list)
+        for hdf_path in self.site_files[site]:
+            try:
+                with h5py.File(hdf_path, 'r', rdcc_nbytes=HDF_CHUNK_CACHE) as hdf_file:
+                    group = hdf_file[site]
+                    slat = group.attrs['lat']
+                    slon = group.attrs['lon']
+                    for sat in group:
+                        parts[sat].append(self.load_sat(hdf_path, group, sat, 
+                                                        slat, slon))
+            except Exception as e:
+                print(f'{site} in {hdf_path} not processed. Reason: {e}')
+        result = []
+        for sat, sat_parts in parts.items():
+            arr = sat_parts[0]
+            if len(sat_parts) > 1:
+                arr = np.concatenate(sat_parts)
+                arr = arr[np.argsort(arr['datetime'], kind='stable')]
+            data = self.to_loader_dtype(arr)
+            data_id = sat + '_' + site
+            if preprocess is not None:
+                data = preprocess(data, data_id)
+                if data is None:
+                    continue
+            result.append((data, data_id))
+        return result
+
+    def load_sat(self, hdf_path:Path, group:h5py.Group, sat:str, 
+                 slat:float, slon:float)->np.array:
+        item = group.name.strip('/') + '/' + sat
+        arr = self.cache.get(hdf_path, item) if self.cache else None
+        if arr is None:
+            arr = self.__read_sat(group[sat], slat, slon)
+            if self.cache is not None:
+                self.cache.put(hdf_path, arr, item)
+        return arr
+
+    def __read_sat(self, sat_data:h5py.Group, slat:float, slon:float)->np.array:
+        # every dataset is read with single call into preallocated array, 
+        # so each hdf chunk is read and decompressed once
+        columns = {}
+        for name in ['elevation', 'azimuth', 'timestamp', 'tec']:
+            dataset = sat_data[name]
+            columns[name] = np.empty(dataset.shape, float)
+            if dataset.size > 0:
+                dataset.read_direct(columns[name])
+        el = columns['elevation']
+        ipp_lat, ipp_lon = sub_ionospheric(slat, slon, HM, columns['azimuth'], el)
+
+        arr = np.empty(el.shape, DAT_DTYPE)
+        # timestamps are UTC epoch seconds
+        ts = np.round(columns['timestamp']).astype('int64')
+        arr['datetime'] = ts.astype('datetime64[s]')
+        arr['el'] = np.rad2deg(el)
+        arr['ipp_lat'] = np.rad2deg(ipp_lat)
+        arr['ipp_lon'] = np.rad2deg(ipp_lon)
+        arr['tec'] = columns['tec']
+        return arr
+
 
 class LoaderRinex(Loader):
     
-    def __init__(self, rinex_path:Path, nav_path:Path):
-        super().__init__()
+    def __init__(self, rinex_path:Path, nav_path:Path, cache_dir:Path=None,
+                 manifest=None, day:datetime=None):
+        """
+        :param rinex_path: folder with RINEX 2/3 observation files, one per site
+        :param nav_path: RINEX 2/3 GPS navigation file
+        :param cache_dir: folder for persistent cache of parsed data
+        :param manifest: see Loader
+        :param day: see Loader
+        """
+        super().__init__(cache_dir=cache_dir, manifest=manifest, day=day)
         self.rinex_path = rinex_path
         self.nav_path = nav_path
-        self.o_regx = re.compile((r'.[1-9][1-9]o'))
+        self.nav = None
+        self.site_files = {}
 
     def __is_ofile(self, file:Path)->bool:
-        is_ofile = False
-        is_ofile = is_ofile or bool(self.o_regx.match(file[-4:])) 
-        is_ofile = is_ofile or file.endswith('.rnx')
-        is_ofile = is_ofile or file.endswith('.RNX')
-        return is_ofile
+        return rinex.is_obs_file(file)
         
     def get_files(self)->dict[str,Path]:
         result = dict()
-        for subdir, _, files in os.walk(self.rootdir):
+        if self.manifest is not None:
+            for site, files in self.manifest.select('rinex', day=self.day).items():
+                if len(files) > 1:
+                    raise ValueError(f'Duplicated files {files} for {site}')
+                result[site] = files[0]
+            return result
+        for subdir, _, files in os.walk(self.rinex_path):
             for filename in files:
                 filepath = Path(subdir) / filename
                 if not self.__is_ofile(filename):
                     warn(f'{filepath} is not observation file')
                     continue
-                site = filename[:4]
+                site = filename[:4].lower()
                 if site in result:
                     msg = f'Duplicated file {filename}, was {result[site]}'
                     raise ValueError(msg)
                 result[site] = filepath
         return result
-    
+
+    def load_nav(self)->dict[str,np.array]:
+        if self.nav is None:
+            self.nav = rinex.read_nav(self.nav_path)
+        return self.nav
+
+    def nav_item(self)->str:
+        """
+        Cache item of parsed station: satellite positions depend on
+        navigation file, so its path, size and mtime are part of the key,
+        as well as RINEX_CACHE_VERSION
+        """
+        stat = os.stat(self.nav_path)
+        nav = Path(self.nav_path).resolve()
+        return f'v{RINEX_CACHE_VERSION}:nav:{nav}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    def generate_sites(self, sites:list[str]=[]):
+        self.site_files = self.get_files()
+        print(f'Collected {len(self.site_files)} sites')
+        # parsed once here, workers receive ephemerides with the loader
+        self.load_nav()
+        self.not_found_sites = sites[:]
+        for site in self.site_files:
+            if sites and not site in sites:
+                continue
+            self.not_found_sites.remove(site)
+            yield site
+
+    def generate_data(self, sites:list[str]=[]):
+        for site in self.generate_sites(sites):
+            st = time.time()
+            count = 0
+            for data, data_id in self.load_site(site):
+                count += 1
+                yield data, data_id
+            print(f'{site} contribute {count} files, takes {time.time() - st}')
+
+    def generate_data_pool(self, sites:list[str]=[], nworkers:int=1, 
+                           max_inflight:int=0, preprocess=None, 
+                           shared:bool=True):
+        """
+        Processes stations in worker processes, see generate_pool for 
+        other parameters
+        """
+        tasks = self.generate_sites(sites)
+        yield from self.generate_pool(tasks, nworkers, max_inflight, 
+                                      preprocess, shared)
+
+    def load_task(self, task:str, preprocess=None)->list[tuple[any,str]]:
+        return self.load_site(task, preprocess)
+
+    def task_size(self, task:str)->int:
+        # every observation record takes more than 16 bytes
+        return os.stat(self.site_files[task]).st_size // 16 + 1
+
+    def load_site(self, site:str, preprocess=None)->list[tuple[any,str]]:
+        """
+        :param preprocess: callable (data, data_id), see LoaderTxt.load_batch
+        :return: (data, sat_site) for every GPS satellite of the station
+        """
+        obs_path = self.site_files[site]
+        try:
+            if self.cache is not None:
+                data = self.cache.load(obs_path, self.read_station, 
+                                       item=self.nav_item())
+            else:
+                data = self.read_station(obs_path)
+        except Exception as e:
+            print(f'{obs_path} not processed. Reason: {e}')
+            return []
+        result = []
+        sats, starts = np.unique(data['sat'], return_index=True)
+        bounds = list(starts[1:]) + [len(data)]
+        for sat, start, fin in zip(sats, starts, bounds):
+            sat_data = self.to_loader_dtype(data[start:fin])
+            data_id = str(sat) + '_' + site
+            if preprocess is not None:
+                sat_data = preprocess(sat_data, data_id)
+                if sat_data is None:
+                    continue
+            result.append((sat_data, data_id))
+        return result
+
+    def read_station(self, obs_path:Path)->np.array:
+        """
+        Computes elevation, IPP and phase TEC for all epochs of observation
+        file at once. Satellite positions are evaluated from broadcast 
+        ephemerides at GPS time of receiver time tags, datetime is UTC.
+        :return: array with DAT_DTYPE fields and 'sat', sorted by sat and time
+        """
+        obs = rinex.read_obs(obs_path)
+        if obs['xyz'] is None:
+            raise ValueError(f'No APPROX POSITION XYZ in {obs_path}')
+        nav = self.load_nav()
+        t = rinex.gps_seconds(obs['gps_time'])
+        index = rinex.select_ephemeris(nav, obs['sat'], t)
+        sat_xyz = rinex.satellite_xyz(nav, index, t)
+        az, el = rinex.azimuth_elevation(obs['xyz'], sat_xyz)
+        slat, slon, _ = rinex.xyz2geodetic(obs['xyz'])
+        ipp_lat, ipp_lon = sub_ionospheric(slat, slon, HM, az, el)
+
+        arr = np.empty(t.shape, DAT_DTYPE + [('sat', 'U3')])
+        arr['datetime'] = obs['time']
+        arr['el'] = np.rad2deg(el)
+        arr['ipp_lat'] = np.rad2deg(ipp_lat)
+        arr['ipp_lon'] = np.rad2deg(ipp_lon)
+        arr['tec'] = rinex.phase_tec(obs['L1'], obs['L2'])
+        arr['sat'] = obs['sat']
+        return arr[np.lexsort((arr['datetime'], arr['sat']))]
@@ -0,0 +1,283 @@
+import os
+import json
+import hashlib
+import time
+import h5py
+import numpy as np
+
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from mosgim.data import rinex
+from mosgim.data.cache import ParsedCache
+from mosgim.data.loader import parse_dat
+
+# 2: RINEX times are UTC instead of GPS time
+MANIFEST_VERSION = 2
+# extensions of indexed files, other files are ignored
+DAT_EXT = '.dat'
+HDF_EXT = '.h5'
+
+
+class Manifest():
+    """
+    Persistent json index of data folder. For every data file it keeps size,
+    mtime and per-site summary: number of rows, time coverage and station
+    coordinates (degrees, None if file has no them). Loaders given manifest
+    select sites, days and files from the index and do not walk data folder.
+    Only new or changed files are read on update.
+    """
+
+    def __init__(self, path:Path, root_dir:Path, cache_dir:Path=None):
+        """
+        :param path: json file of the index, created on first save
+        :param root_dir: data folder: site subfolders with *.dat, hdf files
+            or RINEX observation files
+        :param cache_dir: ParsedCache folder, parsed *.dat files are put
+            there while indexing
+        """
+        self.path = Path(path)
+        self.root_dir = Path(root_dir)
+        self.cache = ParsedCache(cache_dir) if cache_dir else None
+        self.files = {}
+        self.load()
+
+    @classmethod
+    def for_folder(cls, manifest_dir:Path, root_dir:Path, 
+                   cache_dir:Path=None)->'Manifest':
+        """
+        Manifest of root_dir kept in manifest_dir, name is derived from
+        root_dir path, so one folder serves several data folders (e.g. days)
+        """
+        os.makedirs(manifest_dir, exist_ok=True)
+        source = str(Path(root_dir).resolve())
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return cls(Path(manifest_dir) / f'manifest_{name}.json', root_dir,
+                   cache_dir)
+
+    @property
+    def exists(self)->bool:
+        return self.path.exists()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as f:
+            content = json.load(f)
+        if content.get('version') != MANIFEST_VERSION:
+            print(f'{self.path} has old version, will be rebuilt')
+            return
+        if Path(content['root_dir']) != self.root_dir:
+            print(f'{self.path} indexes {content["root_dir"]}, will be rebuilt')
+            return
+        self.files = content['files']
+
+    def save(self):
+        content = dict(version=MANIFEST_VERSION,
+                       root_dir=str(self.root_dir),
+                       files=self.files)
+        # readers could load manifest while it is updated, replace is atomic
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(content, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def walk(self)->list[Path]:
+        """
+        The only place where data folder is walked
+        """
+        if self.root_dir.is_file():
+            return [self.root_dir]
+        result = []
+        for subdir, _, files in os.walk(self.root_dir):
+            for filename in files:
+                if self.file_kind(filename) is not None:
+                    result.append(Path(subdir) / filename)
+        return result
+
+    @staticmethod
+    def file_kind(filename:str)->str|None:
+        if filename.endswith(DAT_EXT):
+            return 'dat'
+        if filename.endswith(HDF_EXT):
+            return 'hdf'
+        if rinex.is_obs_file(filename):
+            return 'rinex'
+        return None
+
+    def update(self, paths:list[Path]=None, save:bool=True)->tuple[int,int]:
+        """
+        Indexes new and changed files, forgets removed ones
+        :param paths: files to check, e.g. just downloaded; whole data folder
+            is walked if None
+        :return: number of (re)indexed and removed files
+        """
+        st = time.time()
+        full = paths is None
+        if full:
+            paths = self.walk()
+        seen = set()
+        changed = 0
+        for filepath in paths:
+            key = self.key(filepath)
+            seen.add(key)
+            if not Path(filepath).exists():
+                continue
+            stat = os.stat(filepath)
+            entry = self.files.get(key)
+            if entry is not None and entry['size'] == stat.st_size and \
+                    entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            try:
+                self.files[key] = self.index_file(filepath, stat)
+                changed += 1
+            except Exception as e:
+                print(f'{filepath} not indexed. Reason: {e}')
+                self.files.pop(key, None)
+        if full:
+            removed = [k for k in self.files if not k in seen]
+        else:
+            removed = [k for k in seen 
+                       if k in self.files and not (self.root_dir / k).exists()]
+        for key in removed:
+            del self.files[key]
+        if save:
+            self.save()
+        print(f'Indexed {changed} files, removed {len(removed)}, '
+              f'takes {time.time() - st}')
+        return changed, len(removed)
+
+    def key(self, filepath:Path)->str:
+        """
+        Path relative to root_dir, files outside it (explicitly given ones,
+        root_dir being the file itself) are kept by absolute path, 
+        root_dir / key is the file in both cases
+        """
+        filepath = Path(filepath)
+        for path, root in ((filepath, self.root_dir), 
+                           (filepath.resolve(), self.root_dir.resolve())):
+            try:
+                key = path.relative_to(root).as_posix()
+            except ValueError:
+                continue
+            if key != '.':
+                return key
+        return filepath.resolve().as_posix()
+
+    def index_file(self, filepath:Path, stat:os.stat_result)->dict:
+        kind = self.file_kind(Path(filepath).name)
+        if kind == 'dat':
+            sites = self.__index_dat(filepath)
+        elif kind == 'hdf':
+            sites = self.__index_hdf(filepath)
+        else:
+            sites = self.__index_rinex(filepath)
+        return dict(kind=kind, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                    sites=sites)
+
+    def __index_dat(self, filepath:Path)->dict:
+        site = Path(filepath).name[:4]
+        if site != Path(filepath).parent.name[-4:]:
+            raise ValueError(f'{site} in {Path(filepath).parent}. wrong site name')
+        if self.cache is not None:
+            data = self.cache.load(filepath, parse_dat)
+        else:
+            data = parse_dat(filepath)
+        return {site: site_summary(data['datetime'], len(data))}
+
+    def __index_hdf(self, filepath:Path)->dict:
+        sites = {}
+        with h5py.File(filepath, 'r') as hdf_file:
+            for site in hdf_file:
+                group = hdf_file[site]
+                rows = 0
+                bounds = []
+                for sat in group:
+                    ts = group[sat]['timestamp']
+                    rows += ts.shape[0]
+                    if ts.shape[0] > 0:
+                        # timestamps are sorted, only ends are read
+                        bounds += [ts[0], ts[-1]]
+                times = np.round(bounds).astype('int64').astype('datetime64[s]')
+                sites[site] = site_summary(times, rows,
+                                           np.rad2deg(group.attrs['lat']),
+                                           np.rad2deg(group.attrs['lon']))
+        return sites
+
+    def __index_rinex(self, filepath:Path)->dict:
+        site = Path(filepath).name[:4].lower()
+        obs = rinex.read_obs(filepath)
+        lat, lon = None, None
+        if obs['xyz'] is not None:
+            lat, lon, _ = rinex.xyz2geodetic(obs['xyz'])
+            lat, lon = np.rad2deg(lat), np.rad2deg(lon)
+        return {site: site_summary(obs['time'], len(obs['time']), lat, lon)}
+
+    def sites(self, kind:str=None)->dict[str,dict]:
+        """
+        Summary of every site over all its files
+        :param kind: 'dat', 'hdf' or 'rinex', all files if None
+        """
+        result = {}
+        for key, entry in sorted(self.files.items()):
+            if kind and entry['kind'] != kind:
+                continue
+            for site, summary in entry['sites'].items():
+                if not site in result:
+                    result[site] = dict(summary, files=[], size=0)
+                    result[site]['rows'] = 0
+                total = result[site]
+                total['files'].append(self.root_dir / key)
+                total['size'] += entry['size']
+                total['rows'] += summary['rows']
+                for bound, pick in [('start', min), ('end', max)]:
+                    values = [v for v in [total[bound], summary[bound]] if v]
+                    total[bound] = pick(values) if values else None
+                if total['lat'] is None:
+                    total['lat'], total['lon'] = summary['lat'], summary['lon']
+        return result
+
+    def select(self, kind:str, sites:list[str]=[],
+               day:datetime=None)->defaultdict[str,list[Path]]:
+        """
+        Files of the kind per site, sorted
+        :param sites: selected sites, all if empty
+        :param day: only files with data in this UTC day, all if None
+        """
+        result = defaultdict(list)
+        if day is not None:
+            day_start = str(np.datetime64(day, 'D').astype('datetime64[s]'))
+            day_end = str(np.datetime64(day, 'D').astype('datetime64[s]') +
+                          np.timedelta64(86399, 's'))
+        for key, entry in sorted(self.files.items()):
+            if entry['kind'] != kind:
+                continue
+            for site, summary in entry['sites'].items():
+                if sites and not site in sites:
+                    continue
+                if day is not None and (summary['start'] is None or
+                        summary['end'] < day_start or
+                        summary['start'] > day_end):
+                    continue
+                result[site].append(self.root_dir / key)
+        return result
+
+    def rows(self, filepath:Path, site:str)->int:
+        """
+        Number of rows of the site in indexed file
+        """
+        return self.files[self.key(filepath)]['sites'][site]['rows']
+
+
+def site_summary(times:np.array, rows:int, lat:float=None,
+                 lon:float=None)->dict:
+    """
+    :param times: datetime64 of rows or just bounds of coverage
+    """
+    start, end = None, None
+    if len(times) > 0:
+        start, end = str(np.min(times)), str(np.max(times))
+    lat = None if lat is None else float(lat)
+    lon = None if lon is None else float(lon)
+    return dict(rows=int(rows), start=start, end=end, lat=lat, lon=lon)
@@ -0,0 +1,422 @@
+import re
+import numpy as np
+
+from numpy import sin, cos, sqrt, arctan2, arcsin
+from pathlib import Path
+
+
+# GPS constants, IS-GPS-200
+GM = 3.986005e14
+OMEGA_E = 7.2921151467e-5
+F1 = 1575.42e6
+F2 = 1227.60e6
+C = 299792458.
+# TEC [TECU] from geometry free phase combination L1 * lambda1 - L2 * lambda2
+TECU_PER_METER = 1. / (40.308e16 * (1. / F2**2 - 1. / F1**2))
+GPS_EPOCH = np.datetime64('1980-01-06T00:00:00', 's')
+WEEK_SECONDS = 604800
+# UTC dates of leap seconds and GPS - UTC after them, no leap second is 
+# announced after 2017
+LEAP_SECONDS = [('1981-07-01', 1), ('1982-07-01', 2), ('1983-07-01', 3),
+                ('1985-07-01', 4), ('1988-01-01', 5), ('1990-01-01', 6),
+                ('1991-01-01', 7), ('1992-07-01', 8), ('1993-07-01', 9),
+                ('1994-07-01', 10), ('1996-01-01', 11), ('1997-07-01', 12),
+                ('1999-01-01', 13), ('2006-01-01', 14), ('2009-01-01', 15),
+                ('2012-07-01', 16), ('2015-07-01', 17), ('2017-01-01', 18)]
+# offsets of receiver time systems (TIME OF FIRST OBS) from GPS time, 
+# GLONASS time is UTC + 3h and is handled separately
+TIME_SYSTEM_OFFSETS = {'GPS': 0, 'GAL': 0, 'QZS': 0, 'IRN': 0, 'BDT': 14}
+
+# WGS84
+WGS84_A = 6378137.
+WGS84_E2 = 6.69437999014e-3
+
+# phase observation types in order of preference
+L1_TYPES = ['L1', 'L1C', 'L1W', 'L1P', 'L1X', 'L1S', 'L1L']
+L2_TYPES = ['L2', 'L2W', 'L2P', 'L2C', 'L2L', 'L2X', 'L2S', 'L2D']
+
+# RINEX 3 navigation record length in lines for every system
+NAV_RECORD_LINES = {'G': 8, 'E': 8, 'C': 8, 'J': 8, 'I': 8, 'R': 4, 'S': 4}
+NAV_FIELDS = ['af0', 'af1', 'af2',
+              'iode', 'crs', 'delta_n', 'm0',
+              'cuc', 'e', 'cus', 'sqrt_a',
+              'toe', 'cic', 'omega0', 'cis',
+              'i0', 'crc', 'omega', 'omega_dot',
+              'idot', 'codes', 'week', 'l2p',
+              'accuracy', 'health', 'tgd', 'iodc']
+
+# RINEX 2 observation file extension, e.g. .17o
+OBS_V2_REGEX = re.compile(r'.[0-9][0-9][oO]')
+
+
+def is_obs_file(filename:str)->bool:
+    """
+    RINEX 2 (*.yyo) or RINEX 3 (*.rnx) observation file
+    """
+    is_ofile = bool(OBS_V2_REGEX.match(filename[-4:]))
+    is_ofile = is_ofile or filename.endswith('.rnx')
+    is_ofile = is_ofile or filename.endswith('.RNX')
+    return is_ofile
+
+
+def read_lines(path:Path)->tuple[list[str],list[str]]:
+    """
+    :return: header lines and data lines of RINEX file
+    """
+    with open(path, 'r', encoding='latin-1') as f:
+        lines = f.read().splitlines()
+    for i, line in enumerate(lines):
+        if line[60:73] == 'END OF HEADER':
+            return lines[:i], lines[i + 1:]
+    raise ValueError(f'No END OF HEADER in {path}')
+
+
+def parse_fields(records:list[str], columns:list[int], width:int=16)->np.array:
+    """
+    Extracts fixed width float fields from all records at once
+    :param records: text records, field k starts at width * k
+    :param columns: numbers of fields to extract
+    :return: array (len(records), len(columns)), blank fields are nan
+    """
+    result = np.full((len(records), len(columns)), np.nan)
+    if not records:
+        return result
+    size = (max(columns) + 1) * width
+    raw = np.array([r.encode('latin-1') for r in records], dtype=f'S{size}')
+    chars = raw.view(np.uint8).reshape(len(records), size)
+    for i, k in enumerate(columns):
+        # value takes 14 chars, then loss of lock and signal strength flags
+        field = np.ascontiguousarray(chars[:, k * width: k * width + 14])
+        field = np.char.strip(field.view('S14').ravel())
+        blank = field == b''
+        field[blank] = b'nan'
+        result[:, i] = field.astype(float)
+    return result
+
+
+def sat_id(code:str)->str:
+    """
+    Normalizes satellite code, blank system in RINEX 2 means GPS
+    """
+    system = code[0] if code[0] != ' ' else 'G'
+    return system + code[1:].replace(' ', '0')
+
+
+def to_datetime64(year:int, month:int, day:int, hour:int, minute:int,
+                  sec:float)->np.datetime64:
+    if year < 100:
+        year += 2000 if year < 80 else 1900
+    iso = f'{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:00'
+    return np.datetime64(iso, 's') + np.timedelta64(int(round(sec)), 's')
+
+
+def leap_seconds(time:np.array, utc:bool=False)->np.array:
+    """
+    GPS - UTC in seconds, see LEAP_SECONDS
+    :param time: epochs in GPS time or in UTC if utc
+    """
+    dates, leaps = zip(*LEAP_SECONDS)
+    starts = np.array(dates, dtype='datetime64[s]')
+    if not utc:
+        # leap second starts when UTC reaches the date, GPS is ahead by leap
+        starts = starts + np.array(leaps)
+    count = np.searchsorted(starts, time, side='right')
+    return np.concatenate([[0], leaps])[count]
+
+
+def to_gps_time(time:np.array, system:str)->np.array:
+    """
+    Receiver time tags in time system of the file to GPS time
+    """
+    if system == 'UTC':
+        utc = time
+    elif system == 'GLO':
+        utc = time - np.timedelta64(3, 'h')
+    elif system in TIME_SYSTEM_OFFSETS:
+        return time + np.timedelta64(TIME_SYSTEM_OFFSETS[system], 's')
+    else:
+        raise ValueError(f'Unknown time system {system}')
+    return utc + leap_seconds(utc, utc=True).astype('timedelta64[s]')
+
+
+def gps_to_utc(gps_time:np.array)->np.array:
+    return gps_time - leap_seconds(gps_time).astype('timedelta64[s]')
+
+
+def read_obs_header(header:list[str])->dict:
+    result = {'version': float(header[0][:9]), 'types': {}, 'xyz': None,
+              'time_system': 'GPS'}
+    pending = None
+    for line in header:
+        label = line[60:].strip()
+        if label == 'TIME OF FIRST OBS':
+            # blank means GPS for GPS and mixed files
+            result['time_system'] = line[48:51].strip() or 'GPS'
+        elif label == 'APPROX POSITION XYZ':
+            result['xyz'] = np.array([float(v) for v in line[:42].split()])
+        elif label == '# / TYPES OF OBSERV':
+            # RINEX 2, common types for all systems
+            if line[:6].strip():
+                ntypes = int(line[:6])
+                types = []
+            types += line[6:60].split()
+            result['types'] = {sys: types for sys in 'GRESJCI'}
+            result['ntypes'] = ntypes
+        elif label == 'SYS / # / OBS TYPES':
+            if line[0] != ' ':
+                pending = line[0]
+                result['types'][pending] = []
+            result['types'][pending] += line[7:60].split()
+    return result
+
+
+def read_obs(path:Path)->dict:
+    """
+    Reads L1 and L2 phase of GPS satellites from RINEX 2 or 3 observation
+    file. Epoch headers are walked line by line, observation fields of all
+    records are parsed at once.
+    :return: dict with header info, 'time' (UTC, datetime64[s]), 'gps_time'
+        (GPS time of receiver time tags), 'sat', 'L1', 'L2' per observation 
+        record
+    """
+    header, lines = read_lines(path)
+    info = read_obs_header(header)
+    if info['version'] >= 3:
+        times, sats, records = _split_obs_v3(lines)
+    else:
+        times, sats, records = _split_obs_v2(lines, info['ntypes'])
+    types = info['types'].get('G', [])
+    columns = []
+    for candidates in [L1_TYPES, L2_TYPES]:
+        found = [t for t in candidates if t in types]
+        if not found:
+            raise ValueError(f'No {candidates[0]} phase in {path}')
+        columns.append(types.index(found[0]))
+    sats = np.array(sats)
+    is_gps = np.char.startswith(sats, 'G')
+    records = [r for r, gps in zip(records, is_gps) if gps]
+    values = parse_fields(records, columns)
+    times = np.array(times, dtype='datetime64[s]')[is_gps]
+    gps_time = to_gps_time(times, info['time_system'])
+    info.update({'time': gps_to_utc(gps_time),
+                 'gps_time': gps_time,
+                 'sat': sats[is_gps],
+                 'L1': values[:, 0],
+                 'L2': values[:, 1]})
+    return info
+
+
+def _split_obs_v2(lines:list[str], ntypes:int)->tuple[list,list,list[str]]:
+    nlines = (ntypes + 4) // 5
+    times, sats, records = [], [], []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        flag = int(line[28:29].strip() or 0)
+        nsat = int(line[29:32])
+        if 1 < flag < 6:
+            # special event, nsat is number of header lines that follow
+            i += nsat + 1
+            continue
+        epoch = to_datetime64(int(line[1:3]), int(line[4:6]), int(line[7:9]),
+                              int(line[10:12]), int(line[13:15]),
+                              float(line[15:26]))
+        codes = line[32:68]
+        i += 1
+        while len(codes) < 3 * nsat:
+            codes += lines[i][32:68]
+            i += 1
+        if flag == 6:
+            # cycle slip records are laid out as observation records, but
+            # hold slips instead of phase
+            i += nsat * nlines
+            continue
+        for k in range(nsat):
+            chunk = lines[i: i + nlines]
+            records.append(''.join(l.ljust(80) for l in chunk))
+            sats.append(sat_id(codes[3 * k: 3 * k + 3]))
+            times.append(epoch)
+            i += nlines
+    return times, sats, records
+
+
+def _split_obs_v3(lines:list[str])->tuple[list,list,list[str]]:
+    times, sats, records = [], [], []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.startswith('>'):
+            i += 1
+            continue
+        flag = int(line[31:32].strip() or 0)
+        nsat = int(line[32:35])
+        if flag > 1:
+            # special event lines or cycle slip records (flag 6), one line
+            # per satellite
+            i += nsat + 1
+            continue
+        epoch = to_datetime64(int(line[2:6]), int(line[7:9]), int(line[10:12]),
+                              int(line[13:15]), int(line[16:18]),
+                              float(line[18:29]))
+        chunk = lines[i + 1: i + 1 + nsat]
+        records += [l[3:] for l in chunk]
+        sats += [sat_id(l[:3]) for l in chunk]
+        times += [epoch] * len(chunk)
+        i += nsat + 1
+    return times, sats, records
+
+
+def read_nav(path:Path)->dict[str,np.array]:
+    """
+    Reads GPS broadcast ephemerides from RINEX 2 or 3 navigation file
+    :return: dict of NAV_FIELDS arrays plus 'sat' and 'toc', one per record
+    """
+    header, lines = read_lines(path)
+    version = float(header[0][:9])
+    sats, tocs, values = [], [], []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        if version >= 3:
+            system = line[0]
+            nlines = NAV_RECORD_LINES.get(system, 8)
+            if system != 'G':
+                i += nlines
+                continue
+            sat = sat_id(line[:3])
+            toc = to_datetime64(int(line[4:8]), int(line[9:11]), int(line[12:14]),
+                                int(line[15:17]), int(line[18:20]),
+                                float(line[21:23]))
+            first, shift = 23, 4
+        else:
+            nlines = 8
+            sat = sat_id('G' + line[:2])
+            toc = to_datetime64(int(line[3:5]), int(line[6:8]), int(line[9:11]),
+                                int(line[12:14]), int(line[15:17]),
+                                float(line[17:22]))
+            first, shift = 22, 3
+        record = [line[first + 19 * k: first + 19 * (k + 1)] for k in range(3)]
+        for orbit in lines[i + 1: i + nlines]:
+            orbit = orbit.ljust(shift + 4 * 19)
+            record += [orbit[shift + 19 * k: shift + 19 * (k + 1)] for k in range(4)]
+        record = record[:len(NAV_FIELDS)]
+        values.append([_nav_float(v) for v in record])
+        sats.append(sat)
+        tocs.append(toc)
+        i += nlines
+    values = np.array(values, dtype=float).reshape(-1, len(NAV_FIELDS))
+    nav = {f: values[:, k] for k, f in enumerate(NAV_FIELDS)}
+    nav['sat'] = np.array(sats)
+    nav['toc'] = np.array(tocs, dtype='datetime64[s]')
+    return nav
+
+
+def _nav_float(value:str)->float:
+    value = value.strip().replace('D', 'E').replace('d', 'e')
+    return float(value) if value else np.nan
+
+
+def gps_seconds(time:np.array)->np.array:
+    """
+    Seconds since GPS epoch, receiver time tags are GPS time
+    """
+    return (time - GPS_EPOCH).astype('timedelta64[s]').astype(float)
+
+
+def select_ephemeris(nav:dict, sat:np.array, t:np.array)->np.array:
+    """
+    For every (sat, t) finds index of ephemeris of the same satellite with
+    closest toe, -1 if satellite has no ephemeris
+    """
+    toe = nav['week'] * WEEK_SECONDS + nav['toe']
+    index = np.full(len(t), -1)
+    for name in np.unique(sat):
+        candidates = np.flatnonzero(nav['sat'] == name)
+        if len(candidates) == 0:
+            continue
+        candidates = candidates[np.argsort(toe[candidates])]
+        rows = sat == name
+        pos = np.searchsorted(toe[candidates], t[rows])
+        left = np.clip(pos - 1, 0, len(candidates) - 1)
+        right = np.clip(pos, 0, len(candidates) - 1)
+        dist_left = np.abs(t[rows] - toe[candidates[left]])
+        dist_right = np.abs(t[rows] - toe[candidates[right]])
+        index[rows] = np.where(dist_left < dist_right, 
+                               candidates[left], candidates[right])
+    return index
+
+
+def satellite_xyz(nav:dict, index:np.array, t:np.array)->np.array:
+    """
+    ECEF satellite positions from broadcast ephemerides for all epochs at
+    once, IS-GPS-200 algorithm
+    :param index: ephemeris for every epoch, see select_ephemeris
+    :param t: GPS seconds of every epoch
+    :return: array (len(t), 3), nan where no ephemeris
+    """
+    eph = {f: nav[f][np.maximum(index, 0)] for f in NAV_FIELDS}
+    a = eph['sqrt_a'] ** 2
+    tk = t - (eph['week'] * WEEK_SECONDS + eph['toe'])
+    n = sqrt(GM / a ** 3) + eph['delta_n']
+    m = eph['m0'] + n * tk
+    e = eph['e']
+    ecc = m.copy()
+    for _ in range(10):
+        ecc = m + e * sin(ecc)
+    nu = arctan2(sqrt(1 - e ** 2) * sin(ecc), cos(ecc) - e)
+    phi = nu + eph['omega']
+    sin2, cos2 = sin(2 * phi), cos(2 * phi)
+    u = phi + eph['cus'] * sin2 + eph['cuc'] * cos2
+    r = a * (1 - e * cos(ecc)) + eph['crs'] * sin2 + eph['crc'] * cos2
+    inc = eph['i0'] + eph['idot'] * tk + eph['cis'] * sin2 + eph['cic'] * cos2
+    x_orb, y_orb = r * cos(u), r * sin(u)
+    node = eph['omega0'] + (eph['omega_dot'] - OMEGA_E) * tk - OMEGA_E * eph['toe']
+    xyz = np.column_stack([x_orb * cos(node) - y_orb * cos(inc) * sin(node),
+                           x_orb * sin(node) + y_orb * cos(inc) * cos(node),
+                           y_orb * sin(inc)])
+    xyz[index < 0] = np.nan
+    return xyz
+
+
+def xyz2geodetic(xyz:np.array)->tuple[float,float,float]:
+    """
+    :return: WGS84 latitude, longitude in radians and height in meters
+    """
+    x, y, z = xyz
+    lon = arctan2(y, x)
+    p = sqrt(x ** 2 + y ** 2)
+    lat = arctan2(z, p * (1 - WGS84_E2))
+    for _ in range(5):
+        n = WGS84_A / sqrt(1 - WGS84_E2 * sin(lat) ** 2)
+        h = p / cos(lat) - n
+        lat = arctan2(z, p * (1 - WGS84_E2 * n / (n + h)))
+    return lat, lon, h
+
+
+def azimuth_elevation(site_xyz:np.array, sat_xyz:np.array)->tuple[np.array,np.array]:
+    """
+    :return: azimuth and elevation of satellites from the site in radians
+    """
+    lat, lon, _ = xyz2geodetic(site_xyz)
+    d = sat_xyz - site_xyz
+    east = -sin(lon) * d[:, 0] + cos(lon) * d[:, 1]
+    north = (-sin(lat) * cos(lon) * d[:, 0] - sin(lat) * sin(lon) * d[:, 1]
+             + cos(lat) * d[:, 2])
+    up = (cos(lat) * cos(lon) * d[:, 0] + cos(lat) * sin(lon) * d[:, 1]
+          + sin(lat) * d[:, 2])
+    az = np.mod(arctan2(east, north), 2 * np.pi)
+    el = arcsin(up / sqrt(east ** 2 + north ** 2 + up ** 2))
+    return az, el
+
+
+def phase_tec(l1:np.array, l2:np.array)->np.array:
+    """
+    Relative slant TEC in TECU from L1, L2 phase in cycles
+    """
+    return (l1 * C / F1 - l2 * C / F2) * TECU_PER_METER
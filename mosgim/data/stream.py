@@ -0,0 +1,134 @@
+import os
+import time
+import numpy as np
+
+from pathlib import Path
+
+from mosgim.data.loader import LoaderTxt, parse_dat
+from mosgim.data.tec_prepare import prepare_arcs
+from mosgim.data.arcs import ArcStore
+
+
+class StreamIngestor():
+    """
+    Long-running ingestion of txt site files that grow during the day.
+    Every poll reads only bytes appended since the previous one, rows are
+    kept in memory per file and arcs are re-extracted only for files that
+    got new rows, when prepared data are requested.
+    """
+
+    def __init__(self, loader:LoaderTxt, sites:list[str]=[], window:int=2*86400):
+        """
+        :param loader: loader, defines data folder and DTYPE
+        :param sites: sites to ingest, all if empty
+        :param window: rows older than window seconds before the latest
+            row of the file are dropped
+        """
+        self.loader = loader
+        self.sites = sites
+        self.window = np.timedelta64(window, 's')
+        self.offsets = {}
+        self.rows = {}
+        self.arcs = {}
+        self.dirty = set()
+
+    def poll(self)->int:
+        """
+        Picks up new or grown files, parses only complete new lines
+        :return: number of new rows
+        """
+        count = 0
+        files = self.loader.get_files(self.loader.root_dir)
+        for site, site_files in files.items():
+            if self.sites and not site in self.sites:
+                continue
+            for filepath in site_files:
+                try:
+                    count += self.__read_new_rows(filepath)
+                except Exception as e:
+                    print(f'{filepath} not processed. Reason: {e}')
+        return count
+
+    def __read_new_rows(self, filepath:Path)->int:
+        size = os.stat(filepath).st_size
+        offset = self.offsets.get(filepath, 0)
+        if size < offset:
+            # file was rewritten, read it from the beginning
+            offset = 0
+            self.rows.pop(filepath, None)
+        if size == offset:
+            return 0
+        with open(filepath, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(size - offset)
+        # last line could be incomplete, it is read on next poll
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        self.offsets[filepath] = offset + end
+        lines = chunk[:end].decode('utf-8').splitlines()
+        new_rows = parse_dat(lines)
+        if new_rows.shape[0] == 0:
+            return 0
+        rows = self.rows.get(filepath)
+        rows = new_rows if rows is None else np.concatenate([rows, new_rows])
+        latest = rows['datetime'].max()
+        self.rows[filepath] = rows[rows['datetime'] > latest - self.window]
+        self.dirty.add(filepath)
+        return new_rows.shape[0]
+
+    def days(self)->list[np.datetime64]:
+        """
+        UTC days present in ingested rows
+        """
+        days = set()
+        for rows in self.rows.values():
+            days.update(np.unique(rows['datetime'].astype('datetime64[D]')))
+        return sorted(days)
+
+    def prepared(self, day:np.datetime64=None)->ArcStore:
+        """
+        Arcs of all files for the day, same as process_data output
+        :param day: UTC day, latest ingested day if None
+        """
+        if day is None:
+            days = self.days()
+            if not days:
+                return ArcStore()
+            day = days[-1]
+        day = np.datetime64(day, 'D')
+        for filepath in self.dirty:
+            for key in [k for k in self.arcs if k[0] == filepath]:
+                del self.arcs[key]
+        self.dirty = set()
+        all_data = ArcStore()
+        for filepath, rows in self.rows.items():
+            key = (filepath, day)
+            if not key in self.arcs:
+                rows = rows[rows['datetime'].astype('datetime64[D]') == day]
+                arcs = None
+                if rows.shape[0] > 0:
+                    arcs = prepare_arcs(self.loader.to_loader_dtype(rows),
+                                        filepath)
+                self.arcs[key] = arcs
+            if self.arcs[key] is None:
+                continue
+            all_data.extend(self.arcs[key])
+        return all_data
+
+    def run(self, interval:float=60., callback=None, every:float=3600.):
+        """
+        Polls data folder forever
+        :param interval: seconds between polls
+        :param callback: called with self every `every` seconds, e.g. to
+            build a map from prepared()
+        """
+        last_call = time.time()
+        while True:
+            st = time.time()
+            count = self.poll()
+            print(f'{count} new rows in {len(self.rows)} files, takes {time.time() - st}')
+            if callback is not None and time.time() - last_call >= every:
+                callback(self)
+                last_call = time.time()
+            time.sleep(max(interval - (time.time() - st), 0))
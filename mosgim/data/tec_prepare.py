@@ -1,9 +1,9 @@
+import time
 import numpy as np
 import concurrent.futures
 
 from numpy import deg2rad as rad
 from datetime import datetime
-from scipy.signal import savgol_filter
 from collections import defaultdict
 from enum import Enum
 from concurrent.futures import ProcessPoolExecutor
@@ -11,7 +11,10 @@ from pathlib import Path
 
 from mosgim.geo import geo2mag
 from mosgim.geo import geo2modip
+from mosgim.geo import preload_inclination
 from mosgim.utils.time_util import sec_of_day, sec_of_interval
+from mosgim.utils.shm import SharedColumns
+from mosgim.data.arcs import ArcStore, ArcChunks
 
 sites = ['019b', '7odm', 'ab02', 'ab06', 'ab09', 'ab11', 'ab12', 'ab13',
          'ab15', 'ab17', 'ab21', 'ab27', 'ab33', 'ab35', 'ab37', 'ab41',
@@ -52,6 +55,11 @@ sites = ['019b', '7odm', 'ab02', 'ab06', 'ab09', 'ab11', 'ab12', 'ab13',
 
 #sites = sites[22:28]
 
+# observation and reference fields of combined data, see arcs.ArcStore
+OBS_FIELDS = ['tec', 'time', 'lon', 'lat', 'el', 'iref']
+REF_FIELDS = ['rtime', 'rlon', 'rlat', 'rel']
+GEO_FIELDS = OBS_FIELDS + REF_FIELDS
+
 class DataSourceType(Enum):
     hdf = 'hdf'
     rinex = 'rinex'
@@ -74,32 +82,117 @@ class ProcessingType(Enum):
     def __str__(self):
         return self.value
 
-def process_data(data_generator)->defaultdict[str,list[any]]:
-    all_data = defaultdict(list)
-    count = 0
-    for data, data_id in data_generator:
-        if data.shape==():
-            print(f'No data for {data_id}')
-            continue
-        times = data['datetime'][:]
-        data_days = [datetime(d.year, d.month, d.day) for d in times]
-        if len(set(data_days)) != 1:
-            msg = f'{data_id} is not processed: multiple days presented '
-            msg += f'{set(data_days)}. Skip.'
-            print(msg)
-            continue
-        try:
-            prepared = process_intervals(data, maxgap=35., 
+
+MAG_FUNCTIONS = {MagneticCoordType.mdip: geo2modip, 
+                 MagneticCoordType.mag: geo2mag}
+
+
+def mag_fields(mtype:MagneticCoordType)->list[str]:
+    """
+    Fields of combined data computed for coordinate system
+    """
+    postf = str(mtype)
+    return ['colat_' + postf, 'mlt_' + postf, 'rcolat_' + postf, 'rmlt_' + postf]
+
+
+def mag_types_list(mag_types:list[MagneticCoordType]|None)->list[MagneticCoordType]:
+    if mag_types is None:
+        return list(MagneticCoordType)
+    return [MagneticCoordType(m) for m in mag_types]
+
+
+MAG_FIELDS = mag_fields(MagneticCoordType.mdip) + mag_fields(MagneticCoordType.mag)
+
+def prepare_arcs(data:np.array, data_id:any)->defaultdict[str,list[any]]|None:
+    """
+    Extracts arcs from data of single file, could run in loader workers.
+    Rows of file spanning several UTC days are split by day, arcs do not
+    cross midnight, so every arc belongs to single day
+    :return: prepared arcs or None if file is skipped, reason is printed
+    """
+    if data.shape==():
+        print(f'No data for {data_id}')
+        return None
+    row_days = data['datetime'].astype('datetime64[D]')
+    data_days = np.unique(row_days)
+    try:
+        if len(data_days) == 1:
+            return process_intervals(data, maxgap=35., 
+                                     maxjump=2., 
+                                     derivative=False)
+        result = defaultdict(list)
+        for day in data_days:
+            prepared = process_intervals(data[row_days == day], maxgap=35., 
                                          maxjump=2., 
                                          derivative=False)
-            count += len(prepared['dtec'])
-            for k in prepared:
-                all_data[k].extend(prepared[k])
-        except Exception as e:
-            print(f'{data_id} not processed. Reason: {e}')
+            for field, arcs in prepared.items():
+                result[field].extend(arcs)
+        return result
+    except Exception as e:
+        print(f'{data_id} not processed. Reason: {e}')
+        return None
+
+
+def arc_day(out:np.array)->np.datetime64:
+    """
+    UTC day of prepared arc, all its observations are within it
+    """
+    return out['datetime'][0].astype('datetime64[D]')
+
+
+def process_data(data_generator, day:datetime=None)->ArcStore:
+    """
+    :param data_generator: yields (data, data_id), data is either raw loader 
+        array or arcs already prepared with prepare_arcs
+    :param day: only arcs of this UTC day are kept, all if None
+    """
+    if day is not None:
+        day = np.datetime64(day, 'D')
+        stores = process_data_days(data_generator, days=[day])
+        return stores.get(day, ArcStore())
+    all_data = ArcStore()
+    for data, data_id in data_generator:
+        if isinstance(data, dict):
+            prepared = data
+        else:
+            prepared = prepare_arcs(data, data_id)
+        if prepared is None:
+            continue
+        all_data.extend(prepared)
     return all_data
 
 
+def process_data_days(data_generator, 
+                      days:list[datetime]=None)->dict[np.datetime64,ArcStore]:
+    """
+    Same as process_data, but arcs of every UTC day go to own store. Every
+    file is read and prepared once, even if it spans several days
+    :param days: only arcs of these days are kept, all if None
+    :return: stores by day, sorted
+    """
+    if days is not None:
+        days = set(np.datetime64(d, 'D') for d in days)
+    stores = {}
+    for data, data_id in data_generator:
+        if isinstance(data, dict):
+            prepared = data
+        else:
+            prepared = prepare_arcs(data, data_id)
+        if prepared is None:
+            continue
+        for dtec, out, ref in zip(prepared['dtec'], prepared['out'], 
+                                  prepared['ref']):
+            if len(out) == 0:
+                continue
+            day = arc_day(out)
+            if days is not None and not day in days:
+                continue
+            if not day in stores:
+                stores[day] = ArcStore()
+            stores[day].append(dtec, out, ref)
+    return dict(sorted(stores.items()))
+
+
 def get_continuos_intervals(data:dict, maxgap:int=30, maxjump:int=1)->tuple[bool,list[tuple[int,int]]]:
     return getContInt(data['sec_of_day'][:], 
                       data['tec'][:], 
@@ -109,24 +202,75 @@ def get_continuos_intervals(data:dict, maxgap:int=30, maxjump:int=1)->tuple[bool
 
 
 def getContInt(times:list[int], tec:float, lon:float, lat:float, el:float,  maxgap:int=30, maxjump:int=1)->tuple[bool,list[tuple[int,int]]]:
-    r = np.array(range(len(times)))
+    idx, starts, ends, _ = getContIntBatched(times, tec, lon, lat, el, 
+                                             [0, len(times)], 
+                                             maxgap=maxgap, maxjump=maxjump)
+    return idx, list(zip(starts.tolist(), ends.tolist()))
+
+
+def getContIntBatched(times:np.array, tec:np.array, lon:np.array, lat:np.array, 
+                      el:np.array, offsets:list[int], maxgap:int=30, 
+                      maxjump:int=1)->tuple[np.array,np.array,np.array,np.array]:
+    """
+    getContInt for many satellites stacked together, rows of k-th satellite 
+    are offsets[k]:offsets[k+1]. Valid samples are split where time gap 
+    exceeds maxgap, tec jump exceeds maxjump or satellite changes. 
+    :return: valid mask, first and last (inclusive) stacked index and 
+        satellite number of every interval
+    """
+    times = np.asarray(times)
+    tec = np.asarray(tec)
     idx = np.isfinite(tec) & np.isfinite(lon) & np.isfinite(lat) & np.isfinite(el) & (el > 10.)
-    r = r[idx]
-    intervals = []
+    r = np.flatnonzero(idx)
     if len(r) == 0:
-        return idx, intervals
-    beginning = r[0]
-    last = r[0]
-    last_time = times[last]
-    for i in r[1:]:
-        if abs(times[i] - last_time) > maxgap or abs(tec[i] - tec[last]) > maxjump:
-            intervals.append((beginning, last))
-            beginning = i
-        last = i
-        last_time = times[last]
-        if i == r[-1]:
-            intervals.append((beginning, last))
-    return idx, intervals
+        empty = np.array([], dtype=int)
+        return idx, empty, empty, empty
+    sat = np.searchsorted(offsets, r, side='right') - 1
+    cut = (np.abs(np.diff(times[r])) > maxgap) | (np.abs(np.diff(tec[r])) > maxjump)
+    cut = np.flatnonzero(cut | (np.diff(sat) != 0))
+    first = np.concatenate([[0], cut + 1])
+    last = np.concatenate([cut, [len(r) - 1]])
+    # satellite with single valid sample gives no intervals, as in loop version
+    nvalid = np.bincount(sat, minlength=len(offsets) - 1)
+    keep = nvalid[sat[first]] > 1
+    first, last = first[keep], last[keep]
+    return idx, r[first], r[last], sat[first]
+
+def savgol_hat(window:int, order:int)->np.array:
+    """
+    Hat matrix of least squares polynomial fit over window samples, row q
+    gives weights of window samples for smoothed value at q-th of them.
+    Middle row is savgol coefficients, other rows are edge values of 
+    savgol_filter with mode='interp'.
+    """
+    x = np.arange(window) - window // 2
+    vander = np.vander(x, order + 1).astype(float)
+    return vander @ np.linalg.pinv(vander)
+
+
+def savgol_at(values:np.array, starts:np.array, fins:np.array, 
+              points:np.array, arcs:np.array, window:int=21, 
+              order:int=2)->np.array:
+    """
+    Same as savgol_filter(values[start:fin], window, order) for every arc, 
+    but evaluated only at given points, all arcs at once
+    :param starts: first index of every arc
+    :param fins: index after the last of every arc
+    :param points: indexes of values to evaluate
+    :param arcs: arc number of every point
+    """
+    lengths = fins - starts
+    if np.any(lengths < window):
+        raise ValueError("If mode is 'interp', window_length must be less "
+                         "than or equal to the size of x.")
+    hat = savgol_hat(window, order)
+    pos = points - starts[arcs]
+    # window is shifted inside the arc near its edges
+    shift = np.clip(pos - window // 2, 0, lengths[arcs] - window)
+    rows = hat[pos - shift]
+    samples = values[(starts[arcs] + shift)[:, None] + np.arange(window)]
+    return np.einsum('ij,ij->i', rows, samples)
+
 
 def process_intervals(data:dict, maxgap:int, maxjump:int, derivative:bool, 
                       short:int = 3600, sparse:int = 600)->defaultdict[str,list[any]]:
@@ -137,15 +281,26 @@ def process_intervals(data:dict, maxgap:int, maxjump:int, derivative:bool,
                                 data['ipp_lat'], data['el'],  
                                 maxgap=maxgap, maxjump=maxjump)
     #_, intervals = get_continuos_intervals(data, maxgap=maxgap, maxjump=maxjump)
-    for start, fin in intervals:
-
-        if (tt[fin] - tt[start]) < short:    # disgard all the arcs shorter than 1 hour
-            #print('too short interval')
-            continue
-        ind_sparse = (tt[start:fin] % sparse == 0)
-        data_sample = data[start:fin]
-        data_sample['tec'] = savgol_filter(data_sample['tec'][:], 21, 2)
-        data_sample = data_sample[ind_sparse]
+    # disgard all the arcs shorter than 1 hour
+    intervals = [(start, fin) for start, fin in intervals 
+                 if (tt[fin] - tt[start]) >= short]
+    if not intervals:
+        return result
+    starts, fins = np.array(intervals).T
+    # only samples at sparse grid are kept, smoothed tec is evaluated just
+    # there; retained samples of all arcs form one ragged array
+    lengths = fins - starts
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    arcs = np.repeat(np.arange(len(starts)), lengths)
+    points = np.arange(offsets[-1]) - offsets[arcs] + starts[arcs]
+    ind_sparse = (tt[points] % sparse == 0)
+    points, arcs = points[ind_sparse], arcs[ind_sparse]
+    # copy, data could be read-only memmap from the cache
+    samples = np.array(data[points])
+    samples['tec'] = savgol_at(data['tec'], starts, fins, points, arcs, 21, 2)
+    bounds = np.searchsorted(arcs, np.arange(len(starts) + 1))
+    for i in range(len(starts)):
+        data_sample = samples[bounds[i]:bounds[i + 1]]
         
         if derivative == True:
             dtec = data_sample['tec'][1:] - data_sample['tec'][0:-1]
@@ -157,50 +312,33 @@ def process_intervals(data:dict, maxgap:int, maxjump:int, derivative:bool,
             data0 = data_sample[idx_min]
             data_out = np.delete(data_sample, idx_min)
             dtec = data_out['tec'][:] - data0['tec']
-            data_ref = np.zeros_like(data_out)
-            data_ref[:] = data0
+            # all observations of the arc share reference, it is kept once
+            data_ref = data_sample[idx_min:idx_min + 1]
         result['dtec'].append(dtec)
         result['out'].append(data_out)
         result['ref'].append(data_ref)
     return result
     
-def combine_data(all_data:dict, nchunks:int=1)->list[dict[str,any]]:
-    count = 0
-    for arr in all_data['dtec']:
-        count += arr.shape[0]
-    tec_data = np.concatenate(tuple(o for o in all_data['dtec']))
-    out_data = np.concatenate(tuple(o for o in all_data['out']))
-    ref_data = np.concatenate(tuple(r for r in all_data['ref']))
-    fields = ['tec', 'time', 'lon', 'lat', 'el', 'rtime', 'rlon', 'rlat', 'rel',
-              'colat_mdip', 'mlt_mdip', 'rcolat_mdip', 'rmlt_mdip',
-              'colat_mag', 'mlt_mag', 'rcolat_mag', 'rmlt_mag']
-    combs = []
-    ichunks = get_chunk_indexes(count, nchunks)
-    for i, (start, fin) in enumerate(ichunks):
+def combine_data(all_data:ArcStore, nchunks:int=1)->ArcChunks:
+    """
+    Splits prepared rows to chunks for magnetic coordinates calculation,
+    chunks are views of the store, magnetic fields are added when computed
+    :param all_data: ArcStore or prepare_arcs like dict of arc lists
+    :return: list of chunks, which keeps the store, see ArcChunks
+    """
+    if not isinstance(all_data, ArcStore):
+        store = ArcStore()
+        store.extend(all_data)
+        all_data = store
+    ichunks = get_chunk_indexes(len(all_data), nchunks)
+    for start, fin in ichunks:
         print(start, fin)
-        comb = dict()
-        #fields = {k: i for i, k in enumerate(fields)}
-        comb['tec'] = tec_data[start:fin]
-        _out_data = out_data[start:fin]
-        comb['time'] = _out_data['datetime']
-        comb['lon'] = _out_data['ipp_lon']
-        comb['lat'] = _out_data['ipp_lat']
-        comb['el'] = _out_data['el']
-        _ref_data = ref_data[start:fin]
-        comb['rtime'] = _ref_data['datetime']
-        comb['rlon'] = _ref_data['ipp_lon']
-        comb['rlat'] = _ref_data['ipp_lat']
-        comb['rel'] = _ref_data['el']
-        for f in fields:
-            if f in comb:
-                continue
-            comb[f] = np.zeros(comb['tec'].shape)
-        combs.append(comb)
-    return combs
+    return ArcChunks(all_data, ichunks)
 
 
 def get_chunk_indexes(size:int, nchunks:int)->list[tuple[int,int]]:
-    if nchunks > 1:
+    # less rows than chunks (e.g. day without arcs) gives single chunk
+    if nchunks > 1 and size >= nchunks:
         step = int(size / nchunks)
         ichunks = [(i-step, i) for i in range(step, size, step)]
         if (size - ichunks[-1][1]) / size > 0.1 * step:
@@ -208,71 +346,188 @@ def get_chunk_indexes(size:int, nchunks:int)->list[tuple[int,int]]:
         else:
             ichunks[-1] = (ichunks[-1][0], size)
         return ichunks
-    elif nchunks <= 1:
+    else:
         return [(0, size)]
     
 
-def calc_mag(comb:dict, g2m:function):
+def calc_mag(comb:dict, g2m:callable):
     colat, mlt = \
         g2m(np.pi/2 - rad(comb['lat']), rad(comb['lon']), comb['time'])  
     return colat, mlt
 
-def calc_mag_ref(comb:dict, g2m:function):
+def calc_mag_ref(comb:dict, g2m:callable):
     rcolat, rmlt = \
         g2m(np.pi/2 - rad(comb['rlat']), rad(comb['rlon']), comb['rtime'])  
     return  rcolat, rmlt
 
-def calc_mag_coordinates(comb:dict)->dict[str,tuple[int,int]]:
-    comb['colat_mdip'], comb['mlt_mdip'] = calc_mag(comb, geo2modip)  
-    comb['rcolat_mdip'], comb['rmlt_mdip'] = calc_mag_ref(comb, geo2modip)
-    comb['colat_mag'], comb['mlt_mag'] = calc_mag(comb, geo2mag)
-    comb['rcolat_mag'], comb['rmlt_mag'] = calc_mag_ref(comb, geo2mag)
+def calc_mag_coordinates(comb:dict, mag_types:list[MagneticCoordType]=None)->dict[str,tuple[int,int]]:
+    """
+    Adds magnetic fields of requested coordinate systems, systems already
+    present in comb are not recomputed. References are computed once, 
+    observations refer them by iref.
+    :param mag_types: MagneticCoordType list, all systems if None
+    """
+    for mtype in mag_types_list(mag_types):
+        colat, mlt, rcolat, rmlt = mag_fields(mtype)
+        if all(f in comb for f in [colat, mlt, rcolat, rmlt]):
+            continue
+        comb[colat], comb[mlt] = calc_mag(comb, MAG_FUNCTIONS[mtype])  
+        comb[rcolat], comb[rmlt] = calc_mag_ref(comb, MAG_FUNCTIONS[mtype])
     return comb
     
-def calculate_seed_mag_coordinates_parallel(chunks:list, nworkers=3):
+def calc_mag_coordinates_shared(spec:dict, start:int, fin:int, 
+                                mag_types:list[str], ref:bool)->tuple[int,int,bool]:
+    """
+    Worker part of calculate_seed_mag_coordinates_parallel, computes rows 
+    start:fin of shared observation or reference columns and writes 
+    magnetic fields in place
+    :param ref: spec is of references
+    """
+    with SharedColumns.attach(spec) as shared:
+        fields = REF_FIELDS if ref else OBS_FIELDS
+        comb = {f: shared[f][start:fin] for f in fields}
+        for mtype in mag_types_list(mag_types):
+            colat, mlt, rcolat, rmlt = mag_fields(mtype)
+            if ref:
+                values = dict(zip([rcolat, rmlt], 
+                                  calc_mag_ref(comb, MAG_FUNCTIONS[mtype])))
+            else:
+                values = dict(zip([colat, mlt], 
+                                  calc_mag(comb, MAG_FUNCTIONS[mtype])))
+            shared.write(start, **values)
+        # views of shared blocks must be released before detach
+        del comb
+    return start, fin, ref
+
+
+def calculate_seed_mag_coordinates_parallel(chunks:list, nworkers=3, 
+                                            mag_types:list[MagneticCoordType]=None):
+    """
+    Computes magnetic fields of all chunks. Observations of every chunk 
+    and equal parts of references (common for all chunks) are tasks. Rows 
+    of task are placed at its fixed offset, so result keeps chunk order 
+    whatever worker finishes first. Geographic fields of result are views
+    of the store for chunks of combine_data (ArcChunks), joined copies for
+    other chunks; magnetic fields are copied once from shared output 
+    columns.
+    :param mag_types: coordinate systems to compute, all if None
+    """
     if len(chunks) < 1:
         return None
     if len(chunks) == 1:
-        calc_mag_coordinates(chunks[0])
+        calc_mag_coordinates(chunks[0], mag_types)
         return chunks[0]
-    chunks_processed = []
-    with ProcessPoolExecutor(max_workers=nworkers) as executor:
-        queue = []
-        for chunk in chunks:
-            query = executor.submit(calc_mag_coordinates, chunk)
-            queue.append(query)
-        for v in concurrent.futures.as_completed(queue):
-            chunk = v.result()
-            chunks_processed.append(chunk)
+    # enum values are passed to workers
+    mag_types = [str(m) for m in mag_types_list(mag_types)]
+    fields = [mag_fields(m) for m in mag_types_list(mag_types)]
+    obs_fields = [f for colat, mlt, _, _ in fields for f in [colat, mlt]]
+    ref_fields = [f for _, _, rcolat, rmlt in fields for f in [rcolat, rmlt]]
     count = 0
-    for chunk in chunks_processed:
+    for chunk in chunks:
         count += chunk['tec'].shape[0]
-    comb = {}
-    for f in chunks_processed[0]:
-        if not f in ['time', 'rtime']:
-            comb[f] = np.zeros((count,)) 
-    comb['time'] = np.zeros((count,), dtype=object)
-    comb['rtime'] = np.zeros((count,), dtype=object)
-    start, end = 0, 0 
-    for chunk in chunks_processed:
-        end = end + chunk['tec'].shape[0]
-        
-        for k in chunk:
-            comb[k][start:end] = chunk[k]
-        start = end
+    refs = {f: chunks[0][f] for f in REF_FIELDS}
+    nrefs = refs['rtime'].shape[0]
+    obs_dtypes = {f: float for f in OBS_FIELDS + obs_fields}
+    obs_dtypes.update({'time': 'datetime64[s]', 'iref': 'int64'})
+    ref_dtypes = {f: float for f in REF_FIELDS + ref_fields}
+    ref_dtypes['rtime'] = 'datetime64[s]'
+    if str(MagneticCoordType.mdip) in mag_types:
+        # inclination tables are loaded or built once, not in every worker
+        preload_inclination(refs['rtime'])
+    st = time.time()
+    # chunks are passed to workers through shared columns, workers fill
+    # magnetic columns at rows of their task and return only offsets
+    with SharedColumns.create(obs_dtypes, count) as shared, \
+            SharedColumns.create(ref_dtypes, nrefs) as shared_refs:
+        shared_refs.write(0, **refs)
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            queue = []
+            start = 0
+            for chunk in chunks:
+                fin = start + chunk['tec'].shape[0]
+                shared.write(start, **{f: chunk[f] for f in OBS_FIELDS})
+                query = executor.submit(calc_mag_coordinates_shared, 
+                                        shared.spec, start, fin, mag_types, 
+                                        False)
+                queue.append(query)
+                start = fin
+            for start, fin in get_chunk_indexes(nrefs, min(len(chunks), nrefs)):
+                query = executor.submit(calc_mag_coordinates_shared, 
+                                        shared_refs.spec, start, fin, 
+                                        mag_types, True)
+                queue.append(query)
+            done = 0
+            for v in concurrent.futures.as_completed(queue):
+                start, fin, ref = v.result()
+                done += fin - start
+                part = 'References' if ref else 'Rows'
+                print(f'{part} {start}:{fin} done, {done}/{count + nrefs} rows, '
+                      f'takes {time.time() - st}')
+        if isinstance(chunks, ArcChunks):
+            joined = chunks.joined()
+            comb = {f: joined[f] for f in OBS_FIELDS}
+        else:
+            comb = {f: np.concatenate([chunk[f] for chunk in chunks]) 
+                    for f in OBS_FIELDS}
+        comb.update(refs)
+        comb.update({f: np.array(shared[f]) for f in obs_fields})
+        comb.update({f: np.array(shared_refs[f]) for f in ref_fields})
     return comb
     
 
 def save_data(comb:dict, modip_file:Path, mag_file:Path, day_date:datetime):
+    """
+    Saves coordinate systems computed in comb, geographic coordinates are 
+    saved too, so other system could be derived later, see read_data
+    :param modip_file: file for modip, not saved if None
+    :param mag_file: file for geomagnetic, not saved if None
+    """
     mags = [MagneticCoordType.mdip, MagneticCoordType.mag]
     for mtype, filename in zip(mags, [modip_file, mag_file]):
+        if filename is None or not all(f in comb for f in mag_fields(mtype)):
+            continue
         data = get_data(comb, mtype, day_date)
-        postf = str(mtype)
         np.savez(filename, 
-                day = day_date,
+                day = np.datetime64(day_date, 's'),
+                mag_type = str(mtype),
+                lon = comb['lon'],
+                lat = comb['lat'],
+                lon_ref = comb['rlon'],
+                lat_ref = comb['rlat'],
                 **data)    
-        
+
+
+def read_data(filename:Path)->tuple[dict[str,any],datetime]:
+    """
+    Restores combined data from file of save_data, e.g. to compute other
+    coordinate system with calc_mag_coordinates
+    :return: combined data and day
+    """
+    data = np.load(filename)
+    if not 'lat' in data:
+        raise ValueError(f'{filename} has no geographic coordinates')
+    day = data['day']
+    mtype = MagneticCoordType(str(data['mag_type']))
+    comb = dict(tec = data['rhs'], 
+                time = day + np.round(data['time']).astype('timedelta64[s]'),
+                lon = data['lon'],
+                lat = data['lat'],
+                el = np.rad2deg(data['el']),
+                rtime = day + np.round(data['time_ref']).astype('timedelta64[s]'),
+                rlon = data['lon_ref'],
+                rlat = data['lat_ref'],
+                rel = np.rad2deg(data['el_ref']),
+                iref = data['iref'])
+    colat, mlt, rcolat, rmlt = mag_fields(mtype)
+    comb.update({colat: data['mcolat'], mlt: data['mlt'], 
+                 rcolat: data['mcolat_ref'], rmlt: data['mlt_ref']})
+    return comb, day.astype(datetime)
+
 def get_data(comb:dict, mtype, day_date:datetime)->dict[str,any]:
+    """
+    Data for solver, *_ref fields are given once per reference, iref is
+    index of reference of every observation
+    """
     postf = str(mtype)
     data = dict(time = sec_of_interval(comb['time'], day_date), 
                 mlt = comb['mlt_' + postf ], 
@@ -282,6 +537,7 @@ def get_data(comb:dict, mtype, day_date:datetime)->dict[str,any]:
                 mlt_ref = comb['rmlt_' + postf], 
                 mcolat_ref = comb['rcolat_' + postf], 
                 el_ref = rad(comb['rel']), 
+                iref = comb['iref'],
                 rhs = comb['tec'])    
     return data
 
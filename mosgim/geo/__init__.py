@@ -1,7 +1,15 @@
 # geomag.py
-from geomag import geo2mag
-from geomag import geo2modip
-from geomag import make_inclination
+from .geomag import geo2mag
+from .geomag import geo2modip
+from .geomag import make_inclination
+from .geomag import inclination
+from .geomag import configure_inclination
+from .geomag import preload_inclination
+from .geomag import InclinationGrid
 
 #geo.py
-from geo import sub_ionospheric
+from .geo import sub_ionospheric
+
+# igrf.py
+from .igrf import igrf_field
+from .igrf import igrf_inclination
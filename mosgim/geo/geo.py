@@ -1,3 +1,5 @@
+import numpy as np
+
 from numpy import sin, cos, pi, arctan2, arcsin, floor, deg2rad
 
 RE = 6371.2
@@ -5,6 +7,7 @@ HM=300
 
 def sub_sol(year:int, doy:int, ut:int)->float:
     '''Finds subsolar geocentric longitude and latitude.
+    Arguments could be arrays, they are broadcasted.
 
 
     Parameters
@@ -40,19 +43,19 @@ def sub_sol(year:int, doy:int, ut:int)->float:
 
     '''
 
+    year = np.asarray(year)
     yr = year - 2000
 
-    if year >= 2101:
-        print('subsol.py: subsol invalid after 2100. Input year is:', year)
+    if np.any(year >= 2101):
+        print('subsol.py: subsol invalid after 2100. Input year is:', np.max(year))
 
     nleap = floor((year-1601)/4)
     nleap = nleap - 99
-    if year <= 1900:
-        if year <= 1600:
-            print('subsol.py: subsol invalid before 1601. Input year is:', year)
-        ncent = floor((year-1601)/100)
-        ncent = 3 - ncent
-        nleap = nleap + ncent
+    if np.any(year <= 1600):
+        print('subsol.py: subsol invalid before 1601. Input year is:', np.min(year))
+    ncent = floor((year-1601)/100)
+    ncent = 3 - ncent
+    nleap = np.where(year <= 1900, nleap + ncent, nleap)
 
     l0 = -79.549 + (-0.238699*(yr-4*nleap) + 3.08514e-2*nleap)
 
@@ -97,7 +100,7 @@ def sub_sol(year:int, doy:int, ut:int)->float:
 
     # Equation of time (degrees):
     etdeg = l - alpha
-    nrot = round(etdeg/360)
+    nrot = np.round(etdeg/360)
     etdeg = etdeg - 360*nrot
 
     # Apparent time (degrees):
@@ -105,7 +108,7 @@ def sub_sol(year:int, doy:int, ut:int)->float:
 
     # Subsolar longitude:
     sbsllon = 180 - aptime
-    nrot = round(sbsllon/360)
+    nrot = np.round(sbsllon/360)
     sbsllon = sbsllon - 360*nrot
 
     return deg2rad(sbsllon), pi / 2 - deg2rad(sbsllat)
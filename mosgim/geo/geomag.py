@@ -1,8 +1,12 @@
-import pyIGRF.calculate as calculate
+import os
+import time
 import numpy as np
 from datetime import datetime
+from pathlib import Path
 from .geo import sub_sol
-from mosgim.utils.time_util import sec_of_day
+from .igrf import IGRF_RE, igrf_inclination
+from mosgim.utils.time_util import year_doy_ut
+from mosgim.utils.epochs import Epochs
 # GEOMAGNETIC AND MODIP COORDINATES SECTION
 
 # North magnetic pole coordinates, for 2017
@@ -18,67 +22,267 @@ GEOGRAPHIC_TRANSFORM = np.array([
 ])
 
 
-@np.vectorize
-def geo2mag(theta:float, phi:float, date:datetime)->tuple[float,float]:
-    ut = sec_of_day(date)
-    doy = date.timetuple().tm_yday
-    year = date.year
+def geo2mag(theta:float, phi:float, date:np.datetime64)->tuple[float,float]:
+    """
+    :param date: datetime64 (or datetime) scalar or array, broadcasted
+        with theta and phi, or its Epochs
+    """
+    epochs = Epochs.of(date)
+    # subsolar point is computed once per epoch
+    phi_sbs_m = epochs.gather(epochs.terms('phi_sbs_mag', _subsolar_mag))
+    theta, phi, phi_sbs_m = np.broadcast_arrays(theta, phi, phi_sbs_m)
+    theta_m, phi_m = _rotate(theta, phi)
+
+    mlt = phi_m - phi_sbs_m + np.pi # np.radians(15.) * ut /3600. + phi_m + POLE_PHI  
+    mlt = np.where(mlt < 0., mlt + 2. * np.pi, mlt)
+    mlt = np.where(mlt > 2. * np.pi, mlt - 2. * np.pi, mlt)
+    return theta_m, mlt
 
-    phi_sbs, theta_sbs = sub_sol(year, doy, ut)
-    r_sbs = np.array([np.sin(theta_sbs) * np.cos(phi_sbs), np.sin(theta_sbs) * np.sin(phi_sbs), np.cos(theta_sbs)])
 
-    r_sbs_mag = GEOGRAPHIC_TRANSFORM.dot(r_sbs)
-    theta_sbs_m = np.arccos(r_sbs_mag[2])
-    phi_sbs_m = np.arctan2(r_sbs_mag[1], r_sbs_mag[0])
-    if phi_sbs_m < 0.:
-        phi_sbs_m = phi_sbs_m + 2. * np.pi
+def _subsolar_mag(epochs:Epochs)->np.array:
+    """
+    Geomagnetic longitude of subsolar point for every epoch
+    """
+    phi_sbs, theta_sbs = sub_sol(*epochs.year_doy_ut)
+    _, phi_sbs_m = _rotate(theta_sbs, phi_sbs)
+    return phi_sbs_m
 
 
-    r = np.array([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)])
-    r_mag = GEOGRAPHIC_TRANSFORM.dot(r)
+def _rotate(theta:np.array, phi:np.array)->tuple[np.array,np.array]:
+    """
+    Geographic to geomagnetic colatitude and longitude [0, 2pi), all points
+    are rotated with one matrix product
+    """
+    r = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)])
+    r_mag = GEOGRAPHIC_TRANSFORM.dot(r.reshape(3, -1)).reshape(r.shape)
     theta_m = np.arccos(r_mag[2])
     phi_m = np.arctan2(r_mag[1], r_mag[0])
-    if phi_m < 0.:
-        phi_m = phi_m + 2. * np.pi
-
-
-    mlt = phi_m - phi_sbs_m + np.pi # np.radians(15.) * ut /3600. + phi_m + POLE_PHI  
-    if mlt < 0.:
-        mlt = mlt + 2. * np.pi
-    if mlt > 2. * np.pi:
-        mlt = mlt - 2. * np.pi
-
-    return theta_m, mlt
+    phi_m = np.where(phi_m < 0., phi_m + 2. * np.pi, phi_m)
+    return theta_m, phi_m
 
 
 def make_inclination(lat:float, lon:float, alt:int=300., year:int=2005.)->float:
     """
+    Arguments could be arrays of the same year
     :return
          I is inclination (+ve down)
     """
-    if lon < 0:
-        lon = lon + 360.      
-    FACT = 180./np.pi
-    REm = 6371.2
-    x, y, z, f = calculate.igrf12syn(year, 2, REm + alt, lat, lon) # 2 stands for geocentric coordinates
-    h = np.sqrt(x * x + y * y)
-    i = FACT * np.arctan2(z, h)
-    return i
-
-@np.vectorize
-def geo2modip(theta:float, phi:float, date:datetime)->tuple[float,float]:
-    year = date.year
-    I = make_inclination(lat=np.rad2deg(np.pi/2 - theta), lon=np.rad2deg(phi), alt=300., year=year) # alt=300 for modip300
-    theta_m = np.pi/2 - np.arctan2(np.deg2rad(I), np.sqrt(np.cos(np.pi/2 - theta)))
-    ut = sec_of_day(date)
+    lon = np.where(np.asarray(lon) < 0, lon + 360., lon)
+    # geocentric coordinates
+    return igrf_inclination(year, IGRF_RE + alt, lat, lon)
+
+# height of modip
+MODIP_ALT = 300.
+# inclination tables: folder where tables are kept, grid steps in degrees,
+# exact=True makes geo2modip call IGRF for every point instead of table
+INCLINATION_SETTINGS = dict(cache_dir=Path.home() / '.cache' / 'mosgim',
+                            lat_step=1., lon_step=1., exact=False)
+# tables loaded by this process, by (year, lat_step, lon_step)
+_INCLINATION_GRIDS = {}
+
+
+class InclinationGrid():
+    """
+    Table of inclination at MODIP_ALT for one year on regular lat/lon grid,
+    evaluated with bilinear interpolation. Bilinear error is below 
+    h**2 / 8 * max|second derivative|, so it grows as square of the step h.
+    On 1 degree grid (2017) the table differs from exact IGRF by less than
+    0.015 degree within 60 degrees of equator, 0.0025 degree in average,
+    and up to 0.21 degree close to dip poles, where inclination has sharp
+    maximum. Maximal deviation measured on build at cell centers (worst 
+    case for bilinear interpolation) is kept in max_error.
+    """
+
+    def __init__(self, year:int, lat_step:float, lon_step:float, 
+                 values:np.array, max_error:float=None):
+        """
+        :param values: inclination in degrees at lats -90:90:lat_step 
+            (rows) and lons 0:360:lon_step (columns)
+        """
+        self.year = int(year)
+        self.lat_step = float(lat_step)
+        self.lon_step = float(lon_step)
+        self.values = values
+        self.max_error = max_error
+
+    @staticmethod
+    def nodes(lat_step:float, lon_step:float)->tuple[np.array,np.array]:
+        nlat = int(round(180. / lat_step)) + 1
+        nlon = int(round(360. / lon_step)) + 1
+        if not np.isclose((nlat - 1) * lat_step, 180.) or \
+                not np.isclose((nlon - 1) * lon_step, 360.):
+            raise ValueError(f'Steps {lat_step}, {lon_step} do not divide globe')
+        return (np.linspace(-90., 90., nlat), np.linspace(0., 360., nlon))
+
+    @classmethod
+    def build(cls, year:int, lat_step:float=1., lon_step:float=1.)->'InclinationGrid':
+        st = time.time()
+        lats, lons = cls.nodes(lat_step, lon_step)
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        values = inclination_exact(lat_grid, lon_grid, year)
+        grid = cls(year, lat_step, lon_step, values)
+        # cell centers, there bilinear error is max
+        lat_c = lats[:-1] + lat_step / 2
+        lon_c = lons[:-1] + lon_step / 2
+        lon_c, lat_c = np.meshgrid(lon_c, lat_c)
+        exact = inclination_exact(lat_c, lon_c, year)
+        grid.max_error = float(np.max(np.abs(grid(lat_c, lon_c) - exact)))
+        print(f'Inclination table for {year} is built, max error '
+              f'{grid.max_error} deg, takes {time.time() - st}')
+        return grid
+
+    @staticmethod
+    def filename(year:int, lat_step:float, lon_step:float)->str:
+        return f'inclination_{MODIP_ALT:g}km_{int(year)}_{lat_step:g}x{lon_step:g}.npz'
+
+    @classmethod
+    def load(cls, path:Path)->'InclinationGrid':
+        content = np.load(path)
+        return cls(content['year'], content['lat_step'], content['lon_step'],
+                   content['values'], float(content['max_error']))
+
+    def save(self, path:Path):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        # workers could build the same table, replace is atomic
+        tmp = Path(path).with_suffix(f'.{os.getpid()}.tmp.npz')
+        np.savez(tmp, year=self.year, lat_step=self.lat_step, 
+                 lon_step=self.lon_step, values=self.values, 
+                 max_error=self.max_error)
+        os.replace(tmp, path)
+
+    def __call__(self, lat:np.array, lon:np.array)->np.array:
+        """
+        :param lat: latitude, degrees
+        :param lon: longitude, degrees, any range
+        :return: inclination, degrees
+        """
+        nlat, nlon = self.values.shape
+        y = (np.asarray(lat) + 90.) / self.lat_step
+        x = np.mod(lon, 360.) / self.lon_step
+        i = np.clip(np.floor(y).astype(int), 0, nlat - 2)
+        j = np.clip(np.floor(x).astype(int), 0, nlon - 2)
+        dy = y - i
+        dx = x - j
+        v = self.values
+        return ((v[i, j] * (1 - dx) + v[i, j + 1] * dx) * (1 - dy) + 
+                (v[i + 1, j] * (1 - dx) + v[i + 1, j + 1] * dx) * dy)
+
+
+def configure_inclination(**kwargs):
+    """
+    Updates INCLINATION_SETTINGS: cache_dir (None to keep tables in memory
+    only), lat_step, lon_step, exact
+    """
+    unknown = set(kwargs) - set(INCLINATION_SETTINGS)
+    if unknown:
+        raise ValueError(f'Unknown inclination settings {unknown}')
+    INCLINATION_SETTINGS.update(kwargs)
+
+
+def inclination_grid(year:int)->InclinationGrid:
+    """
+    Table of the year for current settings, loaded from cache_dir or built 
+    and saved there
+    """
+    lat_step = INCLINATION_SETTINGS['lat_step']
+    lon_step = INCLINATION_SETTINGS['lon_step']
+    key = (int(year), lat_step, lon_step)
+    if key in _INCLINATION_GRIDS:
+        return _INCLINATION_GRIDS[key]
+    cache_dir = INCLINATION_SETTINGS['cache_dir']
+    path = None
+    if cache_dir is not None:
+        path = Path(cache_dir) / InclinationGrid.filename(*key)
+    if path is not None and path.exists():
+        grid = InclinationGrid.load(path)
+    else:
+        grid = InclinationGrid.build(*key)
+        if path is not None:
+            grid.save(path)
+    _INCLINATION_GRIDS[key] = grid
+    return grid
+
+
+def preload_inclination(date:np.datetime64):
+    """
+    Loads or builds tables for years of dates, call before starting workers
+    so that they do not build the same tables
+    """
+    if INCLINATION_SETTINGS['exact'] or np.size(date) == 0:
+        return
+    year, _, _ = year_doy_ut(date)
+    for y in range(int(np.min(year)), int(np.max(year)) + 1):
+        inclination_grid(y)
+
+
+def inclination_exact(lat:np.array, lon:np.array, year:np.array)->np.array:
+    """
+    IGRF inclination at MODIP_ALT for every point, degrees
+    """
+    if np.ndim(year) == 0:
+        return make_inclination(*np.broadcast_arrays(lat, lon), MODIP_ALT, year)
+    lat, lon, year = np.broadcast_arrays(lat, lon, year)
+    result = np.empty(lat.shape)
+    for y in np.unique(year):
+        ind = year == y
+        result[ind] = make_inclination(lat[ind], lon[ind], MODIP_ALT, y)
+    return result
+
+
+def inclination(lat:np.array, lon:np.array, year:np.array, 
+                exact:bool=None)->np.array:
+    """
+    Inclination at MODIP_ALT, degrees
+    :param exact: evaluate IGRF at every point instead of table, 
+        INCLINATION_SETTINGS['exact'] if None
+    """
+    if exact is None:
+        exact = INCLINATION_SETTINGS['exact']
+    if exact:
+        return inclination_exact(lat, lon, year)
+    if np.ndim(year) == 0:
+        return inclination_grid(year)(*np.broadcast_arrays(lat, lon))
+    lat, lon, year = np.broadcast_arrays(lat, lon, year)
+    years = np.unique(year)
+    result = np.empty(lat.shape)
+    for y in years:
+        ind = year == y
+        result[ind] = inclination_grid(y)(lat[ind], lon[ind])
+    return result
+
+
+def geo2modip(theta:float, phi:float, date:np.datetime64, 
+              exact:bool=None)->tuple[float,float]:
+    """
+    :param date: datetime64 (or datetime) scalar or array, broadcasted
+        with theta and phi, or its Epochs
+    :param exact: see inclination
+    """
+    epochs = Epochs.of(date)
+    year, _, _ = epochs.year_doy_ut
+    years = np.unique(year)
+    # one year is broadcasted, rows are not grouped by year then
+    year = years[0] if len(years) == 1 else epochs.gather(year)
+    phi_sbs = epochs.gather(epochs.terms('phi_sbs_modip', _subsolar_modip))
+    theta, phi, phi_sbs = np.broadcast_arrays(theta, phi, phi_sbs)
+    I = inclination(np.rad2deg(np.pi/2 - theta), np.rad2deg(phi), year, exact) # alt=300 for modip300
+    return _geo2modip(theta, phi, I, phi_sbs)
+
+
+def _subsolar_modip(epochs:Epochs)->np.array:
+    """
+    Longitude of subsolar point for every epoch, for modip
+    """
+    _, _, ut = epochs.year_doy_ut
     phi_sbs = np.deg2rad(180. - ut*15./3600)
-    if phi_sbs < 0.:
-        phi_sbs = phi_sbs + 2. * np.pi
-    if phi < 0.:
-        phi = phi + 2. * np.pi
+    return np.where(phi_sbs < 0., phi_sbs + 2. * np.pi, phi_sbs)
+
+
+def _geo2modip(theta:np.array, phi:np.array, I:np.array, 
+               phi_sbs:np.array)->tuple[np.array,np.array]:
+    theta_m = np.pi/2 - np.arctan2(np.deg2rad(I), np.sqrt(np.cos(np.pi/2 - theta)))
+    phi = np.where(phi < 0., phi + 2. * np.pi, phi)
     mlt = phi - phi_sbs + np.pi
-    if mlt < 0.:
-        mlt = mlt + 2. * np.pi
-    if mlt > 2. * np.pi:
-        mlt = mlt - 2. * np.pi
+    mlt = np.where(mlt < 0., mlt + 2. * np.pi, mlt)
+    mlt = np.where(mlt > 2. * np.pi, mlt - 2. * np.pi, mlt)
     return theta_m, mlt
@@ -0,0 +1,129 @@
+import warnings
+import numpy as np
+
+from pyIGRF.loadCoeffs import get_coeffs
+
+# reference radius of IGRF, km
+IGRF_RE = 6371.2
+FACT = 180. / np.pi
+# epochs of IGRF-13 models, after the last one coefficients are
+# extrapolated by its secular variation (as pyIGRF get_coeffs does) up to
+# IGRF_MAX_DATE
+IGRF_MIN_DATE = 1900.0
+IGRF_LAST_MODEL = 2025.0
+IGRF_MAX_DATE = 2030.0
+
+# Gauss coefficients by epoch, computed once per process
+_COEFFS = {}
+
+
+def igrf_coeffs(date:float)->tuple[np.array,np.array]:
+    """
+    Gauss coefficients g, h of IGRF (coefficients of pyIGRF) for the epoch.
+    igrf12syn of pyIGRF gave zero field after IGRF_LAST_MODEL, now
+    coefficients are extrapolated with warning, as get_coeffs does.
+    :param date: decimal year
+    :return: g[n, m], h[n, m], zeros where undefined
+    """
+    date = float(date)
+    if date in _COEFFS:
+        return _COEFFS[date]
+    if date < IGRF_MIN_DATE or date > IGRF_MAX_DATE:
+        raise ValueError(f'IGRF is not defined for {date}, '
+                         f'{IGRF_MIN_DATE} <= date <= {IGRF_MAX_DATE}')
+    if date > IGRF_LAST_MODEL:
+        warnings.warn(f'IGRF is extrapolated for {date} by secular variation '
+                      f'after {IGRF_LAST_MODEL}, accuracy is reduced')
+    g_list, h_list = get_coeffs(date)
+    nmx = len(g_list) - 1
+    g = np.zeros((nmx + 1, nmx + 1))
+    h = np.zeros((nmx + 1, nmx + 1))
+    for n in range(1, nmx + 1):
+        g[n, :n + 1] = g_list[n]
+        h[n, 1:n + 1] = h_list[n][1:]
+    _COEFFS[date] = (g, h)
+    return g, h
+
+
+def igrf_field(date:float, r:np.array, lat:np.array,
+               elong:np.array)->tuple[np.array,np.array,np.array,np.array]:
+    """
+    Vectorized igrf12syn of pyIGRF in geocentric coordinates (itype=2),
+    same recursions are done for all points at once. Position arguments
+    are broadcasted.
+    :param date: decimal year, single epoch
+    :param r: distance from centre of Earth, km
+    :param lat: geocentric latitude, degrees
+    :param elong: east longitude, degrees
+    :return: north, east, vertical components and total intensity, nT
+    """
+    g, h = igrf_coeffs(date)
+    nmx = len(g) - 1
+    r, lat, elong = np.broadcast_arrays(np.asarray(r, dtype=float),
+                                        np.asarray(lat, dtype=float),
+                                        np.asarray(elong, dtype=float))
+    one = (90 - lat) / FACT
+    ct = np.cos(one)
+    st = np.sin(one)
+    one = elong / FACT
+    cl = [np.cos(one)]
+    sl = [np.sin(one)]
+    # y component at poles, where st is 0, uses q instead of p / st
+    pole = st == 0.0
+    st_safe = np.where(pole, 1.0, st)
+
+    ratio = IGRF_RE / r
+    rr = ratio * ratio
+    x = np.zeros(r.shape)
+    y = np.zeros(r.shape)
+    z = np.zeros(r.shape)
+    # Schmidt quasi-normal p and its derivative q, keyed by (n, m)
+    p = {(0, 0): np.ones(r.shape), (1, 1): st}
+    q = {(0, 0): np.zeros(r.shape), (1, 1): ct}
+    for n in range(1, nmx + 1):
+        rr = rr * ratio
+        fn, gn = n, n - 1
+        for m in range(n + 1):
+            fm = m
+            if m != n:
+                gmm = m * m
+                one = np.sqrt(fn * fn - gmm)
+                two = np.sqrt(gn * gn - gmm) / one
+                three = (fn + gn) / one
+                p1, q1 = p[(n - 1, m)], q[(n - 1, m)]
+                p2 = p.get((n - 2, m), 0.)
+                q2 = q.get((n - 2, m), 0.)
+                p[(n, m)] = three * ct * p1 - two * p2
+                q[(n, m)] = three * (ct * q1 - st * p1) - two * q2
+            elif n != 1:
+                one = np.sqrt(1.0 - 0.5 / fm)
+                p1, q1 = p[(n - 1, m - 1)], q[(n - 1, m - 1)]
+                p[(n, m)] = one * st * p1
+                q[(n, m)] = one * (st * q1 + ct * p1)
+                cl.append(cl[m - 2] * cl[0] - sl[m - 2] * sl[0])
+                sl.append(sl[m - 2] * cl[0] + cl[m - 2] * sl[0])
+            pk, qk = p[(n, m)], q[(n, m)]
+            one = g[n, m] * rr
+            if m == 0:
+                x = x + one * qk
+                z = z - (fn + 1.0) * one * pk
+            else:
+                two = h[n, m] * rr
+                three = one * cl[m - 1] + two * sl[m - 1]
+                x = x + three * qk
+                z = z - (fn + 1.0) * three * pk
+                y = y + np.where(pole,
+                                 (one * sl[m - 1] - two * cl[m - 1]) * qk * ct,
+                                 (one * sl[m - 1] - two * cl[m - 1]) * fm * pk / st_safe)
+    f = np.sqrt(x * x + y * y + z * z)
+    return x, y, z, f
+
+
+def igrf_inclination(date:float, r:np.array, lat:np.array,
+                     elong:np.array)->np.array:
+    """
+    Inclination (+ve down), degrees, arguments as for igrf_field
+    """
+    x, y, z, _ = igrf_field(date, r, lat, elong)
+    h = np.sqrt(x * x + y * y)
+    return FACT * np.arctan2(z, h)
@@ -1,5 +1,15 @@
 #map_creator.py
-from mosg.map_creator import solve_weights
-from mosg.map_creator import calculate_maps
+from .map_creator import solve_weights
+from .map_creator import calculate_maps
+#basis.py
+from .basis import harmonic_indexes
+from .basis import real_basis
+from .basis import iter_basis
+#banded.py
+from .banded import BlockBandedMatrix
+#solvers.py
+from .solvers import SOLVERS
+from .solvers import solve_normal_system
+from .solvers import solve_design
 #lcp_solver.py
-from mosg.lcp_solver import create_lcp
\ No newline at end of file
+from .lcp_solver import create_lcp
\ No newline at end of file
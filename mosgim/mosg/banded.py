@@ -0,0 +1,215 @@
+import numpy as np
+
+from loguru import logger
+from scipy.linalg import (cholesky_banded, cho_solve_banded, cho_factor, 
+                          cho_solve, lu_factor, lu_solve)
+from scipy.linalg.lapack import dgbtrf, dgbtrs
+from numpy.linalg import LinAlgError
+
+
+class BlockBandedMatrix():
+    """
+    Symmetric matrix of nblocks x nblocks square blocks of n_coefs, nonzero
+    only within bandwidth blocks from diagonal, e.g. normal matrix of maps
+    of consecutive time bins. Only lower blocks are kept:
+    blocks[i, d] is block (i, i - d), blocks with i - d < 0 are zero.
+    Memory is linear in nblocks.
+    """
+
+    def __init__(self, blocks:np.array):
+        """
+        :param blocks: array (nblocks, bandwidth + 1, n_coefs, n_coefs)
+        """
+        if blocks.ndim != 4 or blocks.shape[2] != blocks.shape[3]:
+            raise ValueError(f'Wrong shape of blocks {blocks.shape}')
+        self.blocks = blocks
+        # (kind, factor) of solve, reused for next right hand sides until
+        # matrix is changed, see factorize
+        self.__factor = None
+
+    @classmethod
+    def zeros(cls, nblocks:int, n_coefs:int, bandwidth:int)->'BlockBandedMatrix':
+        bandwidth = max(0, min(bandwidth, nblocks - 1))
+        return cls(np.zeros((nblocks, bandwidth + 1, n_coefs, n_coefs)))
+
+    @property
+    def nblocks(self)->int:
+        return self.blocks.shape[0]
+
+    @property
+    def bandwidth(self)->int:
+        return self.blocks.shape[1] - 1
+
+    @property
+    def n_coefs(self)->int:
+        return self.blocks.shape[2]
+
+    @property
+    def shape(self)->tuple[int,int]:
+        size = self.nblocks * self.n_coefs
+        return (size, size)
+
+    def __changed(self):
+        self.__factor = None
+
+    def add(self, i:int, j:int, block:np.array):
+        """
+        Adds block at (i, j), block at (j, i) is its transpose implicitly,
+        so only one of them should be added for i != j
+        """
+        self.__changed()
+        if i >= j:
+            self.blocks[i, i - j] += block
+        else:
+            self.blocks[j, j - i] += block.T
+
+    def __iadd__(self, other:'BlockBandedMatrix')->'BlockBandedMatrix':
+        self.__changed()
+        self.blocks += other.blocks
+        return self
+
+    def add_frozen_constraints(self, weight:float):
+        """
+        Adds weight * (x_i - x_{i+1})^2 for every coefficient of every pair
+        of consecutive blocks, same as constraint loop of dense system
+        """
+        if self.nblocks < 2:
+            return
+        self.__changed()
+        diag = np.arange(self.n_coefs)
+        counts = np.full(self.nblocks, 2.)
+        counts[[0, -1]] = 1.
+        self.blocks[:, 0, diag, diag] += weight * counts[:, np.newaxis]
+        self.blocks[1:, 1, diag, diag] -= weight
+
+    def diagonal_blocks(self)->np.array:
+        return self.blocks[:, 0]
+
+    def to_banded(self)->np.array:
+        """
+        Lower band storage of scipy.linalg.cholesky_banded:
+        ab[r - c, c] = N[r, c] for r >= c
+        """
+        nc = self.n_coefs
+        ab = np.zeros(((self.bandwidth + 1) * nc, self.nblocks * nc))
+        p, q = np.meshgrid(np.arange(nc), np.arange(nc), indexing='ij')
+        for d in range(self.bandwidth + 1):
+            rows = d * nc + p - q
+            mask = rows >= 0
+            cols = np.arange(self.nblocks - d)[:, np.newaxis] * nc + q[mask]
+            ab[rows[mask], cols] = self.blocks[d:, d][:, mask]
+        return ab
+
+    def to_dense(self)->np.array:
+        nc = self.n_coefs
+        dense = np.zeros(self.shape)
+        for d in range(self.bandwidth + 1):
+            for i in range(d, self.nblocks):
+                j = i - d
+                dense[i * nc:(i + 1) * nc, j * nc:(j + 1) * nc] = self.blocks[i, d]
+                dense[j * nc:(j + 1) * nc, i * nc:(i + 1) * nc] = self.blocks[i, d].T
+        return dense
+
+    def dot(self, x:np.array)->np.array:
+        """
+        Product with vector or matrix of len shape[0]
+        """
+        xb = x.reshape((self.nblocks, self.n_coefs) + x.shape[1:])
+        y = np.zeros(xb.shape)
+        for d in range(self.bandwidth + 1):
+            lower = self.blocks[d:, d]
+            y[d:] += np.einsum('ipq,iq...->ip...', lower, xb[:self.nblocks - d])
+            if d > 0:
+                y[:self.nblocks - d] += np.einsum('ipq,ip...->iq...', lower, xb[d:])
+        return y.reshape(x.shape)
+
+    def cholesky(self)->np.array:
+        """
+        Banded Cholesky factor, lower form, see solve
+        """
+        return cholesky_banded(self.to_banded(), lower=True)
+
+    def lu(self, dense:bool=False)->tuple[str,any]:
+        """
+        LU factor, dense if band covers most of the matrix (band storage of
+        LU is larger than dense matrix then), banded otherwise
+        :param dense: dense factor anyway
+        :return: kind ('lu' or 'lu_banded') and factor
+        """
+        if dense or 2 * self.bandwidth + 1 >= self.nblocks:
+            lu, piv = lu_factor(self.to_dense())
+            if np.any(np.diag(lu) == 0.):
+                raise LinAlgError('Matrix is singular.')
+            return 'lu', (lu, piv)
+        u = (self.bandwidth + 1) * self.n_coefs - 1
+        # LAPACK gbtrf needs u more rows for fill-in
+        lu, ipiv, info = dgbtrf(self.to_full_banded(extra=u), u, u, 
+                                overwrite_ab=True)
+        if info > 0:
+            raise LinAlgError('Matrix is singular.')
+        return 'lu_banded', (lu, ipiv)
+
+    def factorize(self, dense:bool=False)->tuple[str,any]:
+        """
+        Factor of solve, kept until matrix is changed by its methods, so 
+        next right hand sides (e.g. of create_lcp) are solved without 
+        refactoring. Cholesky is used; N of poor data could be only semi
+        definite, then LU is used, as general solver did before.
+        :param dense: factor dense matrix (fast for few bins and coefs), 
+            kept factor is replaced if it is banded
+        :return: kind ('cholesky_banded', 'cholesky', 'lu' or 'lu_banded')
+            and factor
+        """
+        if self.__factor is None or dense and self.__factor[0].endswith('_banded'):
+            try:
+                if dense:
+                    self.__factor = ('cholesky', cho_factor(self.to_dense(), lower=True))
+                else:
+                    self.__factor = ('cholesky_banded', self.cholesky())
+            except LinAlgError as e:
+                self.__factor = self.lu(dense)
+                logger.warning(f'Cholesky failed: {e}, {self.__factor[0]} is used')
+        return self.__factor
+
+    def to_full_banded(self, extra:int=0)->np.array:
+        """
+        Band storage of LAPACK gbsv/gbtrf with equal lower and upper 
+        bandwidth u: ab[extra + u + r - c, c] = N[r, c]
+        :param extra: number of zero rows on top
+        """
+        lower = self.to_banded()
+        u = lower.shape[0] - 1
+        ab = np.zeros((extra + 2 * u + 1, lower.shape[1]))
+        ab[extra + u:] = lower
+        for d in range(1, u + 1):
+            ab[extra + u - d, d:] = lower[d, :-d]
+        return ab
+
+    def solve(self, b:np.array)->np.array:
+        """
+        Solves N x = b by factor of factorize
+        """
+        kind, factor = self.factorize()
+        if kind == 'cholesky_banded':
+            return cho_solve_banded((factor, True), b)
+        if kind == 'cholesky':
+            return cho_solve(factor, b)
+        if kind == 'lu':
+            return lu_solve(factor, b)
+        lu, ipiv = factor
+        u = (lu.shape[0] - 1) // 3
+        x, _ = dgbtrs(lu, u, u, b, ipiv)
+        return x
+
+
+def as_normal_matrix(N:any)->any:
+    """
+    Normal matrix given to or loaded from file: BlockBandedMatrix, its
+    blocks (4-d array) or dense 2-d matrix of old files
+    """
+    if isinstance(N, BlockBandedMatrix):
+        return N
+    N = np.asarray(N)
+    if N.ndim == 4:
+        return BlockBandedMatrix(N)
+    return N
@@ -0,0 +1,81 @@
+import numpy as np
+
+# points per block of iter_basis, block of 15x15 expansion is ~40 Mb
+BASIS_CHUNK = 20000
+
+
+def harmonic_indexes(nbig:int, mbig:int)->tuple[np.array,np.array]:
+    """
+    Degrees M and orders N of real spherical harmonics in order of
+    coefficients: N = 0..nbig, M = -mbig..mbig for each, |M| <= N
+    :param nbig: max order of spherical harmonic expansion
+    :param mbig: max degree of spherical harmonic expansion
+    """
+    n_ind = np.arange(0, nbig + 1, 1)
+    m_ind = np.arange(-mbig, mbig + 1, 1)
+    M, N = np.meshgrid(m_ind, n_ind)
+    idx = np.abs(M) <= N
+    return M[idx], N[idx]
+
+
+def real_basis(M:np.array, N:np.array, theta:np.array, phi:np.array,
+               out:np.array=None)->np.array:
+    """
+    Real spherical harmonics with scipy normalization: Y_n^0 for M = 0,
+    sqrt(2) (-1)^m Re Y_n^m for M > 0 and sqrt(2) (-1)^m Im Y_n^|m| for
+    M < 0, where Y_n^m is scipy.special.sph_harm(m, n, theta, phi).
+    Orthonormal associated Legendre functions are computed with recurrences
+    over n for every m, all points at once.
+    :param M: degrees of harmonics, see harmonic_indexes
+    :param N: orders of harmonics
+    :param theta: LT (longitude) of points in rad
+    :param phi: co latitude of points in rad
+    :param out: array (len(theta), len(M)) to fill
+    :return: basis, row per point, column per harmonic
+    """
+    theta = np.asarray(theta, dtype=float).ravel()
+    phi = np.asarray(phi, dtype=float).ravel()
+    if out is None:
+        out = np.empty((len(theta), len(M)))
+    columns = {(n, m): j for j, (n, m) in enumerate(zip(N, M))}
+    nmax = int(np.max(N))
+    mmax = int(np.max(np.abs(M)))
+    x = np.cos(phi)
+    s = np.sin(phi)
+    pmm = np.full(len(phi), 1. / np.sqrt(4. * np.pi))
+    for m in range(0, mmax + 1):
+        if m > 0:
+            pmm = pmm * s * np.sqrt((2. * m + 1.) / (2. * m))
+            cosm = np.sqrt(2.) * np.cos(m * theta)
+            sinm = np.sqrt(2.) * np.sin(m * theta)
+        p2, p1 = None, None
+        for n in range(m, nmax + 1):
+            if n == m:
+                p = pmm
+            elif n == m + 1:
+                p = x * np.sqrt(2. * m + 3.) * pmm
+            else:
+                a = np.sqrt((4. * n * n - 1.) / (n * n - m * m))
+                b = np.sqrt(((n - 1.) ** 2 - m * m) / (4. * (n - 1.) ** 2 - 1.))
+                p = a * (x * p1 - b * p2)
+            p2, p1 = p1, p
+            if m == 0:
+                if (n, 0) in columns:
+                    out[:, columns[(n, 0)]] = p
+                continue
+            if (n, m) in columns:
+                out[:, columns[(n, m)]] = p * cosm
+            if (n, -m) in columns:
+                out[:, columns[(n, -m)]] = p * sinm
+    return out
+
+
+def iter_basis(M:np.array, N:np.array, theta:np.array, phi:np.array,
+               chunk:int=BASIS_CHUNK):
+    """
+    real_basis by blocks of points, memory is bounded by chunk rows
+    :return: generator of (start, fin, basis of points start:fin)
+    """
+    for start in range(0, len(theta), chunk):
+        fin = min(start + chunk, len(theta))
+        yield start, fin, real_basis(M, N, theta[start:fin], phi[start:fin])
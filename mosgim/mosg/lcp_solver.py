@@ -3,11 +3,16 @@ from loguru import logger
 
 import numpy as np
 import lemkelcp as lcp
-import scipy.special as sp
 from scipy.sparse import csr_matrix
 
 from tqdm import tqdm
 
+from mosgim.mosg.basis import harmonic_indexes, iter_basis
+from mosgim.mosg.banded import BlockBandedMatrix, as_normal_matrix
+
+# columns of G^T solved at once by create_lcp, memory is ~ 8 * n * LCP_BLOCK
+LCP_BLOCK = 1024
+
 
 def logger_configuration() -> None:
     logger.remove()
@@ -32,35 +37,6 @@ class CreateLCP:
         self.__mbig = mbig
         self.__nT = nT
 
-        self.__vcoefs = np.vectorize(self.__calc_coefs, excluded=[
-                                     'M', 'N'], otypes=[np.ndarray])
-
-    def __calc_coefs(self, M:np.array, N:np.array, theta:np.array, phi:np.array)->np.array:
-        """
-        Parameters
-        ----------
-        M
-            Meshgrid of harmonics degrees
-        N
-            Meshgrid of harmonics orders
-        theta
-            Array of LTs of IPPs in rads
-        phi
-            Array of co latitudes of IPPs in rads
-        """
-        n_coefs = len(M)
-        a = np.zeros(n_coefs)
-
-        # complex harmonics on meshgrid
-        Ymn = sp.sph_harm(np.abs(M), N, theta, phi)
-
-        #  introducing real basis according to scipy normalization
-        a[M < 0] = Ymn[M < 0].imag * np.sqrt(2) * (-1.) ** M[M < 0]
-        a[M > 0] = Ymn[M > 0].real * np.sqrt(2) * (-1.) ** M[M > 0]
-        a[M == 0] = Ymn[M == 0].real
-
-        return a
-
     def construct(self, theta:np.array, phi:np.array, timeindex:int)->csr_matrix:
         """
         Parameters
@@ -74,28 +50,24 @@ class CreateLCP:
         """
 
         # Construct matrix of the problem (A)
-        n_ind = np.arange(0, self.__nbig + 1, 1)
-        m_ind = np.arange(-self.__mbig, self.__mbig + 1, 1)
-        M, N = np.meshgrid(m_ind, n_ind)
-        Y = sp.sph_harm(np.abs(M), N, 0, 0)
-        idx = np.isfinite(Y)
-        M = M[idx]
-        N = N[idx]
+        M, N = harmonic_indexes(self.__nbig, self.__mbig)
         n_coefs = len(M)
 
         len_rhs = len(phi)
 
-        a = self.__vcoefs(M=M, N=N, theta=theta, phi=phi)
+        # prepare (A) in csr sparse format, basis is written to data by
+        # blocks of points, no full size copy of it is made
+        data = np.empty(len_rhs * n_coefs)
+        rows = data.reshape(len_rhs, n_coefs)
+        for start, fin, a in iter_basis(M, N, theta, phi):
+            rows[start:fin] = a
 
         logger.info(f"coefs done {n_coefs}")
 
-        # prepare (A) in csr sparse format
-        data = np.empty(len_rhs * n_coefs)
         rowi = np.empty(len_rhs * n_coefs)
         coli = np.empty(len_rhs * n_coefs)
 
         for i in tqdm(range(0, len_rhs, 1)):
-            data[i * n_coefs: (i + 1) * n_coefs] = a[i]
             rowi[i * n_coefs: (i + 1) * n_coefs] = i * \
                 np.ones(n_coefs).astype('int32')
 
@@ -130,7 +102,7 @@ def create_lcp(data:dict[str,np.array])->np.array:
     )
 
 
-    Ninv = np.linalg.inv(data['N'])
+    N = as_normal_matrix(data['N'])
     w = G.dot(data['res'])
     idx = (w < 0)
 
@@ -139,13 +111,23 @@ def create_lcp(data:dict[str,np.array])->np.array:
 
     logger.info("constructing M")
 
-    NGT = Ninv * Gnew.transpose()
-    M = Gnew.dot(NGT)
+    if isinstance(N, BlockBandedMatrix):
+        # factor of weights solve (banded or dense Cholesky, LU) is kept 
+        # by N and reused, N is not inverted
+        solve = N.solve
+    else:
+        Ninv = np.linalg.inv(N)
+        solve = Ninv.dot
+    # M = G N^-1 G^T by blocks of columns, dense N^-1 G^T is not kept
+    M = np.empty((Gnew.shape[0], Gnew.shape[0]))
+    for start in range(0, Gnew.shape[0], LCP_BLOCK):
+        cols = slice(start, start + LCP_BLOCK)
+        M[:, cols] = Gnew.dot(solve(Gnew[cols].transpose().toarray()))
 
     sol = lcp.lemkelcp(M, wnew, 10000)
     if sol[0] is None:
         print(sol)
-    c = data['res'] + NGT.dot(sol[0])
+    c = data['res'] + solve(Gnew.transpose().dot(sol[0]))
     w = G.dot(c)
     return c
 
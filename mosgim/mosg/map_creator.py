@@ -1,18 +1,19 @@
 import numpy as np
-import scipy.special as sp
 import concurrent.futures
 import itertools
 import datetime
 import gc
 
-from scipy.linalg import solve
-from scipy.sparse import lil_matrix, csr_matrix
 from pathlib import Path
 from concurrent.futures import ProcessPoolExecutor
 
 from mosgim.geo import geo2mag
 from mosgim.geo import geo2modip
 from mosgim.data import MagneticCoordType
+from mosgim.mosg.basis import harmonic_indexes, real_basis, iter_basis
+from mosgim.mosg.banded import BlockBandedMatrix
+from mosgim.mosg.solvers import (SOLVERS, WeightedDesign, solve_design,
+                                 solve_normal_system)
 
 RE = 6371200.
 IPPh = 450000.
@@ -32,31 +33,106 @@ def MF(el:float)->float:
     return 1./np.sqrt(1 - (RE * np.cos(el) / (RE + IPPh)) ** 2)
  
 
-def calc_coefs(M:np.array, N:np.array, theta:list[float], phi:float, sf:float)->np.array:
+def time_bins(time:np.array, nT:int, ndays:int)->np.array:
     """
-    :param M: meshgrid of harmonics degrees
-    :param N: meshgrid of harmonics orders
-    :param theta: LT of IPP in rad
-    :param phi: co latitude of IPP in rad
-    :param sf: slant factor
+    :param time: times in secs
+    :return: index of time interval of every time
     """
+    return (time * nT / (ndays * 86400.)).astype('int16')
+
+
+def normal_bandwidth(time_chunks:list[np.array], time_ref_chunks:list[np.array],
+                     iref_chunks:list[np.array], nT:int, ndays:int, 
+                     linear:bool)->int:
+    """
+    Number of off-diagonal blocks of normal matrix: observation and its
+    reference couple bins as far as the longest arc, linear maps add one
+    more, frozen constraints couple neighbour bins
+    """
+    bandwidth = 1
+    for time, time_ref, iref in zip(time_chunks, time_ref_chunks, iref_chunks):
+        if len(time) == 0:
+            continue
+        if iref is None:
+            iref = np.arange(len(time))
+        tic = time_bins(time, nT, ndays).astype(int)
+        tir = time_bins(time_ref[iref], nT, ndays).astype(int)
+        bandwidth = max(bandwidth, int(np.max(np.abs(tic - tir))) + int(linear))
+    return bandwidth
+
+
+def scaled_basis(M:np.array, N:np.array, theta:np.array, phi:np.array, 
+                 scale:np.array)->np.array:
+    """
+    Basis of points (see real_basis) multiplied by scale of every point, 
+    filled by blocks of iter_basis, so no full size temporary is made
+    """
+    out = np.empty((len(theta), len(M)))
+    for start, fin, basis in iter_basis(M, N, theta, phi):
+        out[start:fin] = basis * scale[start:fin, np.newaxis]
+    return out
+
+
+def design_terms(nbig:int, mbig:int, nT:int, ndays:int, 
+                 time:np.array, theta:np.array, phi:np.array, el:np.array, 
+                 time_ref:np.array, theta_ref:np.array, phi_ref:np.array, 
+                 el_ref:np.array, linear:bool, 
+                 iref:np.array=None)->tuple[list[tuple],np.array]:
+    """
+    Rows of design matrix A without forming it, parameters are as of 
+    construct_normal_system
+    :return: terms (time bin of every row, factor of every row, basis 
+        rows), row of A is sum of factor * basis placed to bin block, and
+        diagonal of weights P
+    """
+    if iref is None:
+        iref = np.arange(len(time))
+    tmc = time
+    # references are processed once and broadcast to their observations
+    tmr = time_ref[iref]
+    SF = MF(el)
+    SF_ref = MF(el_ref)
+ 
+    # Weights of the observations, diagonal of P
+    len_rhs = len(time)
+    el_sin = np.sin(el)
+    elr_sin = np.sin(el_ref)[iref]
+    diagP = (el_sin ** 2) * (elr_sin ** 2) / (el_sin ** 2 + elr_sin **2)
+ 
+    # Basis of the problem, A is not formed
+    M, N = harmonic_indexes(nbig, mbig)
     n_coefs = len(M)
-    a = np.zeros(n_coefs)
-    Ymn = sp.sph_harm(np.abs(M), N, theta, phi)  # complex harmonics on meshgrid
-    #  introducing real basis according to scipy normalization
-    a[M < 0] = Ymn[M < 0].imag * np.sqrt(2) * (-1.) ** M[M < 0]
-    a[M > 0] = Ymn[M > 0].real * np.sqrt(2) * (-1.) ** M[M > 0]
-    a[M == 0] = Ymn[M == 0].real
-    del Ymn
-    return a*sf
-vcoefs = np.vectorize(calc_coefs, excluded=['M','N'], otypes=[np.ndarray])
  
+    tic = time_bins(tmc, nT, ndays)
+    tir = time_bins(tmr, nT, ndays)
+
+    ac = scaled_basis(M, N, theta, phi, SF)
+    ar = scaled_basis(M, N, theta_ref, phi_ref, SF_ref)[iref]
+    print('coefs done', n_coefs, nT, ndays, len_rhs)
+
+    # row of A is sum of terms: factor * basis row put to time bin block
+    if linear:
+        hour_cc = (ndays * 86400.) * tic / nT    
+        hour_cn = (ndays * 86400.) * (tic + 1) / nT    
+        hour_rc = (ndays * 86400.) * tir / nT    
+        hour_rn = (ndays * 86400.) * (tir + 1) / nT  
+        dt = (ndays * 86400.) / nT 
+        terms = [(tic, (  tmc - hour_cc) / dt, ac),
+                 (tic + 1, ( -tmc + hour_cn) / dt, ac),
+                 (tir, - (  tmr - hour_rc) / dt, ar),
+                 (tir + 1, - ( -tmr + hour_rn) / dt, ar)]
+    else:
+        terms = [(tic, np.ones(len_rhs), ac),
+                 (tir, -np.ones(len_rhs), ar)]
+ 
+    return terms, diagP
 
 
 def construct_normal_system(nbig:int, mbig:int, nT:int, ndays:int, 
                             time:list[datetime.time], theta:list[float], phi:list[float], el:list[float], 
                             time_ref:list[datetime.time], theta_ref:list[float], phi_ref:list[float], 
-                            el_ref:list[float], rhs:list[float],linear:bool)->tuple[any,any]:
+                            el_ref:list[float], rhs:list[float],linear:bool, 
+                            iref:np.array=None, bandwidth:int=None)->tuple[any,any]:
     """
     :param nbig: maximum order of spherical harmonic
     :param mbig: maximum degree of spherical harmonic
@@ -72,117 +148,109 @@ def construct_normal_system(nbig:int, mbig:int, nT:int, ndays:int,
     :param el_ref: array of ref elevation angles in rads
     :param rhs: array of rhs (measurements TEC difference on current and ref rays)
     :param linear: bool defines const or linear
+    :param iref: index of reference of every observation, ref arrays are 
+        given per observation if None
+    :param bandwidth: off-diagonal blocks of N, from the data if None, 
+        see normal_bandwidth
+    :return: N as BlockBandedMatrix and b
     """
     print('constructing normal system for series')
-    tmc = time
-    tmr = time_ref
-    SF = MF(el)
-    SF_ref = MF(el_ref)
- 
-    # Construct weight matrix for the observations
-    len_rhs = len(rhs)
-    P = lil_matrix((len_rhs, len_rhs))
-    el_sin = np.sin(el)
-    elr_sin = np.sin(el_ref)
-    diagP = (el_sin ** 2) * (elr_sin ** 2) / (el_sin ** 2 + elr_sin **2)
-    P.setdiag(diagP)
-    P = P.tocsr()
- 
-    # Construct matrix of the problem (A)
-    n_ind = np.arange(0, nbig + 1, 1)
-    m_ind = np.arange(-mbig, mbig + 1, 1)
-    M, N = np.meshgrid(m_ind, n_ind)
-    Y = sp.sph_harm(np.abs(M), N, 0, 0)
-    idx = np.isfinite(Y)
-    M = M[idx]
-    N = N[idx]
-    n_coefs = len(M)
- 
-    tic = (tmc * nT / (ndays * 86400.)).astype('int16')
-    tir = (tmr * nT / (ndays * 86400.)).astype('int16')
-
-    ac = vcoefs(M=M, N=N, theta=theta, phi=phi, sf=SF)
-    ar = vcoefs(M=M, N=N, theta=theta_ref, phi=phi_ref, sf=SF_ref)
-    print('coefs done', n_coefs, nT, ndays, len_rhs)
-
-    #prepare (A) in csr sparse format
-    dims = 4 if linear else 2
+    terms, diagP = design_terms(nbig, mbig, nT, ndays, time, theta, phi, el, 
+                                time_ref, theta_ref, phi_ref, el_ref, linear, 
+                                iref)
+    n_coefs = terms[0][2].shape[1]
     nT_add = 1 if linear else 0
-    data = np.empty(len_rhs * n_coefs * dims)
-    rowi = np.empty(len_rhs * n_coefs * dims)
-    coli = np.empty(len_rhs * n_coefs * dims)
-    
-    if linear:
-        hour_cc = (ndays * 86400.) * tic / nT    
-        hour_cn = (ndays * 86400.) * (tic + 1) / nT    
-        hour_rc = (ndays * 86400.) * tir / nT    
-        hour_rn = (ndays * 86400.) * (tir + 1) / nT  
-        dt = (ndays * 86400.) / nT 
-        for i in range(0, len_rhs, 1): 
-            st  = [i * n_coefs * 4 + j * n_coefs for j in range(0, 4)]
-            end = [i * n_coefs * 4 + j * n_coefs for j in range(1, 5)]
-            data[st[0]: end[0]] =   (  tmc[i] - hour_cc[i]) * ac[i] / dt
-            data[st[1]: end[1]] =   ( -tmc[i] + hour_cn[i]) * ac[i] / dt
-            data[st[2]: end[2]] = - (  tmr[i] - hour_rc[i]) * ar[i] / dt
-            data[st[3]: end[3]] = - ( -tmr[i] + hour_rn[i]) * ar[i] / dt
-
-            rowi[st[0]: end[-1]] = i * np.ones(n_coefs * 4).astype('int32')
-            
-            coli[st[0]: end[0]] = \
-                np.arange((tic[i] + 0) * n_coefs, (tic[i] + 1) * n_coefs, 1).astype('int32')
-            coli[st[1]: end[1]] = \
-                np.arange((tic[i] + 1) * n_coefs, (tic[i] + 2) * n_coefs, 1).astype('int32')
-            coli[st[2]: end[2]] = \
-                np.arange((tir[i] + 0) * n_coefs, (tir[i] + 1) * n_coefs, 1).astype('int32')
-            coli[st[3]: end[3]] = \
-                np.arange((tir[i] + 1) * n_coefs, (tir[i] + 2) * n_coefs, 1).astype('int32')
-    else:
-        for i in range(0, len_rhs, 1): 
-            st  = [i * n_coefs * 2 + j * n_coefs for j in range(0, 2)]
-            end = [i * n_coefs * 2 + j * n_coefs for j in range(1, 3)]
-            data[st[0]: end[0]] =  ac[i]
-            data[st[1]: end[1]] = -ar[i]
-            
-            rowi[st[0]: end[-1]] = i * np.ones(n_coefs * 2).astype('int32')
-            
-            coli[st[0]: end[0]] = \
-                np.arange(tic[i] * n_coefs, (tic[i] + 1) * n_coefs, 1).astype('int32')
-            coli[st[1]: end[1]] = \
-                np.arange(tir[i] * n_coefs, (tir[i] + 1) * n_coefs, 1).astype('int32')
-
-    A = csr_matrix((data, (rowi, coli)), 
-                   shape=(len_rhs, (nT + nT_add) * n_coefs))
-    print('matrix (A) for subset done')
  
     # define normal system
-    AP = A.transpose().dot(P)
-    N = AP.dot(A).todense()    
-    b = AP.dot(rhs)
+    if bandwidth is None:
+        tmr = time_ref if iref is None else time_ref[iref]
+        bandwidth = normal_bandwidth([time], [tmr], [None], nT, ndays, linear)
+    N = BlockBandedMatrix.zeros(nT + nT_add, n_coefs, bandwidth)
+    b = np.zeros((nT + nT_add) * n_coefs)
+    accumulate_normal_system(N, b, terms, diagP, rhs, n_coefs)
     print('normal matrix (N) for subset done')
 
     return N, b
 
 
+def accumulate_normal_system(N:BlockBandedMatrix, b:np.array, terms:list[tuple], 
+                             weights:np.array, rhs:np.array, n_coefs:int,
+                             rows_per_product:int=8192):
+    """
+    Adds A^T P A to N and A^T P rhs to b without forming A. Rows with the 
+    same time bins of all terms (same pair of observation and reference 
+    bins) are grouped, every group adds dense products of its weighted
+    basis rows to blocks of N.
+    :param terms: (time bin of every row, factor of every row, basis 
+        rows), row of A is sum of factor * basis placed to bin block
+    :param weights: diagonal of P
+    """
+    bins = np.stack([block for block, _, _ in terms])
+    group_bins, groups = np.unique(bins, axis=1, return_inverse=True)
+    groups = groups.ravel()
+    order = np.argsort(groups, kind='stable')
+    bounds = np.searchsorted(groups[order], np.arange(group_bins.shape[1] + 1))
+    sqrt_w = np.sqrt(weights)
+    cols = [slice(k * n_coefs, (k + 1) * n_coefs) for k in range(len(terms))]
+    for g in range(group_bins.shape[1]):
+        blocks = group_bins[:, g]
+        for start in range(bounds[g], bounds[g + 1], rows_per_product):
+            rows = order[start: min(start + rows_per_product, bounds[g + 1])]
+            # weighted rows of A restricted to blocks of the group
+            sub = np.hstack([(factor[rows] * sqrt_w[rows])[:, np.newaxis] * basis[rows]
+                             for _, factor, basis in terms])
+            NN = sub.T.dot(sub)
+            bb = sub.T.dot(sqrt_w[rows] * rhs[rows])
+            for j, bj in enumerate(blocks):
+                b[bj * n_coefs: (bj + 1) * n_coefs] += bb[cols[j]]
+                for k, bk in enumerate(blocks):
+                    # upper blocks are transposes of lower ones
+                    if bj >= bk:
+                        N.add(bj, bk, NN[cols[j], cols[k]])
+
+
 
 def stack_weight_solve_ns(nbig:int, mbig:int, nT:int, ndays:int,
                           time_chunks, mlt_chunks, mcolat_chunks, el_chunks, 
                           time_ref_chunks, mlt_ref_chunks, mcolat_ref_chunks, el_ref_chunks, 
                           rhs_chunks,
                           nworkers=3, 
-                          linear:bool=True)->tuple[any,any]:
-
+                          linear:bool=True,
+                          iref_chunks=None,
+                          solver:str='banded')->tuple[any,any]:
+    """
+    :param solver: one of SOLVERS, see solve_normal_system, lsqr does not 
+        form N and returns None instead
+    """
+    if not solver in SOLVERS:
+        raise ValueError(f'Unknown solver {solver}, use one of {SOLVERS}')
     nT_add = 1 if linear else 0
     n_coefs = (nbig + 1)**2 - (nbig - mbig) * (nbig - mbig + 1)
-    N = np.zeros((n_coefs * (nT + nT_add), n_coefs * (nT + nT_add)))
+    if iref_chunks is None:
+        iref_chunks = [None] * len(rhs_chunks)
+    if solver == 'lsqr':
+        return stack_weight_solve_design(nbig, mbig, nT, ndays, time_chunks, 
+                                         mlt_chunks, mcolat_chunks, el_chunks, 
+                                         time_ref_chunks, mlt_ref_chunks, 
+                                         mcolat_ref_chunks, el_ref_chunks, 
+                                         rhs_chunks, nworkers=nworkers, 
+                                         linear=linear, 
+                                         iref_chunks=iref_chunks)
+    # N is block banded, bandwidth is common for all chunks
+    bandwidth = normal_bandwidth(time_chunks, time_ref_chunks, iref_chunks,
+                                 nT, ndays, linear)
+    N = BlockBandedMatrix.zeros(nT + nT_add, n_coefs, bandwidth)
     b = np.zeros(n_coefs * (nT + nT_add))
     
     chunks_processed = []
     with ProcessPoolExecutor(max_workers=nworkers) as executor:
         queue = []
-        for chunk  in zip(time_chunks, mlt_chunks, mcolat_chunks, el_chunks, 
-                          time_ref_chunks, mlt_ref_chunks, mcolat_ref_chunks,
-                          el_ref_chunks, rhs_chunks):
-            params = (nbig, mbig, nT, ndays) + chunk + (linear, )
+        chunks = zip(time_chunks, mlt_chunks, mcolat_chunks, el_chunks, 
+                     time_ref_chunks, mlt_ref_chunks, mcolat_ref_chunks,
+                     el_ref_chunks, rhs_chunks)
+        for chunk, iref_chunk in zip(chunks, iref_chunks):
+            params = (nbig, mbig, nT, ndays) + chunk + (linear, iref_chunk, 
+                                                        N.bandwidth)
             query = executor.submit(construct_normal_system, *params)
             queue.append(query)
         for v in concurrent.futures.as_completed(queue):
@@ -190,25 +258,60 @@ def stack_weight_solve_ns(nbig:int, mbig:int, nT:int, ndays:int,
             N += NN
             b += bb
 
-    print('normal matrix (N) stacked')
-
+    print(f'normal matrix (N) stacked, bandwidth {N.bandwidth} blocks')
 
     # imposing frozen conditions on consequitive maps coeffs
-    for ii in range(0, nT - 1 + nT_add, 1):
-        for kk in range(0, n_coefs):
-            N[ii*n_coefs + kk, ii*n_coefs + kk] += (sigma0 / sigma_v)**2
-            N[(ii + 1) * n_coefs + kk, (ii+1) * n_coefs + kk] += (sigma0 / sigma_v)**2
-            N[(ii + 1) * n_coefs + kk, ii * n_coefs + kk] += -(sigma0 / sigma_v)**2
-            N[ii * n_coefs + kk, (ii + 1) * n_coefs + kk] += -(sigma0 / sigma_v)**2
+    N.add_frozen_constraints((sigma0 / sigma_v)**2)
     print('normal matrix (N) constraints added')
 
-    # # solve normal system
-    res1 = solve(N, b)  
+    # # solve normal system, N is symmetric positive definite
+    res1, _ = solve_normal_system(N, b, solver)
     print('normal system solved')
     
     return res1, N
 
-def solve_weights(data:dict[str,np.array], gigs:int=2, nworkers:int=3, linear:bool=True)->tuple:
+
+def stack_weight_solve_design(nbig:int, mbig:int, nT:int, ndays:int,
+                              time_chunks, mlt_chunks, mcolat_chunks, el_chunks, 
+                              time_ref_chunks, mlt_ref_chunks, mcolat_ref_chunks, 
+                              el_ref_chunks, rhs_chunks,
+                              nworkers=3, 
+                              linear:bool=True,
+                              iref_chunks=None)->tuple[any,any]:
+    """
+    Same as stack_weight_solve_ns, but weighted A of all chunks is 
+    solved by LSQR, N is not formed
+    :return: solution and None instead of N
+    """
+    nT_add = 1 if linear else 0
+    n_coefs = (nbig + 1)**2 - (nbig - mbig) * (nbig - mbig + 1)
+    if iref_chunks is None:
+        iref_chunks = [None] * len(rhs_chunks)
+    design = WeightedDesign(nT + nT_add, n_coefs, (sigma0 / sigma_v)**2)
+    with ProcessPoolExecutor(max_workers=nworkers) as executor:
+        queue = {}
+        chunks = zip(time_chunks, mlt_chunks, mcolat_chunks, el_chunks, 
+                     time_ref_chunks, mlt_ref_chunks, mcolat_ref_chunks,
+                     el_ref_chunks)
+        for chunk, iref_chunk, rhs_chunk in zip(chunks, iref_chunks, rhs_chunks):
+            params = (nbig, mbig, nT, ndays) + chunk + (linear, iref_chunk)
+            query = executor.submit(design_terms, *params)
+            queue[query] = rhs_chunk
+        for v in concurrent.futures.as_completed(queue):
+            terms, diagP = v.result()
+            design.add(terms, diagP, queue[v])
+
+    print(f'weighted design stacked, {design.shape[0]} rows')
+    res1, _ = solve_design(design)
+    print('weighted design solved')
+
+    return res1, None
+
+def solve_weights(data:dict[str,np.array], gigs:int=2, nworkers:int=3, linear:bool=True,
+                  solver:str='banded')->tuple:
+    """
+    :param solver: one of SOLVERS, see stack_weight_solve_ns
+    """
     chunk_size = GB_CHUNK * gigs
     time = data['time']
     mlt = data['mlt']
@@ -219,6 +322,8 @@ def solve_weights(data:dict[str,np.array], gigs:int=2, nworkers:int=3, linear:bo
     mcolat_ref = data['mcolat_ref']
     el_ref = data['el_ref']
     rhs = data['rhs']
+    # old prepared files keep reference for every observation
+    iref = data['iref'] if 'iref' in data else np.arange(len(rhs))
 
     nchunks = np.int(len(rhs) / chunk_size) # set chuncks size to fit in memory ~4Gb
     nchunks = 1 if nchunks < 1 else nchunks
@@ -230,38 +335,34 @@ def solve_weights(data:dict[str,np.array], gigs:int=2, nworkers:int=3, linear:bo
     mlt_chunks = np.array_split(mlt, nchunks)
     mcolat_chunks = np.array_split(mcolat, nchunks)
     el_chunks = np.array_split(el, nchunks)
-    time_ref_chunks = np.array_split(time_ref, nchunks)
-    mlt_ref_chunks = np.array_split(mlt_ref, nchunks)
-    mcolat_ref_chunks = np.array_split(mcolat_ref, nchunks)
-    el_ref_chunks = np.array_split(el_ref, nchunks)
     rhs_chunks = np.array_split(rhs, nchunks)
+    # every chunk takes references of its observations, iref is relative 
+    # to them
+    iref_chunks = []
+    ref_slices = []
+    for iref_chunk in np.array_split(iref, nchunks):
+        first = iref_chunk.min() if len(iref_chunk) else 0
+        last = iref_chunk.max() + 1 if len(iref_chunk) else 0
+        ref_slices.append(slice(first, last))
+        iref_chunks.append(iref_chunk - first)
+    time_ref_chunks = [time_ref[s] for s in ref_slices]
+    mlt_ref_chunks = [mlt_ref[s] for s in ref_slices]
+    mcolat_ref_chunks = [mcolat_ref[s] for s in ref_slices]
+    el_ref_chunks = [el_ref[s] for s in ref_slices]
 
     res, N = stack_weight_solve_ns(nbig, mbig, nT, ndays, time_chunks, 
                                    mlt_chunks, mcolat_chunks, el_chunks, 
                                    time_ref_chunks, mlt_ref_chunks, 
                                    mcolat_ref_chunks, el_ref_chunks, rhs_chunks,
                                    nworkers=nworkers,
-                                   linear=linear) 
+                                   linear=linear,
+                                   iref_chunks=iref_chunks,
+                                   solver=solver) 
     return res, N
 
 def make_matrix(nbig:np.array, mbig:np.array, theta:np.array, phi:np.array)->np.array:
-    n_ind = np.arange(0, nbig + 1, 1)
-    m_ind = np.arange(-mbig, mbig + 1, 1)
-    M, N = np.meshgrid(m_ind, n_ind)
-    Y = sp.sph_harm(np.abs(M), N, 0, 0)
-    idx = np.isfinite(Y)
-    M = M[idx]
-    N = N[idx]
-    n_coefs = len(M)
-    matrix = np.zeros((len(theta), n_coefs))
-    for i in range(0, len(theta), 1):
-        Ymn = sp.sph_harm(np.abs(M), N, theta[i], phi[i])
-        a = np.zeros(len(Ymn))
-        a[M < 0] = Ymn[M < 0].imag * np.sqrt(2) * (-1.) ** M[M < 0]
-        a[M > 0] = Ymn[M > 0].real * np.sqrt(2) * (-1.) ** M[M > 0]
-        a[M == 0] = Ymn[M == 0].real
-        matrix[i, :] = a[:]
-    return matrix
+    M, N = harmonic_indexes(nbig, mbig)
+    return real_basis(M, N, theta, phi)
 
 
 def calculate_maps(res:np.array, mag_type:str, date:datetime.date, **kwargs)->dict[str,np.array]:
@@ -291,10 +392,14 @@ def calculate_maps(res:np.array, mag_type:str, date:datetime.date, **kwargs)->di
                                 map_time)
         else:
             raise ValueError('Unknow magnetic coord type')
-        Atest = make_matrix(nbig, mbig, mt, mcolat)
-        map_cells = len(Atest[0])
+        M, N = harmonic_indexes(nbig, mbig)
+        map_cells = len(M)
         time_slice = res[k*map_cells: (k+1)*map_cells]
-        Z1 = np.dot(Atest, time_slice).reshape(len(colat), len(lon))
+        # map is evaluated by blocks of grid points, see iter_basis
+        Z1 = np.empty(len(mt))
+        for start, fin, Atest in iter_basis(M, N, mt, mcolat):
+            Z1[start:fin] = np.dot(Atest, time_slice)
+        Z1 = Z1.reshape(len(colat), len(lon))
         maps['time' + str(k).zfill(2)] = Z1
     return maps
     
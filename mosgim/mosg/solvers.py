@@ -0,0 +1,186 @@
+import time
+import numpy as np
+
+from scipy.sparse.linalg import LinearOperator, cg, lsqr
+
+from mosgim.mosg.banded import BlockBandedMatrix
+
+# solvers of weight system, see solve_normal_system and solve_design
+SOLVERS = ('banded', 'cholesky', 'pcg', 'lsqr')
+# relative tolerance and iterations limit of pcg and lsqr, N of poor data
+# could be only semi definite, then they converge slowly
+SOLVER_TOL = 1e-10
+SOLVER_MAXITER = 1000
+
+
+def residual_norm(N:BlockBandedMatrix, b:np.array, x:np.array)->float:
+    """
+    Relative residual |N x - b| / |b| of normal system
+    """
+    norm = np.linalg.norm(b)
+    return np.linalg.norm(N.dot(x) - b) / (norm if norm > 0 else 1.)
+
+
+def print_report(report:dict[str,any]):
+    print(f"{report['solver']} solver: {report['iterations']} iterations, "
+          f"residual {report['residual']:.3e}, takes {report['time']}")
+
+
+def solve_normal_system(N:BlockBandedMatrix, b:np.array, solver:str='banded',
+                        tol:float=SOLVER_TOL,
+                        maxiter:int=SOLVER_MAXITER)->tuple[np.array,dict]:
+    """
+    Solves N x = b by one of solvers:
+        banded - banded Cholesky of N (LU if N is only semi definite, see
+            BlockBandedMatrix.factorize), memory is linear in time bins
+        cholesky - Cholesky of dense N (LU if N is only semi definite), 
+            fast for few bins and coefs
+        pcg - conjugate gradient with block Jacobi preconditioner (inverse
+            of diagonal block of every time bin), N is only multiplied
+    :param tol: relative tolerance of pcg
+    :param maxiter: iterations limit of pcg, scipy default 10 n if None
+    :return: solution and report: solver, time, iterations, relative
+        residual, kind of factor (N keeps factor for next right hand
+        sides, see BlockBandedMatrix.factorize) and info of pcg
+    """
+    st = time.time()
+    report = {'solver': solver, 'iterations': 0, 'factor': None, 'info': 0}
+    if solver in ('banded', 'cholesky'):
+        # factor is kept by N, next solves (e.g. of create_lcp) reuse it
+        report['factor'] = N.factorize(dense=solver == 'cholesky')[0]
+        x = N.solve(b)
+    elif solver == 'pcg':
+        x, report['iterations'], report['info'] = _pcg(N, b, tol, maxiter)
+        if report['info'] > 0:
+            print(f'pcg did not converge in {report["iterations"]} iterations')
+    else:
+        raise ValueError(f'Unknown solver {solver} of normal system, use one of {SOLVERS[:-1]}')
+    report['time'] = time.time() - st
+    report['residual'] = residual_norm(N, b, x)
+    print_report(report)
+    return x, report
+
+
+def _pcg(N:BlockBandedMatrix, b:np.array, tol:float,
+         maxiter:int)->tuple[np.array,int,int]:
+    nb, nc = N.nblocks, N.n_coefs
+    # diagonal blocks contain frozen constraints, so they are invertible
+    inverse = np.linalg.inv(N.diagonal_blocks())
+
+    def precondition(r):
+        return np.einsum('ipq,iq->ip', inverse, r.reshape(nb, nc)).ravel()
+
+    iterations = [0]
+
+    def count(xk):
+        iterations[0] += 1
+
+    A = LinearOperator(N.shape, matvec=N.dot, dtype=float)
+    M = LinearOperator(N.shape, matvec=precondition, dtype=float)
+    x, info = cg(A, b, tol=tol, atol=0., maxiter=maxiter, M=M, callback=count)
+    return x, iterations[0], info
+
+
+class WeightedDesign():
+    """
+    Matrix free sqrt(P) A of observations and rows of frozen constraints,
+    normal matrix of it is N of construct_normal_system with constraints.
+    Rows with the same time bins of all terms are grouped (as in
+    accumulate_normal_system) and stored contiguously, so products are
+    dense products of basis blocks. Basis rows of all observations are
+    kept, memory is ~ 16 * n_coefs bytes per observation.
+    """
+
+    def __init__(self, nblocks:int, n_coefs:int, constraint_weight:float):
+        """
+        :param nblocks: number of time bins of maps
+        :param constraint_weight: weight of (x_i - x_{i+1})^2 constraints
+        """
+        self.nblocks = nblocks
+        self.n_coefs = n_coefs
+        self.constraint_weight = constraint_weight
+        self.groups = []
+        self.rhs_chunks = []
+        self.nobs = 0
+
+    def add(self, terms:list[tuple], weights:np.array, rhs:np.array):
+        """
+        Adds observations given as terms of construct_normal_system
+        :param terms: (time bin of every row, factor of every row, basis
+            rows), row of A is sum of factor * basis placed to bin block
+        :param weights: diagonal of P
+        """
+        bins = np.stack([block for block, _, _ in terms])
+        group_bins, groups = np.unique(bins, axis=1, return_inverse=True)
+        groups = groups.ravel()
+        order = np.argsort(groups, kind='stable')
+        bounds = np.searchsorted(groups[order], np.arange(group_bins.shape[1] + 1))
+        sqrt_w = np.sqrt(weights)
+        # terms share basis arrays, every array is reordered once
+        bases = {}
+        for _, _, basis in terms:
+            if not id(basis) in bases:
+                bases[id(basis)] = basis[order]
+        factors = [(factor * sqrt_w)[order] for _, factor, _ in terms]
+        for g in range(group_bins.shape[1]):
+            rows = slice(bounds[g], bounds[g + 1])
+            self.groups.append((self.nobs + bounds[g], self.nobs + bounds[g + 1],
+                                group_bins[:, g].astype(int),
+                                [factor[rows] for factor in factors],
+                                [bases[id(basis)][rows] for _, _, basis in terms]))
+        self.rhs_chunks.append((sqrt_w * rhs)[order])
+        self.nobs += len(rhs)
+
+    @property
+    def shape(self)->tuple[int,int]:
+        ncons = max(self.nblocks - 1, 0) * self.n_coefs
+        return (self.nobs + ncons, self.nblocks * self.n_coefs)
+
+    def rhs(self)->np.array:
+        return np.concatenate(self.rhs_chunks + [np.zeros(self.shape[0] - self.nobs)])
+
+    def matvec(self, x:np.array)->np.array:
+        X = x.reshape(self.nblocks, self.n_coefs)
+        y = np.zeros(self.shape[0])
+        for start, fin, bins, factors, bases in self.groups:
+            for k, factor, basis in zip(bins, factors, bases):
+                y[start:fin] += factor * basis.dot(X[k])
+        y[self.nobs:] = np.sqrt(self.constraint_weight) * (X[:-1] - X[1:]).ravel()
+        return y
+
+    def rmatvec(self, y:np.array)->np.array:
+        X = np.zeros((self.nblocks, self.n_coefs))
+        for start, fin, bins, factors, bases in self.groups:
+            for k, factor, basis in zip(bins, factors, bases):
+                X[k] += basis.T.dot(factor * y[start:fin])
+        cons = np.sqrt(self.constraint_weight) * y[self.nobs:].reshape(-1, self.n_coefs)
+        X[:-1] += cons
+        X[1:] -= cons
+        return X.ravel()
+
+    def operator(self)->LinearOperator:
+        return LinearOperator(self.shape, matvec=self.matvec,
+                              rmatvec=self.rmatvec, dtype=float)
+
+
+def solve_design(design:WeightedDesign, tol:float=SOLVER_TOL,
+                 maxiter:int=SOLVER_MAXITER)->tuple[np.array,dict]:
+    """
+    Solves least squares of weighted design by LSQR, N is not formed.
+    Residual is relative residual of normal system |A^T (Ax - rhs)| / |A^T rhs|
+    :param tol: atol and btol of lsqr
+    :param maxiter: iterations limit, scipy default 2 n if None
+    :return: solution and report as of solve_normal_system
+    """
+    st = time.time()
+    rhs = design.rhs()
+    x, istop, itn, r1norm, _, _, _, arnorm = lsqr(design.operator(), rhs,
+                                                   atol=tol, btol=tol,
+                                                   iter_lim=maxiter)[:8]
+    norm = np.linalg.norm(design.rmatvec(rhs))
+    report = {'solver': 'lsqr', 'iterations': itn, 'factor': None,
+              'info': istop, 'time': time.time() - st,
+              'residual': arnorm / (norm if norm > 0 else 1.),
+              'lsq_residual': r1norm}
+    print_report(report)
+    return x, report
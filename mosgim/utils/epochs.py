@@ -0,0 +1,71 @@
+import numpy as np
+
+from mosgim.utils.time_util import to_datetime64, year_doy_ut
+
+
+class Epochs():
+    """
+    Factorization of time array into unique epochs and index of every row.
+    After 600 s decimation day of observations has about 144 epochs, so
+    terms depending on time only (solar position, day of year etc.) are
+    computed per epoch and gathered back to rows by index.
+    """
+
+    def __init__(self, time:np.array):
+        """
+        :param time: datetime64 (or datetime) scalar or array
+        """
+        time = to_datetime64(time)
+        self.shape = time.shape
+        self.unique, self.index = self.factorize(time.ravel())
+        self.__terms = {}
+
+    @staticmethod
+    def factorize(time:np.array)->tuple[np.array,np.array]:
+        """
+        Same as np.unique(time, return_inverse=True). Times of few days
+        span not many seconds, then table of seconds is used instead of sort
+        """
+        if len(time) == 0:
+            return np.unique(time, return_inverse=True)
+        seconds = time.astype('int64')
+        start = seconds.min()
+        span = seconds.max() - start + 1
+        if span > max(4 * len(time), 86400):
+            return np.unique(time, return_inverse=True)
+        offsets = seconds - start
+        present = np.zeros(span, dtype=bool)
+        present[offsets] = True
+        lookup = np.cumsum(present) - 1
+        unique = (np.flatnonzero(present) + start).astype(time.dtype)
+        return unique, lookup[offsets]
+
+    def __len__(self)->int:
+        return len(self.unique)
+
+    @classmethod
+    def of(cls, time:any)->'Epochs':
+        """
+        Epochs of time, time is returned as is if it is already factorized
+        """
+        return time if isinstance(time, Epochs) else cls(time)
+
+    def terms(self, name:str, func)->any:
+        """
+        Per epoch terms, computed on first request
+        :param func: callable of the epochs, returns array (or tuple of
+            arrays) over unique epochs
+        """
+        if not name in self.__terms:
+            self.__terms[name] = func(self)
+        return self.__terms[name]
+
+    @property
+    def year_doy_ut(self)->tuple[np.array,np.array,np.array]:
+        return self.terms('year_doy_ut', lambda e: year_doy_ut(e.unique))
+
+    def gather(self, values:np.array)->np.array:
+        """
+        Per epoch values to rows, shape of original time array
+        """
+        return np.asarray(values)[self.index].reshape(self.shape)
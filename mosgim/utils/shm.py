@@ -0,0 +1,85 @@
+import numpy as np
+
+from multiprocessing import shared_memory
+
+
+class SharedColumns():
+    """
+    Named 1-d columns placed in multiprocessing.shared_memory blocks.
+    Parent process creates columns, workers attach to them with spec, write
+    their rows in place and return only offsets. Object dtypes are not
+    supported, datetimes should be datetime64.
+    """
+
+    def __init__(self, spec:dict[str,tuple[str,str,int]]={}):
+        """
+        Attaches to existing blocks, use create to make new columns
+        :param spec: column name -> (shared block name, dtype str, size)
+        """
+        self.spec = {}
+        self.owner = False
+        self.blocks = {}
+        self.columns = {}
+        for name, (block_name, dtype, size) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            self.__add(name, block, np.dtype(dtype), size)
+
+    def __add(self, name:str, block:shared_memory.SharedMemory, 
+              dtype:np.dtype, size:int):
+        self.spec[name] = (block.name, dtype.str, size)
+        self.blocks[name] = block
+        self.columns[name] = np.ndarray((size,), dtype, buffer=block.buf)
+
+    @classmethod
+    def create(cls, dtypes:dict[str,any], size:int)->'SharedColumns':
+        """
+        :param dtypes: column name -> dtype
+        :param size: number of rows in every column
+        """
+        shared = cls()
+        shared.owner = True
+        for name, dtype in dtypes.items():
+            dtype = np.dtype(dtype)
+            nbytes = max(dtype.itemsize * size, 1)
+            block = shared_memory.SharedMemory(create=True, size=nbytes)
+            shared.__add(name, block, dtype, size)
+        return shared
+
+    @classmethod
+    def attach(cls, spec:dict[str,tuple[str,str,int]])->'SharedColumns':
+        return cls(spec)
+
+    def __getitem__(self, name:str)->np.array:
+        return self.columns[name]
+
+    def __contains__(self, name:str)->bool:
+        return name in self.columns
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def size(self)->int:
+        return min(spec[2] for spec in self.spec.values())
+
+    def write(self, start:int, **values):
+        """
+        Writes values (column name -> array) to rows starting from start
+        """
+        for name, value in values.items():
+            value = np.asarray(value)
+            self.columns[name][start:start + value.shape[0]] = value
+
+    def close(self):
+        """
+        Detaches from blocks, owner also frees them
+        """
+        self.columns = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
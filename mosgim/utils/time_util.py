@@ -2,27 +2,46 @@ import numpy as np
 from datetime import datetime
 
 
-@np.vectorize
-def sec_of_day(time: datetime) -> float:
+def to_datetime64(time) -> np.array:
+    """
+    Приводит время (datetime, datetime64, массивы из них) к datetime64[s].
+
+    :param time: Время или массив времен.
+    :return: Массив или скаляр datetime64[s].
+    """
+    return np.asarray(time, dtype='datetime64[s]')
+
+
+def sec_of_day(time: np.datetime64) -> float:
     """
     Возвращает количество секунд с начала дня для заданного времени.
 
-    :param time: Время для расчета.
+    :param time: Время для расчета, datetime64 или массив datetime64.
     :return: Количество секунд с начала дня.
     """
-    day_start = time.replace(hour=0, minute=0, second=0, microsecond=0)
-    return (time - day_start).total_seconds()
+    time = to_datetime64(time)
+    return (time - time.astype('datetime64[D]')).astype(float)
 
 
-def sec_of_interval(time: datetime, time0: datetime) -> float:
+def sec_of_interval(time: np.datetime64, time0: np.datetime64) -> float:
     """
     Возвращает количество секунд между двумя временными метками.
 
-    :param time: Конечное время.
+    :param time: Конечное время, datetime64 или массив datetime64.
     :param time0: Начальное время.
     :return: Количество секунд между `time` и `time0`.
     """
-    return (time - time0).total_seconds()
+    return (to_datetime64(time) - to_datetime64(time0)).astype(float)
+
 
+def year_doy_ut(time: np.datetime64) -> tuple[np.array, np.array, np.array]:
+    """
+    Возвращает год, номер дня в году и секунды с начала дня.
 
-sec_of_interval = np.vectorize(sec_of_interval, excluded='time0')
+    :param time: Время, datetime64 или массив datetime64.
+    :return: Год, день года (с единицы) и секунды с начала дня.
+    """
+    time = to_datetime64(time)
+    year = time.astype('datetime64[Y]')
+    doy = (time.astype('datetime64[D]') - year).astype(int) + 1
+    return year.astype(int) + 1970, doy, sec_of_day(time)
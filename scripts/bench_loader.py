@@ -0,0 +1,84 @@
+import time
+import argparse
+import numpy as np
+
+from pathlib import Path
+
+from mosgim.data import LoaderTxt
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Парсит аргументы командной строки.
+
+    :return: Объект с аргументами командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark txt parsers: genfromtxt vs columnar')
+    parser.add_argument(
+        '--data_path', 
+        type=Path, 
+        required=True,
+        help='Path to data, folder with site subfolders (e.g. full day)'
+    )
+    parser.add_argument(
+        '--nsite',  
+        type=int,
+        help='Number of sites to take into benchmark'
+    )
+    return parser.parse_args()
+
+
+def same_data(a: np.ndarray, b: np.ndarray) -> bool:
+    """
+    Проверяет, что оба парсера вернули одинаковые данные.
+
+    :param a: Результат первого парсера.
+    :param b: Результат второго парсера.
+    :return: True, если поля совпадают.
+    """
+    a, b = np.atleast_1d(a), np.atleast_1d(b)
+    if a.shape != b.shape:
+        return False
+    for field in a.dtype.names:
+        if a.dtype[field].kind in 'OM':
+            if not np.all(a[field] == b[field]):
+                return False
+        elif not np.allclose(a[field], b[field], equal_nan=True):
+            return False
+    return True
+
+
+def main() -> None:
+    """
+    Сравнивает время чтения *.dat файлов через np.genfromtxt и через
+    колоночный парсер, проверяет совпадение результатов.
+    """
+    args = parse_args()
+    loader = LoaderTxt(args.data_path)
+    files = loader.get_files(args.data_path)
+    selected = sorted(files)[:args.nsite] if args.nsite else sorted(files)
+    filepaths = [f for site in selected for f in files[site]]
+    print(f'{len(selected)} sites, {len(filepaths)} files')
+
+    timings = {'genfromtxt': 0., 'columnar': 0.}
+    rows, mismatched = 0, []
+    for filepath in filepaths:
+        st = time.time()
+        slow, _ = loader.load_data_genfromtxt(filepath)
+        timings['genfromtxt'] += time.time() - st
+        st = time.time()
+        fast, _ = loader.load_data(filepath)
+        timings['columnar'] += time.time() - st
+        rows += fast.shape[0]
+        if not same_data(slow, fast):
+            mismatched.append(filepath)
+
+    for name, took in timings.items():
+        print(f'{name:>10}: {took:.2f} s, {rows / max(took, 1e-9):.0f} rows/s')
+    print(f'speedup: {timings["genfromtxt"] / max(timings["columnar"], 1e-9):.1f}x')
+    if mismatched:
+        print(f'{len(mismatched)} files differ, e.g. {mismatched[0]}')
+
+
+if __name__ == '__main__':
+    main()
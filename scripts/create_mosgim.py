@@ -29,8 +29,8 @@ def main() -> None:
     input_file = args.in_file
     output_file = args.out_file
     
-    data = np.load(input_file, allow_pickle=True)
+    data = np.load(input_file)
     weights, N = solve_weights(data)
     
-    np.savez(output_file, res=weights, N=N)
+    np.savez(output_file, res=weights, N=N.blocks)
 
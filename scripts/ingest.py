@@ -0,0 +1,119 @@
+import argparse
+import numpy as np
+
+from datetime import datetime
+from pathlib import Path
+
+from mosgim.data import (LoaderTxt,
+                        StreamIngestor,
+                        MagneticCoordType,
+                        combine_data,
+                        calculate_seed_mag_coordinates_parallel,
+                        get_data,
+                        sites)
+from mosgim.mosg.map_creator import (solve_weights,
+                                calculate_maps)
+from mosgim.mosg.lcp_solver import create_lcp
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Парсит аргументы командной строки.
+
+    :return: Объект с аргументами командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Ingest txt data as they arrive and build maps on demand')
+    parser.add_argument(
+        '--data_path', 
+        type=Path, 
+        required=True,
+        help='Path to data, folder with site subfolders'
+    )
+    parser.add_argument(
+        '--out_path', 
+        type=Path, 
+        default=Path('/tmp/'),
+        help='Path where maps are stored'
+    )
+    parser.add_argument(
+        '--mag_type',  
+        type=MagneticCoordType,
+        required=True,
+        help='Type of magnetic coords [mag | mdip]'
+    )
+    parser.add_argument(
+        '--nsite',  
+        type=int,
+        help='Number of sites to take into calculations'
+    )
+    parser.add_argument(
+        '--nworkers',  
+        type=int,
+        default=1,
+        help='Number of threads for parallel processing'
+    )
+    parser.add_argument(
+        '--interval',  
+        type=float,
+        default=60.,
+        help='Seconds between polls of data folder'
+    )
+    parser.add_argument(
+        '--map_every',  
+        type=float,
+        default=3600.,
+        help='Seconds between maps'
+    )
+    parser.add_argument(
+        '--const',  
+        action='store_true',
+        help='Defines '
+    )
+    return parser.parse_args()
+
+
+def make_map(ingestor: StreamIngestor, args: argparse.Namespace) -> None:
+    """
+    Строит карту по дугам, накопленным к текущему моменту, и сохраняет её.
+
+    :param ingestor: Источник подготовленных дуг.
+    :param args: Аргументы командной строки.
+    """
+    days = ingestor.days()
+    if not days:
+        print('No data yet')
+        return
+    process_date = datetime.strptime(str(days[-1]), '%Y-%m-%d')
+    data = ingestor.prepared(days[-1])
+    if data.narcs == 0:
+        print(f'No arcs for {process_date}')
+        return
+    data_chunks = combine_data(data, nchunks=args.nworkers)
+    result = calculate_seed_mag_coordinates_parallel(data_chunks, 
+                                                     nworkers=args.nworkers,
+                                                     mag_types=[args.mag_type])
+    data = get_data(result, args.mag_type, process_date)
+    weights, N = solve_weights(data, nworkers=args.nworkers, linear=not args.const)
+    lcp = create_lcp({'res': weights, 'N': N})
+    maps = calculate_maps(lcp, args.mag_type, process_date)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+    maps_file = args.out_path / f'maps_{args.mag_type}_{stamp}.npz'
+    np.savez(maps_file, **maps)
+    print(f'Map saved to {maps_file}')
+
+
+def main() -> None:
+    """
+    Основная функция: следит за папкой с данными, дочитывает новые строки
+    и периодически строит карты.
+    """
+    args = parse_args()
+    selected_sites = sites[:args.nsite] if args.nsite else sites[:]
+    ingestor = StreamIngestor(LoaderTxt(args.data_path), sites=selected_sites)
+    ingestor.run(interval=args.interval, 
+                 callback=lambda ing: make_map(ing, args), 
+                 every=args.map_every)
+
+
+if __name__ == '__main__':
+    main()
@@ -61,13 +61,15 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def load_data(data_path: Path, data_source: DataSourceType, selected_sites: list) -> np.ndarray:
+def load_data(data_path: Path, data_source: DataSourceType, selected_sites: list,
+              day: datetime = None) -> np.ndarray:
     """
     Загружает данные в зависимости от источника.
 
     :param data_path: Путь к данным.
     :param data_source: Тип источника данных (hdf, txt и т.д.).
     :param selected_sites: Список выбранных сайтов для загрузки.
+    :param day: Сутки UTC, дуги других суток отбрасываются.
     :return: Загруженные данные.
     """
     if data_source == DataSourceType.hdf:
@@ -79,7 +81,7 @@ def load_data(data_path: Path, data_source: DataSourceType, selected_sites: list
     else:
         raise ValueError(f"Unsupported data source: {data_source}")
     
-    return process_data(data_generator)
+    return process_data(data_generator, day=day)
 
 
 def calculate_magnetic_coordinates(data: np.ndarray) -> np.ndarray:
@@ -107,7 +109,8 @@ def main() -> None:
     selected_sites = sites[:args.nsite] if args.nsite else sites[:]
 
     # Загрузка данных
-    data = load_data(args.data_path, args.data_source, selected_sites)
+    data = load_data(args.data_path, args.data_source, selected_sites,
+                     day=process_date)
 
     # Вычисление магнитных координат
     result = calculate_magnetic_coordinates(data)
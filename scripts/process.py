@@ -9,16 +9,23 @@ from datetime import datetime, timedelta
 from mosgim.data import (DataSourceType,
                                        MagneticCoordType,
                                        ProcessingType,
-                                       process_data,
+                                       process_data_days,
+                                       prepare_arcs,
                                        combine_data,
                                        get_data,
                                        save_data,
+                                       read_data,
                                        sites,
                                        calculate_seed_mag_coordinates_parallel)
 from mosgim.data import (LoaderHDF, 
-                                LoaderTxt)
+                                LoaderTxt,
+                                LoaderRinex,
+                                Manifest,
+                                ArcStore)
+from mosgim.geo import configure_inclination
 from mosgim.mosg.map_creator import (solve_weights,
                                 calculate_maps)
+from mosgim.mosg.solvers import SOLVERS
 from mosgim.mosg.lcp_solver import create_lcp
 from mosgim.plotter.animation import plot_and_save 
                                   
@@ -64,6 +71,11 @@ def parse_args(command: str = '') -> argparse.Namespace:
         required=True,
         help='Path to data, content depends on format'
     )
+    parser.add_argument(
+        '--nav_path', 
+        type=Path, 
+        help='Path to RINEX navigation file, for rinex data source'
+    )
     parser.add_argument(
         '--out_path', 
         type=Path, 
@@ -137,6 +149,57 @@ def parse_args(command: str = '') -> argparse.Namespace:
         default=2,
         help='Number of Gb per worker'
     )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=0,
+        help='Number of files per loading task, whole site if not set'
+    )
+    parser.add_argument(
+        '--prepare_in_workers',
+        action='store_true',
+        help='Extract arcs in loader workers, only prepared arcs are sent back'
+    )
+    parser.add_argument(
+        '--cache_dir',
+        type=Path,
+        help='Folder for cache of parsed data files, no caching if not set'
+    )
+    parser.add_argument(
+        '--manifest_dir',
+        type=Path,
+        help='Folder for manifests of data folders, files are selected from '
+             'manifest instead of walking data_path'
+    )
+    parser.add_argument(
+        '--update_manifest',
+        action='store_true',
+        help='Reindex new and changed files of data_path before loading'
+    )
+    parser.add_argument(
+        '--continuous',
+        action='store_true',
+        help='data_path is continuous archive, files could span several days; '
+             'in "ranged" processing it is read once for all days'
+    )
+    parser.add_argument(
+        '--inclination_dir',
+        type=Path,
+        help='Folder for inclination tables used for modip, ~/.cache/mosgim if not set'
+    )
+    parser.add_argument(
+        '--exact_modip',
+        action='store_true',
+        help='Compute inclination with IGRF for every point instead of table'
+    )
+    parser.add_argument(
+        '--solver',
+        type=str,
+        # lsqr does not form normal matrix, which LCP needs
+        choices=[s for s in SOLVERS if s != 'lsqr'],
+        default='banded',
+        help='Solver of weights: banded or dense Cholesky, pcg'
+    )
     parser.add_argument(
         '--skip_prepare',
         action='store_true',
@@ -168,6 +231,9 @@ def parse_args(command: str = '') -> argparse.Namespace:
     if args.process_type == ProcessingType.ranged and args.ndays is None:
         parser.error("Ranged processing requires --ndays")
     
+    if args.data_source == DataSourceType.rinex and args.nav_path is None:
+        parser.error("RINEX processing requires --nav_path")
+    
     if args.process_type == ProcessingType.ranged:
         base_time = args.date
         for day in range(args.ndays):
@@ -175,7 +241,8 @@ def parse_args(command: str = '') -> argparse.Namespace:
             current_date = base_time + timedelta(day)
             doy = str(current_date.timetuple().tm_yday).zfill(3)
             current_args.date = current_date
-            current_args.data_path = f"{args.data_path}/{current_date.year}/{doy}"
+            if not args.continuous:
+                current_args.data_path = f"{args.data_path}/{current_date.year}/{doy}"
             populate_out_path(current_args)
             yield current_args
     elif args.process_type == ProcessingType.single:
@@ -183,53 +250,110 @@ def parse_args(command: str = '') -> argparse.Namespace:
         yield args
 
 
-def process(args: argparse.Namespace) -> None:
+def load_arcs(args: argparse.Namespace, days: list[datetime]) -> dict[np.datetime64, ArcStore]:
+    """
+    Читает данные один раз и раскладывает дуги по суткам UTC.
+
+    :param args: Аргументы командной строки.
+    :param days: Сутки, дуги которых нужны.
+    :return: Дуги по суткам.
+    """
+    start_time = time.time()
+    selected_sites = sites[:args.nsite] if args.nsite else sites[:]
+    # manifest selects files of the day, for several days all files are taken
+    day = days[0] if len(days) == 1 else None
+    
+    preprocess = prepare_arcs if args.prepare_in_workers else None
+    manifest = None
+    if args.manifest_dir:
+        manifest = Manifest.for_folder(args.manifest_dir, args.data_path,
+                                       cache_dir=args.cache_dir)
+        if args.update_manifest or not manifest.exists:
+            manifest.update()
+    if args.data_source == DataSourceType.hdf:
+        loader = LoaderHDF(args.data_path, cache_dir=args.cache_dir, 
+                           manifest=manifest, day=day)
+        data_generator = loader.generate_data_pool(sites=selected_sites, 
+                                                    nworkers=args.nworkers,
+                                                    preprocess=preprocess)
+    elif args.data_source == DataSourceType.txt:
+        loader = LoaderTxt(args.data_path, cache_dir=args.cache_dir, 
+                           manifest=manifest, day=day)
+        data_generator = loader.generate_data_pool(sites=selected_sites, 
+                                                    nworkers=args.nworkers,
+                                                    batch_size=args.batch_size,
+                                                    preprocess=preprocess)
+    elif args.data_source == DataSourceType.rinex:
+        loader = LoaderRinex(args.data_path, args.nav_path, 
+                             cache_dir=args.cache_dir,
+                             manifest=manifest, day=day)
+        data_generator = loader.generate_data_pool(sites=selected_sites, 
+                                                    nworkers=args.nworkers,
+                                                    preprocess=preprocess)
+    else:
+        raise ValueError('Define data source')
+    
+    data = process_data_days(data_generator, days=days)
+    print(loader.not_found_sites)
+    print(f'Done reading in {time.time() - start_time}')
+    return data
+
+
+def process(args: argparse.Namespace, data: ArcStore = None) -> None:
     """
     Основная функция для обработки данных.
     Загружает данные, вычисляет магнитные координаты, веса, LCP, карты и анимацию.
 
     :param args: Аргументы командной строки.
+    :param data: Уже подготовленные дуги суток, данные не читаются если заданы.
     """
     print(args)
     process_date = args.date
-    start_time = time.time()
+    configure_inclination(exact=args.exact_modip)
+    if args.inclination_dir:
+        configure_inclination(cache_dir=args.inclination_dir)
     
     if not args.skip_prepare:
-        selected_sites = sites[:args.nsite] if args.nsite else sites[:]
-        
-        if args.data_source == DataSourceType.hdf:
-            loader = LoaderHDF(args.data_path)
-            data_generator = loader.generate_data(sites=selected_sites)
-        elif args.data_source == DataSourceType.txt:
-            loader = LoaderTxt(args.data_path)
-            data_generator = loader.generate_data_pool(sites=selected_sites, nworkers=args.nworkers)
-        else:
-            raise ValueError('Define data source')
-        
-        data = process_data(data_generator)
-        print(loader.not_found_sites)
-        print(f'Done reading in {time.time() - start_time}')
+        if data is None:
+            day = np.datetime64(process_date, 'D')
+            data = load_arcs(args, [day]).get(day, ArcStore())
+        if len(data) == 0:
+            # e.g. day of continuous archive without data
+            print(f'No arcs for {process_date}, day is skipped')
+            return
         
         data_chunks = combine_data(data, nchunks=args.nworkers)
         print('Start magnetic calculations...')
         start_time = time.time()
-        result = calculate_seed_mag_coordinates_parallel(data_chunks, nworkers=args.nworkers)
+        result = calculate_seed_mag_coordinates_parallel(data_chunks, 
+                                                         nworkers=args.nworkers,
+                                                         mag_types=[args.mag_type])
         print(f'Done, took {time.time() - start_time}')
         
-        if args.mag_file and args.modip_file:
-            save_data(result, args.modip_file, args.mag_file, process_date)
+        # only requested system is computed and saved
+        save_data(result, args.modip_file, args.mag_file, process_date)
         
         data = get_data(result, args.mag_type, process_date)
     else:
-        if args.mag_type == MagneticCoordType.mag:
-            data = np.load(args.mag_file, allow_pickle=True)
-        elif args.mag_type == MagneticCoordType.mdip:
-            data = np.load(args.modip_file, allow_pickle=True)
+        files = {MagneticCoordType.mag: args.mag_file, 
+                 MagneticCoordType.mdip: args.modip_file}
+        other_type = [m for m in files if m != args.mag_type][0]
+        if os.path.exists(files[args.mag_type]):
+            data = np.load(files[args.mag_type])
+        else:
+            # derive requested system from prepared data of the other one
+            print(f'No {files[args.mag_type]}, derive from {files[other_type]}')
+            result, _ = read_data(files[other_type])
+            result = calculate_seed_mag_coordinates_parallel([result], 
+                                                             mag_types=[args.mag_type])
+            save_data(result, args.modip_file, args.mag_file, process_date)
+            data = get_data(result, args.mag_type, process_date)
     
-    weights, N = solve_weights(data, nworkers=args.nworkers, gigs=args.memory_per_worker, linear=not args.const)
+    weights, N = solve_weights(data, nworkers=args.nworkers, gigs=args.memory_per_worker, 
+                               linear=not args.const, solver=args.solver)
     
     if args.weight_file:
-        np.savez(args.weight_file, res=weights, N=N)
+        np.savez(args.weight_file, res=weights, N=N.blocks)
     
     try:
         lcp = create_lcp({'res': weights, 'N': N})
@@ -238,12 +362,21 @@ def process(args: argparse.Namespace) -> None:
         return
     
     if args.lcp_file:
-        np.savez(args.lcp_file, res=lcp, N=N)
+        np.savez(args.lcp_file, res=lcp, N=N.blocks)
     
     maps = calculate_maps(lcp, args.mag_type, process_date)
     plot_and_save(maps, args.animation_file, args.maps_file)
 
 
 if __name__ == '__main__':
-    for args in parse_args():
-        process(args)
+    days_args = list(parse_args())
+    first = days_args[0]
+    if first.continuous and not first.skip_prepare:
+        # archive is read once, every day gets its own arcs
+        days = [np.datetime64(a.date, 'D') for a in days_args]
+        prepared = load_arcs(first, days)
+        for args, day in zip(days_args, days):
+            process(args, prepared.pop(day, ArcStore()))
+    else:
+        for args in days_args:
+            process(args)
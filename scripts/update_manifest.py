@@ -0,0 +1,57 @@
+import argparse
+
+from pathlib import Path
+
+from mosgim.data import Manifest
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Парсит аргументы командной строки.
+
+    :return: Объект с аргументами командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Build or update manifest of data folder')
+    parser.add_argument(
+        '--data_path',
+        type=Path,
+        required=True,
+        help='Path to data: site subfolders, hdf files or RINEX files'
+    )
+    parser.add_argument(
+        '--manifest_dir',
+        type=Path,
+        required=True,
+        help='Folder for manifests, same as --manifest_dir of process.py'
+    )
+    parser.add_argument(
+        '--cache_dir',
+        type=Path,
+        help='Folder for cache of parsed data files, filled while indexing'
+    )
+    parser.add_argument(
+        '--files',
+        type=Path,
+        nargs='*',
+        help='Only check these files, e.g. just downloaded, instead of walking data_path'
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """
+    Индексирует новые и изменившиеся файлы, печатает сводку по станциям.
+    """
+    args = parse_args()
+    manifest = Manifest.for_folder(args.manifest_dir, args.data_path,
+                                   cache_dir=args.cache_dir)
+    manifest.update(paths=args.files or None)
+    summary = manifest.sites()
+    for site, info in sorted(summary.items()):
+        print(f'{site} files: {len(info["files"])} rows: {info["rows"]} '
+              f'{info["start"]} - {info["end"]} lat: {info["lat"]} lon: {info["lon"]}')
+    print(f'{len(summary)} sites in {manifest.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from numpy.linalg import LinAlgError
+
+from mosgim.mosg.banded import BlockBandedMatrix, as_normal_matrix
+
+
+def random_matrix(rng, nblocks, n_coefs, bandwidth, definite=True):
+    # diagonally dominant blocks, negative diagonal of one block makes
+    # matrix indefinite, so Cholesky fails
+    N = BlockBandedMatrix.zeros(nblocks, n_coefs, bandwidth)
+    for i in range(nblocks):
+        for j in range(max(0, i - N.bandwidth), i + 1):
+            block = rng.normal(size=(n_coefs, n_coefs))
+            if i == j:
+                block = block.dot(block.T) + 4 * n_coefs * (N.bandwidth + 1) * np.eye(n_coefs)
+            N.add(i, j, block)
+    if not definite:
+        N.add(nblocks // 2, nblocks // 2, -20 * n_coefs * (N.bandwidth + 1) * np.eye(n_coefs))
+    return N
+
+
+def frozen_constraints_loop(N, weight, nblocks, n_coefs):
+    # constraint loop of dense system of stack_weight_solve_ns
+    for ii in range(0, nblocks - 1):
+        for kk in range(0, n_coefs):
+            N[ii*n_coefs + kk, ii*n_coefs + kk] += weight
+            N[(ii + 1) * n_coefs + kk, (ii+1) * n_coefs + kk] += weight
+            N[(ii + 1) * n_coefs + kk, ii * n_coefs + kk] += -weight
+            N[ii * n_coefs + kk, (ii + 1) * n_coefs + kk] += -weight
+
+
+SHAPES = [(1, 3, 0), (2, 2, 1), (6, 3, 1), (7, 4, 2), (12, 2, 3), (5, 3, 4)]
+
+
+@pytest.mark.parametrize('nblocks, n_coefs, bandwidth', SHAPES)
+def test_dense_and_band_storage(nblocks, n_coefs, bandwidth):
+    rng = np.random.default_rng(0)
+    N = random_matrix(rng, nblocks, n_coefs, bandwidth)
+    dense = N.to_dense()
+    assert dense.shape == N.shape
+    assert np.array_equal(dense, dense.T)
+    r, c = np.indices(dense.shape)
+    outside = np.abs(r // n_coefs - c // n_coefs) > N.bandwidth
+    assert np.all(dense[outside] == 0.)
+    u = (N.bandwidth + 1) * n_coefs - 1
+    lower = N.to_banded()
+    full = N.to_full_banded(extra=2)
+    for d in range(u + 1):
+        assert np.array_equal(lower[d, :N.shape[0] - d], np.diagonal(dense, -d))
+        assert np.array_equal(full[2 + u + d, :N.shape[0] - d], np.diagonal(dense, -d))
+        assert np.array_equal(full[2 + u - d, d:], np.diagonal(dense, d))
+    assert np.all(full[:2] == 0.)
+
+
+@pytest.mark.parametrize('nblocks, n_coefs, bandwidth', SHAPES)
+def test_dot(nblocks, n_coefs, bandwidth):
+    rng = np.random.default_rng(1)
+    N = random_matrix(rng, nblocks, n_coefs, bandwidth)
+    x = rng.normal(size=N.shape[0])
+    X = rng.normal(size=(N.shape[0], 3))
+    assert np.allclose(N.dot(x), N.to_dense().dot(x), rtol=0, atol=1e-10)
+    assert np.allclose(N.dot(X), N.to_dense().dot(X), rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize('nblocks', [1, 2, 5])
+def test_frozen_constraints_match_loop(nblocks):
+    rng = np.random.default_rng(2)
+    N = random_matrix(rng, nblocks, 3, 1)
+    expected = N.to_dense()
+    frozen_constraints_loop(expected, 0.25, nblocks, 3)
+    N.add_frozen_constraints(0.25)
+    assert np.allclose(N.to_dense(), expected, rtol=0, atol=1e-12)
+
+
+def test_add_upper_block_is_transposed():
+    rng = np.random.default_rng(3)
+    N = BlockBandedMatrix.zeros(3, 2, 1)
+    block = rng.normal(size=(2, 2))
+    N.add(0, 1, block)
+    assert np.array_equal(N.to_dense()[:2, 2:4], block)
+    assert np.array_equal(N.to_dense()[2:4, :2], block.T)
+
+
+@pytest.mark.parametrize('nblocks, n_coefs, bandwidth', SHAPES)
+@pytest.mark.parametrize('definite', [True, False])
+def test_solve_matches_dense(nblocks, n_coefs, bandwidth, definite):
+    rng = np.random.default_rng(4)
+    N = random_matrix(rng, nblocks, n_coefs, bandwidth, definite)
+    b = rng.normal(size=N.shape[0])
+    B = rng.normal(size=(N.shape[0], 4))
+    dense = N.to_dense()
+    assert np.allclose(N.solve(b), np.linalg.solve(dense, b), rtol=0, atol=1e-10)
+    assert np.allclose(N.solve(B), np.linalg.solve(dense, B), rtol=0, atol=1e-10)
+    kind, _ = N.factorize()
+    if definite:
+        assert kind == 'cholesky_banded'
+    elif 2 * N.bandwidth + 1 >= nblocks:
+        assert kind == 'lu'
+    else:
+        assert kind == 'lu_banded'
+    N.factorize(dense=True)
+    assert np.allclose(N.solve(b), np.linalg.solve(dense, b), rtol=0, atol=1e-10)
+
+
+def test_factor_is_kept_until_change():
+    rng = np.random.default_rng(5)
+    N = random_matrix(rng, 10, 3, 1, definite=False)
+    factor = N.factorize()
+    assert factor[0] == 'lu_banded'
+    assert N.factorize() is factor
+    # dense factor replaces banded one and is kept for solve
+    dense = N.factorize(dense=True)
+    assert dense[0] == 'lu'
+    assert N.factorize() is dense
+    N.add(0, 0, 1000. * np.eye(3))
+    N.add(5, 5, 1000. * np.eye(3))
+    assert N.factorize()[0] == 'cholesky_banded'
+    b = rng.normal(size=N.shape[0])
+    assert np.allclose(N.solve(b), np.linalg.solve(N.to_dense(), b), rtol=0, atol=1e-10)
+
+
+@pytest.mark.filterwarnings('ignore::scipy.linalg.LinAlgWarning')
+@pytest.mark.parametrize('nblocks, bandwidth', [(10, 1), (3, 1)])
+@pytest.mark.parametrize('dense', [False, True])
+def test_singular_matrix(nblocks, bandwidth, dense):
+    N = BlockBandedMatrix.zeros(nblocks, 3, bandwidth)
+    N.add(0, 0, np.eye(3))
+    with pytest.raises(LinAlgError):
+        N.factorize(dense)
+
+
+def test_as_normal_matrix():
+    rng = np.random.default_rng(6)
+    N = random_matrix(rng, 4, 2, 1)
+    assert as_normal_matrix(N) is N
+    assert np.array_equal(as_normal_matrix(N.blocks).to_dense(), N.to_dense())
+    dense = N.to_dense()
+    assert as_normal_matrix(dense) is dense
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import scipy.special as sp
+
+from mosgim.mosg.basis import (BASIS_CHUNK, harmonic_indexes, iter_basis,
+                               real_basis)
+
+
+def harmonic_indexes_sph_harm(nbig, mbig):
+    # indexes as construct_normal_system took them from finite sph_harm
+    n_ind = np.arange(0, nbig + 1, 1)
+    m_ind = np.arange(-mbig, mbig + 1, 1)
+    M, N = np.meshgrid(m_ind, n_ind)
+    Y = sp.sph_harm(np.abs(M), N, 0, 0)
+    idx = np.isfinite(Y)
+    return M[idx], N[idx]
+
+
+def calc_coefs(M, N, theta, phi):
+    # calc_coefs of map_creator before real_basis, point by point
+    n_coefs = len(M)
+    a = np.zeros(n_coefs)
+    Ymn = sp.sph_harm(np.abs(M), N, theta, phi)
+    a[M < 0] = Ymn[M < 0].imag * np.sqrt(2) * (-1.) ** M[M < 0]
+    a[M > 0] = Ymn[M > 0].real * np.sqrt(2) * (-1.) ** M[M > 0]
+    a[M == 0] = Ymn[M == 0].real
+    return a
+
+
+def sph_harm_basis(M, N, theta, phi):
+    return np.array([calc_coefs(M, N, t, p) for t, p in zip(theta, phi)])
+
+
+def points(rng, n):
+    theta = rng.uniform(0, 2 * np.pi, n)
+    phi = rng.uniform(0, np.pi, n)
+    # poles, equator and edges of longitude; sph_harm loses accuracy 
+    # closer to the pole than 1e-3
+    phi[:6] = [0., np.pi, 0., np.pi, np.pi / 2, 1e-3]
+    theta[:6] = [0., 0., 1.3, 4.1, 2 * np.pi, 2 * np.pi - 1e-9]
+    return theta, phi
+
+
+@pytest.mark.parametrize('nbig, mbig', [(0, 0), (1, 1), (4, 2), (6, 6), (15, 15)])
+def test_indexes_match_sph_harm(nbig, mbig):
+    M, N = harmonic_indexes(nbig, mbig)
+    M_exp, N_exp = harmonic_indexes_sph_harm(nbig, mbig)
+    assert np.array_equal(M, M_exp)
+    assert np.array_equal(N, N_exp)
+
+
+@pytest.mark.parametrize('nbig, mbig', [(0, 0), (1, 1), (4, 2), (6, 6), (15, 15)])
+def test_real_basis_matches_sph_harm(nbig, mbig):
+    rng = np.random.default_rng(nbig)
+    M, N = harmonic_indexes(nbig, mbig)
+    theta, phi = points(rng, 200)
+    expected = sph_harm_basis(M, N, theta, phi)
+    assert np.allclose(real_basis(M, N, theta, phi), expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('n', [BASIS_CHUNK - 1, BASIS_CHUNK, BASIS_CHUNK + 1])
+def test_iter_basis_at_chunk_boundary(n):
+    rng = np.random.default_rng(n)
+    M, N = harmonic_indexes(3, 2)
+    theta, phi = points(rng, n)
+    blocks = list(iter_basis(M, N, theta, phi))
+    assert [(start, fin) for start, fin, _ in blocks] == \
+        [(s, min(s + BASIS_CHUNK, n)) for s in range(0, n, BASIS_CHUNK)]
+    basis = np.concatenate([block for _, _, block in blocks])
+    assert np.array_equal(basis, real_basis(M, N, theta, phi))
+    # rows around the boundary against sph_harm
+    rows = np.r_[:6, max(n - 4, 0):min(n, BASIS_CHUNK + 2)]
+    expected = sph_harm_basis(M, N, theta[rows], phi[rows])
+    assert np.allclose(basis[rows], expected, rtol=0, atol=1e-12)
+
+
+def test_iter_basis_small_chunks():
+    rng = np.random.default_rng(0)
+    M, N = harmonic_indexes(5, 5)
+    theta, phi = points(rng, 53)
+    basis = np.empty((53, len(M)))
+    for start, fin, block in iter_basis(M, N, theta, phi, chunk=10):
+        basis[start:fin] = block
+    assert np.allclose(basis, sph_harm_basis(M, N, theta, phi), rtol=0, atol=1e-12)
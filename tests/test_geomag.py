@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from datetime import datetime
+from numpy import sin, cos, pi, arctan2, arcsin, floor, deg2rad
+
+from mosgim.geo.geomag import geo2mag, GEOGRAPHIC_TRANSFORM
+
+
+def sub_sol_scalar(year, doy, ut):
+    # scalar sub_sol geo2mag used before it took arrays
+    yr = year - 2000
+    nleap = floor((year-1601)/4)
+    nleap = nleap - 99
+    if year <= 1900:
+        ncent = floor((year-1601)/100)
+        ncent = 3 - ncent
+        nleap = nleap + ncent
+    l0 = -79.549 + (-0.238699*(yr-4*nleap) + 3.08514e-2*nleap)
+    g0 = -2.472 + (-0.2558905*(yr-4*nleap) - 3.79617e-2*nleap)
+    df = (ut/86400 - 1.5) + doy
+    lf = 0.9856474*df
+    gf = 0.9856003*df
+    l = l0 + lf
+    g = g0 + gf
+    grad = g*pi/180
+    lmbda = l + 1.915*sin(grad) + 0.020*sin(2*grad)
+    lmrad = lmbda*pi/180
+    sinlm = sin(lmrad)
+    n = df + 365*yr + nleap
+    epsilon = 23.439 - 4e-7*n
+    epsrad = epsilon*pi/180
+    alpha = arctan2(cos(epsrad)*sinlm, cos(lmrad)) * 180/pi
+    delta = arcsin(sin(epsrad)*sinlm) * 180/pi
+    sbsllat = delta
+    etdeg = l - alpha
+    nrot = round(etdeg/360)
+    etdeg = etdeg - 360*nrot
+    aptime = ut/240 + etdeg
+    sbsllon = 180 - aptime
+    nrot = round(sbsllon/360)
+    sbsllon = sbsllon - 360*nrot
+    return deg2rad(sbsllon), pi / 2 - deg2rad(sbsllat)
+
+
+@np.vectorize
+def geo2mag_scalar(theta, phi, date):
+    # point by point geo2mag before it took arrays
+    ut = (date - date.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+    doy = date.timetuple().tm_yday
+    year = date.year
+
+    phi_sbs, theta_sbs = sub_sol_scalar(year, doy, ut)
+    r_sbs = np.array([np.sin(theta_sbs) * np.cos(phi_sbs), np.sin(theta_sbs) * np.sin(phi_sbs), np.cos(theta_sbs)])
+
+    r_sbs_mag = GEOGRAPHIC_TRANSFORM.dot(r_sbs)
+    phi_sbs_m = np.arctan2(r_sbs_mag[1], r_sbs_mag[0])
+    if phi_sbs_m < 0.:
+        phi_sbs_m = phi_sbs_m + 2. * np.pi
+
+    r = np.array([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)])
+    r_mag = GEOGRAPHIC_TRANSFORM.dot(r)
+    theta_m = np.arccos(r_mag[2])
+    phi_m = np.arctan2(r_mag[1], r_mag[0])
+    if phi_m < 0.:
+        phi_m = phi_m + 2. * np.pi
+
+    mlt = phi_m - phi_sbs_m + np.pi
+    if mlt < 0.:
+        mlt = mlt + 2. * np.pi
+    if mlt > 2. * np.pi:
+        mlt = mlt - 2. * np.pi
+    return theta_m, mlt
+
+
+def to_datetime(times):
+    return np.array(times.astype('datetime64[s]').tolist(), dtype=object)
+
+
+def assert_close(result, expected):
+    theta_m, mlt = result
+    theta_exp, mlt_exp = expected
+    assert np.shape(theta_m) == np.shape(theta_exp)
+    assert np.allclose(theta_m, theta_exp, rtol=0, atol=1e-12)
+    # mlt near 0 and 2 pi is the same
+    dmlt = np.angle(np.exp(1j * (np.asarray(mlt) - mlt_exp)))
+    assert np.all(np.abs(dmlt) < 1e-12)
+    assert np.all((mlt >= 0.) & (mlt <= 2. * np.pi))
+
+
+def random_points(rng, n):
+    theta = rng.uniform(0, np.pi, n)
+    phi = rng.uniform(-np.pi, np.pi, n)
+    start = np.datetime64('2014-12-30T00:00:00', 's').astype('int64')
+    seconds = rng.integers(0, 10 * 365 * 86400, n) + start
+    # few epochs shared by many points, as in decimated data
+    seconds[: n // 2] = rng.choice(seconds[n // 2:], n // 2)
+    return theta, phi, seconds.astype('datetime64[s]')
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_arrays_match_scalar(seed):
+    rng = np.random.default_rng(seed)
+    theta, phi, times = random_points(rng, 500)
+    expected = geo2mag_scalar(theta, phi, to_datetime(times))
+    assert_close(geo2mag(theta, phi, times), expected)
+
+
+def test_scalars_match_scalar():
+    rng = np.random.default_rng(0)
+    theta, phi, times = random_points(rng, 20)
+    for t, p, time in zip(theta, phi, times):
+        expected = geo2mag_scalar(t, p, time.astype(datetime))
+        assert_close(geo2mag(t, p, time), expected)
+        assert_close(geo2mag(float(t), float(p), time.astype(datetime)), expected)
+
+
+def test_points_of_one_epoch():
+    rng = np.random.default_rng(1)
+    theta, phi, _ = random_points(rng, 100)
+    time = np.datetime64('2017-01-02T02:10:00', 's')
+    expected = geo2mag_scalar(theta, phi, time.astype(datetime))
+    assert_close(geo2mag(theta, phi, time), expected)
+
+
+def test_grid_shape():
+    rng = np.random.default_rng(2)
+    theta, phi, times = random_points(rng, 12)
+    theta, phi, times = theta.reshape(3, 4), phi.reshape(3, 4), times.reshape(3, 4)
+    expected = geo2mag_scalar(theta, phi, to_datetime(times).reshape(3, 4))
+    assert_close(geo2mag(theta, phi, times), expected)
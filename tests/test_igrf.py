@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import pyIGRF.calculate as calculate
+
+from mosgim.geo.igrf import (IGRF_LAST_MODEL, IGRF_MAX_DATE, IGRF_RE,
+                             igrf_coeffs, igrf_field, igrf_inclination)
+from mosgim.geo.geomag import make_inclination
+
+DATES = [1900.0, 1933.4, 1945.0, 1994.9, 1995.0, 2003.7, 2017.0, 2020.0,
+         2022.5, IGRF_LAST_MODEL]
+
+
+def points():
+    # grid with poles, date line and few heights
+    lat = np.array([-90., -89.5, -60., -12.3, 0., 33.3, 75., 90.])
+    lon = np.array([0., 45.5, 179.9, 180., 270., 359.9])
+    r = IGRF_RE + np.array([0., 300., 20000.])
+    r, lat, lon = np.meshgrid(r, lat, lon, indexing='ij')
+    return r.ravel(), lat.ravel(), lon.ravel()
+
+
+@pytest.mark.parametrize('date', DATES)
+def test_field_matches_pyigrf(date):
+    r, lat, lon = points()
+    result = igrf_field(date, r, lat, lon)
+    expected = np.array([calculate.igrf12syn(date, 2, *point)
+                         for point in zip(r, lat, lon)]).T
+    for component, component_exp in zip(result, expected):
+        assert np.allclose(component, component_exp, rtol=1e-12, atol=1e-8)
+
+
+def test_inclination_matches_pyigrf():
+    r, lat, lon = points()
+    for date in (1965., 2010., 2021.):
+        x, y, z, _ = np.array([calculate.igrf12syn(date, 2, *point)
+                               for point in zip(r, lat, lon)]).T
+        expected = np.rad2deg(np.arctan2(z, np.sqrt(x * x + y * y)))
+        assert np.allclose(igrf_inclination(date, r, lat, lon), expected,
+                           rtol=0, atol=1e-10)
+        # negative longitudes are shifted by make_inclination
+        lon_w = np.where(lon > 180., lon - 360., lon)
+        assert np.allclose(make_inclination(lat, lon_w, r - IGRF_RE, date),
+                           expected, rtol=0, atol=1e-10)
+
+
+def test_broadcast_shape():
+    lat = np.linspace(-80, 80, 6).reshape(2, 3)
+    x, y, z, f = igrf_field(2015., IGRF_RE + 300., lat, 30.)
+    assert x.shape == y.shape == z.shape == f.shape == (2, 3)
+
+
+def test_extrapolated_after_last_model():
+    r, lat, lon = points()
+    date = IGRF_LAST_MODEL + 1.
+    with pytest.warns(UserWarning, match='extrapolated'):
+        g, h = igrf_coeffs(date)
+    g_last, h_last = igrf_coeffs(IGRF_LAST_MODEL)
+    g_prev, h_prev = igrf_coeffs(IGRF_LAST_MODEL - 1.)
+    # secular variation of the last model continues
+    assert np.allclose(g - g_last, (g_last - g_prev), rtol=0, atol=1e-9)
+    assert np.allclose(h - h_last, (h_last - h_prev), rtol=0, atol=1e-9)
+    x, y, z, f = igrf_field(date, r, lat, lon)
+    assert np.all(f > 0)
+
+
+@pytest.mark.parametrize('date', [1899.9, IGRF_MAX_DATE + 0.1])
+def test_undefined_dates(date):
+    with pytest.raises(ValueError):
+        igrf_coeffs(date)
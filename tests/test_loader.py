@@ -0,0 +1,125 @@
+import time
+import h5py
+import numpy as np
+import pytest
+
+from datetime import datetime, timezone
+
+from mosgim.data.loader import LoaderHDF, LoaderTxt
+from mosgim.data.tec_prepare import prepare_arcs
+
+SITES = ['abcd', 'efgh']
+
+
+def write_dat(path, start, n, rng):
+    times = np.datetime64(start, 's') + 30 * np.arange(n)
+    el = rng.uniform(20, 80, n)
+    lat = rng.uniform(-60, 60, n)
+    lon = rng.uniform(-180, 180, n)
+    tec = 20 + np.cumsum(rng.normal(0, 0.05, n))
+    lines = ['# datetime el ipp_lat ipp_lon tec']
+    lines += [f'{t} {e:.4f} {la:.4f} {lo:.4f} {v:.4f}'
+              for t, e, la, lo, v in zip(times.astype(str), el, lat, lon, tec)]
+    path.write_text('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def txt_folder(tmp_path):
+    rng = np.random.default_rng(0)
+    root = tmp_path / 'data'
+    for site in SITES:
+        (root / site).mkdir(parents=True)
+        for k in range(3):
+            write_dat(root / site / f'{site}_G{k:02d}.dat',
+                      f'2023-03-05T0{k}:00:00', 300, rng)
+    return root
+
+
+def prepared_by_file(generator):
+    return {str(data_id): data for data, data_id in generator}
+
+
+def test_cached_files_are_prepared_in_workers(txt_folder, tmp_path):
+    loader = LoaderTxt(txt_folder, cache_dir=tmp_path / 'cache')
+    cold = prepared_by_file(loader.generate_data_pool(SITES, nworkers=1,
+                                                      preprocess=prepare_arcs))
+    files = loader.get_files(txt_folder)
+    assert all(loader.cache.get(f) is not None
+               for site_files in files.values() for f in site_files)
+    warm = prepared_by_file(loader.generate_data_pool(SITES, nworkers=1,
+                                                      preprocess=prepare_arcs))
+    assert warm.keys() == cold.keys()
+    assert len(warm) == 6
+    for data_id, prepared in warm.items():
+        # prepared arcs, not raw cached array
+        assert isinstance(prepared, dict)
+        assert len(prepared['out']) == len(cold[data_id]['out']) > 0
+        for out, out_cold in zip(prepared['out'], cold[data_id]['out']):
+            assert np.array_equal(out, out_cold)
+
+
+def test_cached_files_are_raw_without_preprocess(txt_folder, tmp_path):
+    loader = LoaderTxt(txt_folder, cache_dir=tmp_path / 'cache')
+    files = loader.get_files(txt_folder)
+    loader.load_data(files['abcd'][0])
+    tasks = list(loader.generate_batches(files, SITES, batch_size=2))
+    raw = [task for task in tasks if isinstance(task, tuple)]
+    assert len(raw) == 1 and raw[0][1] == files['abcd'][0]
+    assert np.array_equal(raw[0][0], loader.load_data(files['abcd'][0])[0])
+    batches = [task for task in tasks if isinstance(task, list)]
+    assert sorted(sum(batches, [])) == files['abcd'][1:] + files['efgh']
+    tasks = list(loader.generate_batches(files, SITES, batch_size=2, 
+                                         cached_raw=False))
+    assert sorted(sum(tasks, [])) == files['abcd'] + files['efgh']
+
+
+def write_hdf(path, timestamps):
+    n = len(timestamps)
+    with h5py.File(path, 'w') as hdf_file:
+        site = hdf_file.create_group('abcd')
+        site.attrs['lat'] = np.deg2rad(55.)
+        site.attrs['lon'] = np.deg2rad(37.)
+        sat = site.create_group('G01')
+        sat['timestamp'] = np.asarray(timestamps, dtype=float)
+        sat['elevation'] = np.full(n, np.deg2rad(45.))
+        sat['azimuth'] = np.linspace(0, np.pi, n)
+        sat['tec'] = np.arange(n, dtype=float)
+
+
+# epochs around midnight, leap day, DST changes of many zones and 2038
+EPOCHS = ['1999-12-31T23:59:30', '2000-01-01T00:00:00', '2016-02-29T12:00:00',
+          '2017-03-26T01:00:00', '2017-10-29T00:59:30', '2021-06-30T23:59:59',
+          '2040-01-01T00:00:00']
+
+
+def test_hdf_timestamps_are_utc(tmp_path, monkeypatch):
+    times = np.array(EPOCHS, dtype='datetime64[s]')
+    timestamps = times.astype('int64')
+    path = tmp_path / 'data.h5'
+    write_hdf(path, timestamps)
+    # result does not depend on local time zone of the machine
+    for tz in ('UTC', 'Europe/Moscow', 'America/New_York'):
+        monkeypatch.setenv('TZ', tz)
+        time.tzset()
+        loader = LoaderHDF(path)
+        loader.collect_sites()
+        (data, data_id), = loader.load_site('abcd')
+        assert data_id == 'G01_abcd'
+        assert np.array_equal(data['datetime'], times)
+        # UTC time of epoch seconds, fromtimestamp gave local time before
+        expected = [datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None)
+                    for t in timestamps.tolist()]
+        assert data['datetime'].tolist() == expected
+    monkeypatch.delenv('TZ')
+    time.tzset()
+
+
+def test_hdf_timestamps_are_rounded(tmp_path):
+    path = tmp_path / 'data.h5'
+    write_hdf(path, [1488326400.0, 1488326430.4, 1488326459.6])
+    loader = LoaderHDF(path)
+    loader.collect_sites()
+    (data, _), = loader.load_site('abcd')
+    assert np.array_equal(data['datetime'],
+                          np.array(['2017-03-01T00:00:00', '2017-03-01T00:00:30',
+                                    '2017-03-01T00:01:00'], dtype='datetime64[s]'))
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from scipy.sparse import csr_matrix, diags
+
+from mosgim.mosg.basis import harmonic_indexes, real_basis
+from mosgim.mosg.map_creator import (MF, accumulate_normal_system,
+                                     construct_normal_system, design_terms,
+                                     normal_bandwidth, time_bins)
+
+
+def design_matrix(nbig, mbig, nT, ndays, time, theta, phi, el,
+                  time_ref, theta_ref, phi_ref, el_ref, linear):
+    # sparse A and P as construct_normal_system formed them before
+    # accumulate_normal_system
+    M, N = harmonic_indexes(nbig, mbig)
+    n_coefs = len(M)
+    ac = real_basis(M, N, theta, phi) * MF(el)[:, np.newaxis]
+    ar = real_basis(M, N, theta_ref, phi_ref) * MF(el_ref)[:, np.newaxis]
+    tic = time_bins(time, nT, ndays).astype(int)
+    tir = time_bins(time_ref, nT, ndays).astype(int)
+    if linear:
+        dt = (ndays * 86400.) / nT
+        parts = [(tic, (time - dt * tic) / dt, ac),
+                 (tic + 1, (-time + dt * (tic + 1)) / dt, ac),
+                 (tir, -(time_ref - dt * tir) / dt, ar),
+                 (tir + 1, -(-time_ref + dt * (tir + 1)) / dt, ar)]
+    else:
+        parts = [(tic, np.ones(len(time)), ac), (tir, -np.ones(len(time)), ar)]
+    rows = np.arange(len(time))[:, np.newaxis] + np.zeros(n_coefs, dtype=int)
+    data, rowi, coli = [], [], []
+    for bins, factor, basis in parts:
+        data.append((factor[:, np.newaxis] * basis).ravel())
+        rowi.append(rows.ravel())
+        coli.append((bins[:, np.newaxis] * n_coefs + np.arange(n_coefs)).ravel())
+    nT_add = 1 if linear else 0
+    A = csr_matrix((np.concatenate(data),
+                    (np.concatenate(rowi), np.concatenate(coli))),
+                   shape=(len(time), (nT + nT_add) * n_coefs))
+    el_sin, elr_sin = np.sin(el), np.sin(el_ref)
+    P = diags((el_sin ** 2) * (elr_sin ** 2) / (el_sin ** 2 + elr_sin ** 2))
+    return A, P
+
+
+def observations(rng, n, nT, ndays):
+    # references are earlier points of the same arcs, within few bins
+    day = ndays * 86400.
+    time = rng.uniform(0, day, n)
+    time_ref = np.clip(time - rng.uniform(0, 3 * day / nT, n), 0, None)
+    theta, theta_ref = rng.uniform(0, 2 * np.pi, (2, n))
+    phi, phi_ref = rng.uniform(0, np.pi, (2, n))
+    el, el_ref = rng.uniform(np.deg2rad(10), np.pi / 2, (2, n))
+    rhs = rng.normal(0, 1, n)
+    return time, theta, phi, el, time_ref, theta_ref, phi_ref, el_ref, rhs
+
+
+@pytest.mark.parametrize('linear', [True, False])
+@pytest.mark.parametrize('seed', range(3))
+def test_normal_system_matches_sparse(linear, seed):
+    rng = np.random.default_rng(seed)
+    nbig, mbig, nT, ndays = 4, 3, 6, 1
+    obs = observations(rng, 500, nT, ndays)
+    N, b = construct_normal_system(nbig, mbig, nT, ndays, *obs, linear)
+    A, P = design_matrix(nbig, mbig, nT, ndays, *obs[:-1], linear)
+    AP = A.transpose().dot(P)
+    expected = AP.dot(A).toarray()
+    assert N.shape == expected.shape
+    assert np.allclose(N.to_dense(), expected, rtol=0, atol=1e-10)
+    assert np.allclose(b, AP.dot(obs[-1]), rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize('linear', [True, False])
+def test_normal_system_with_iref(linear):
+    rng = np.random.default_rng(3)
+    nbig, mbig, nT, ndays = 3, 3, 4, 1
+    time, theta, phi, el, time_ref, theta_ref, phi_ref, el_ref, rhs = \
+        observations(rng, 300, nT, ndays)
+    # few references shared by many observations
+    iref = rng.integers(0, 20, len(time))
+    refs = (time_ref[:20], theta_ref[:20], phi_ref[:20], el_ref[:20])
+    time = np.maximum(time, time_ref[iref])
+    N, b = construct_normal_system(nbig, mbig, nT, ndays, time, theta, phi, el,
+                                   *refs, rhs, linear, iref=iref)
+    A, P = design_matrix(nbig, mbig, nT, ndays, time, theta, phi, el,
+                         *[ref[iref] for ref in refs], linear)
+    AP = A.transpose().dot(P)
+    assert np.allclose(N.to_dense(), AP.dot(A).toarray(), rtol=0, atol=1e-10)
+    assert np.allclose(b, AP.dot(rhs), rtol=0, atol=1e-10)
+
+
+def test_small_groups_of_products():
+    # rows of a group are split into several products
+    rng = np.random.default_rng(4)
+    nbig, mbig, nT, ndays = 3, 2, 3, 1
+    obs = observations(rng, 200, nT, ndays)
+    N, b = construct_normal_system(nbig, mbig, nT, ndays, *obs, True)
+    terms, diagP = design_terms(nbig, mbig, nT, ndays, *obs[:-1], True)
+    N_small = N.zeros(N.nblocks, N.n_coefs, N.bandwidth)
+    b_small = np.zeros_like(b)
+    accumulate_normal_system(N_small, b_small, terms, diagP, obs[-1], N.n_coefs,
+                             rows_per_product=7)
+    assert np.allclose(N_small.to_dense(), N.to_dense(), rtol=0, atol=1e-10)
+    assert np.allclose(b_small, b, rtol=0, atol=1e-10)
+
+
+def test_bandwidth_covers_references():
+    rng = np.random.default_rng(5)
+    nT, ndays = 6, 1
+    time, *_, time_ref, _, _, _, _ = observations(rng, 100, nT, ndays)
+    tic = time_bins(time, nT, ndays).astype(int)
+    tir = time_bins(time_ref, nT, ndays).astype(int)
+    for linear in (True, False):
+        bandwidth = normal_bandwidth([time], [time_ref], [None], nT, ndays, linear)
+        assert bandwidth == max(1, np.max(tic - tir) + int(linear))
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from mosgim.data import rinex
+
+
+def header_line(content, label):
+    return content.ljust(60) + label
+
+
+def obs_field(value):
+    return f'{value:14.3f}  '
+
+
+def epoch_v2(time, flag, sats, nsat=None):
+    t = time.astype(object)
+    nsat = len(sats) if nsat is None else nsat
+    return (f' {t.year % 100:02d} {t.month:2d} {t.day:2d} {t.hour:2d} '
+            f'{t.minute:2d}{t.second:11.7f}  {flag:1d}{nsat:3d}' + ''.join(sats))
+
+
+def epoch_v3(time, flag, nsat):
+    t = time.astype(object)
+    return (f'> {t.year:4d} {t.month:02d} {t.day:02d} {t.hour:02d} '
+            f'{t.minute:02d}{t.second:11.7f}  {flag:1d}{nsat:3d}')
+
+
+def write_v2(path, system, epochs):
+    lines = [header_line(f'{2.11:9.2f}           OBSERVATION DATA    G (GPS)',
+                         'RINEX VERSION / TYPE'),
+             header_line(f'{2850000.:14.4f}{2200000.:14.4f}{5250000.:14.4f}',
+                         'APPROX POSITION XYZ'),
+             header_line(f'{4:6d}    L1    L2    C1    P2', '# / TYPES OF OBSERV'),
+             header_line('  2020     3     5     0     0    0.0000000     ' + system,
+                         'TIME OF FIRST OBS'),
+             header_line('', 'END OF HEADER')]
+    for time, flag, sats, values in epochs:
+        if 1 < flag < 6:
+            lines.append(epoch_v2(time, flag, [], len(values)))
+            lines += values
+            continue
+        lines.append(epoch_v2(time, flag, sats))
+        for l1, l2 in values:
+            lines.append(obs_field(l1) + obs_field(l2) + obs_field(2e7) + obs_field(2e7))
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def write_v3(path, epochs):
+    lines = [header_line(f'{3.04:9.2f}           OBSERVATION DATA    M',
+                         'RINEX VERSION / TYPE'),
+             header_line(f'{2850000.:14.4f}{2200000.:14.4f}{5250000.:14.4f}',
+                         'APPROX POSITION XYZ'),
+             header_line('G    2 L1C L2W', 'SYS / # / OBS TYPES'),
+             header_line('  2020     3     5     0     0    0.0000000     GPS',
+                         'TIME OF FIRST OBS'),
+             header_line('', 'END OF HEADER')]
+    for time, flag, sats, values in epochs:
+        lines.append(epoch_v3(time, flag, len(values)))
+        if 1 < flag < 6:
+            lines += values
+            continue
+        for sat, (l1, l2) in zip(sats, values):
+            lines.append(sat + obs_field(l1) + obs_field(l2))
+    path.write_text('\n'.join(lines) + '\n')
+
+
+T0 = np.datetime64('2020-03-05T00:00:00', 's')
+SLIP = [(1., 2.), (3., 4.)]
+
+
+def epochs_with_events():
+    dt = np.timedelta64(30, 's')
+    return [(T0, 0, ['G01', 'G02'], [(100., 200.), (101., 201.)]),
+            # cycle slips of the same satellites, not phase
+            (T0 + dt, 6, ['G01', 'G02'], SLIP),
+            # power failure, observations are normal
+            (T0 + 2 * dt, 1, ['G01', 'G02'], [(102., 202.), (103., 203.)]),
+            # comments
+            (T0 + 2 * dt, 4, [], ['first comment'.ljust(60) + 'COMMENT',
+                                  'second comment'.ljust(60) + 'COMMENT']),
+            (T0 + 3 * dt, 0, ['G01', 'R05', 'G02'],
+             [(104., 204.), (1., 1.), (105., 205.)])]
+
+
+@pytest.mark.parametrize('version', [2, 3])
+def test_event_flags(tmp_path, version):
+    path = tmp_path / ('test.20o' if version == 2 else 'test.rnx')
+    if version == 2:
+        write_v2(path, 'GPS', epochs_with_events())
+    else:
+        write_v3(path, epochs_with_events())
+    obs = rinex.read_obs(path)
+    dt = np.timedelta64(30, 's')
+    gps_time = np.array([T0, T0, T0 + 2 * dt, T0 + 2 * dt, T0 + 3 * dt, T0 + 3 * dt])
+    assert np.array_equal(obs['gps_time'], gps_time)
+    assert np.array_equal(obs['time'], gps_time - np.timedelta64(18, 's'))
+    assert obs['sat'].tolist() == ['G01', 'G02'] * 3
+    assert obs['L1'].tolist() == [100., 101., 102., 103., 104., 105.]
+    assert obs['L2'].tolist() == [200., 201., 202., 203., 204., 205.]
+
+
+@pytest.mark.parametrize('system, shift', [('GPS', 0), ('   ', 0), ('GAL', 0),
+                                           ('BDT', -14), ('UTC', -18),
+                                           ('GLO', 3 * 3600 - 18)])
+def test_time_systems(tmp_path, system, shift):
+    path = tmp_path / 'test.20o'
+    write_v2(path, system, epochs_with_events()[:1])
+    obs = rinex.read_obs(path)
+    # file time tags are T0 in its system
+    assert obs['gps_time'][0] == T0 - np.timedelta64(shift, 's')
+    assert obs['time'][0] == T0 - np.timedelta64(shift + 18, 's')
+
+
+def test_unknown_time_system(tmp_path):
+    path = tmp_path / 'test.20o'
+    write_v2(path, 'XYZ', epochs_with_events()[:1])
+    with pytest.raises(ValueError):
+        rinex.read_obs(path)
+
+
+def test_leap_seconds():
+    gps = np.array(['1980-01-06T00:00:00', '1999-01-01T00:00:12',
+                    '1999-01-01T00:00:13', '2016-12-31T23:59:59',
+                    '2017-01-01T00:00:17', '2017-01-01T00:00:18',
+                    '2026-10-17T00:00:00'], dtype='datetime64[s]')
+    assert rinex.leap_seconds(gps).tolist() == [0, 12, 13, 17, 17, 18, 18]
+    utc = rinex.gps_to_utc(gps)
+    assert str(utc[-3]) == '2017-01-01T00:00:00'
+    assert str(utc[-2]) == '2017-01-01T00:00:00'
+    # UTC to GPS and back, leap seconds themselves (23:59:60) have no UTC
+    # datetime64 and are taken as 00:00:00 of the next day
+    keep = ~np.isin(np.arange(len(gps)), [1, 4])
+    assert np.array_equal(rinex.to_gps_time(utc, 'UTC')[keep], gps[keep])
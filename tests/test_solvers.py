@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from numpy.linalg import LinAlgError
+
+from mosgim.mosg.banded import BlockBandedMatrix
+from mosgim.mosg.map_creator import construct_normal_system, design_terms
+from mosgim.mosg.solvers import (SOLVERS, WeightedDesign, solve_design,
+                                 solve_normal_system)
+
+WEIGHT = 25.
+
+
+def observations(rng, n, nT):
+    time = rng.uniform(0, 86400., n)
+    time_ref = np.clip(time - rng.uniform(0, 3 * 86400. / nT, n), 0, None)
+    theta, theta_ref = rng.uniform(0, 2 * np.pi, (2, n))
+    phi, phi_ref = rng.uniform(0, np.pi, (2, n))
+    el, el_ref = rng.uniform(np.deg2rad(10), np.pi / 2, (2, n))
+    rhs = rng.normal(0, 1, n)
+    return time, theta, phi, el, time_ref, theta_ref, phi_ref, el_ref, rhs
+
+
+def weights_system(seed, linear, nbig=3, mbig=3, nT=4, n=400):
+    # normal system of stack_weight_solve_ns and design of lsqr
+    rng = np.random.default_rng(seed)
+    obs = observations(rng, n, nT)
+    N, b = construct_normal_system(nbig, mbig, nT, 1, *obs, linear)
+    N.add_frozen_constraints(WEIGHT)
+    terms, diagP = design_terms(nbig, mbig, nT, 1, *obs[:-1], linear)
+    design = WeightedDesign(N.nblocks, N.n_coefs, WEIGHT)
+    design.add(terms, diagP, obs[-1])
+    return N, b, design
+
+
+@pytest.mark.parametrize('solver', SOLVERS[:-1])
+@pytest.mark.parametrize('linear', [True, False])
+@pytest.mark.parametrize('seed', range(2))
+def test_backends_match_dense_solve(solver, linear, seed):
+    N, b, _ = weights_system(seed, linear)
+    expected = np.linalg.solve(N.to_dense(), b)
+    x, report = solve_normal_system(N, b, solver, tol=1e-12)
+    assert report['solver'] == solver
+    assert report['residual'] < 1e-9
+    assert np.allclose(x, expected, rtol=0, atol=1e-6 * np.abs(expected).max())
+
+
+@pytest.mark.parametrize('linear', [True, False])
+def test_design_matches_normal_system(linear):
+    N, b, design = weights_system(2, linear)
+    rng = np.random.default_rng(3)
+    x = rng.normal(size=N.shape[0])
+    A = design.operator()
+    assert A.shape == (design.nobs + (N.nblocks - 1) * N.n_coefs, N.shape[0])
+    assert np.allclose(A.rmatvec(A.matvec(x)), N.dot(x), rtol=0, atol=1e-9)
+    assert np.allclose(design.rmatvec(design.rhs()), b, rtol=0, atol=1e-10)
+    expected = np.linalg.solve(N.to_dense(), b)
+    x, report = solve_design(design, tol=1e-14, maxiter=5000)
+    assert report['solver'] == 'lsqr'
+    assert np.allclose(x, expected, rtol=0, atol=1e-5 * np.abs(expected).max())
+
+
+def indefinite_system(seed, nblocks, bandwidth, n_coefs=3):
+    # regular, but not positive definite, Cholesky fails
+    rng = np.random.default_rng(seed)
+    N = BlockBandedMatrix.zeros(nblocks, n_coefs, bandwidth)
+    for i in range(nblocks):
+        for j in range(max(0, i - bandwidth), i + 1):
+            block = rng.normal(size=(n_coefs, n_coefs))
+            N.add(i, j, block + block.T + 10 * np.eye(n_coefs) if i == j else block)
+    N.add(0, 0, -40 * np.eye(n_coefs))
+    return N, rng.normal(size=N.shape[0])
+
+
+@pytest.mark.parametrize('solver, kinds', [('banded', ('lu_banded', 'lu')),
+                                           ('cholesky', ('lu', 'lu'))])
+@pytest.mark.parametrize('nblocks', [10, 3])
+def test_fallback_of_indefinite_matrix(solver, kinds, nblocks):
+    N, b = indefinite_system(4, nblocks, 1)
+    x, report = solve_normal_system(N, b, solver)
+    assert report['factor'] == kinds[0 if nblocks > 3 else 1]
+    assert np.allclose(x, np.linalg.solve(N.to_dense(), b), rtol=0, atol=1e-10)
+
+
+@pytest.mark.filterwarnings('ignore::scipy.linalg.LinAlgWarning')
+@pytest.mark.parametrize('solver', ['banded', 'cholesky'])
+def test_singular_matrix_is_rejected(solver):
+    # coefficient without observations and constraints
+    N, b, _ = weights_system(5, False)
+    N.blocks[:, :, 0, :] = 0.
+    N.blocks[:, :, :, 0] = 0.
+    with pytest.raises(LinAlgError):
+        solve_normal_system(N, b, solver)
+
+
+def test_unknown_solver():
+    N, b, _ = weights_system(6, False, nT=2, n=50)
+    with pytest.raises(ValueError):
+        solve_normal_system(N, b, 'lsqr')
@@ -0,0 +1,225 @@
+import numpy as np
+import pytest
+
+from collections import defaultdict
+from scipy.signal import savgol_filter
+
+from mosgim.data.tec_prepare import (getContInt, getContIntBatched, 
+                                     process_intervals, savgol_at)
+from mosgim.utils.time_util import sec_of_day
+
+
+def getContInt_loop(times, tec, lon, lat, el, maxgap=30, maxjump=1):
+    # loop version getContInt was before getContIntBatched
+    r = np.array(range(len(times)))
+    idx = np.isfinite(tec) & np.isfinite(lon) & np.isfinite(lat) & np.isfinite(el) & (el > 10.)
+    r = r[idx]
+    intervals = []
+    if len(r) == 0:
+        return idx, intervals
+    beginning = r[0]
+    last = r[0]
+    last_time = times[last]
+    for i in r[1:]:
+        if abs(times[i] - last_time) > maxgap or abs(tec[i] - tec[last]) > maxjump:
+            intervals.append((beginning, last))
+            beginning = i
+        last = i
+        last_time = times[last]
+        if i == r[-1]:
+            intervals.append((beginning, last))
+    return idx, intervals
+
+
+def make_series(rng, n):
+    """
+    Series of 30 s samples with gaps, tec jumps, NaN runs and low elevations
+    """
+    steps = rng.choice([30, 30, 30, 30, 60, 300], size=n)
+    times = np.cumsum(steps) - (steps[0] if n else 0)
+    tec = np.cumsum(rng.normal(0, 0.3, n) + 3 * (rng.random(n) < 0.05))
+    lon = rng.uniform(-180, 180, n)
+    lat = rng.uniform(-90, 90, n)
+    el = rng.uniform(0, 90, n)
+    el[rng.random(n) < 0.1] = 5.
+    for field in (tec, lon, lat, el):
+        if n and rng.random() < 0.5:
+            start = rng.integers(n)
+            field[start: start + rng.integers(1, 6)] = np.nan
+    return times.astype(float), tec, lon, lat, el
+
+
+def special_series():
+    nan = np.nan
+    return [
+        # empty
+        [np.array([], dtype=float)] * 5,
+        # single sample
+        [np.array([0.]), np.array([1.]), np.array([0.]), np.array([0.]), np.array([45.])],
+        # single valid sample among invalid
+        [np.arange(4) * 30., np.array([1., nan, 2., 3.]), np.zeros(4), np.zeros(4),
+         np.array([5., 45., 45., 5.])],
+        # all invalid
+        [np.arange(3) * 30., np.full(3, nan), np.zeros(3), np.zeros(3), np.full(3, 45.)],
+    ]
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_single_satellite_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    series = make_series(rng, int(rng.integers(0, 80)))
+    idx, intervals = getContInt(*series)
+    idx_loop, intervals_loop = getContInt_loop(*series)
+    assert np.array_equal(idx, idx_loop)
+    assert intervals == [(int(s), int(f)) for s, f in intervals_loop]
+
+
+@pytest.mark.parametrize('series', special_series())
+def test_special_cases_match_loop(series):
+    idx, intervals = getContInt(*series)
+    idx_loop, intervals_loop = getContInt_loop(*series)
+    assert np.array_equal(idx, idx_loop)
+    assert intervals == [(int(s), int(f)) for s, f in intervals_loop]
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_batched_matches_loop_per_satellite(seed):
+    rng = np.random.default_rng(seed)
+    sats = [make_series(rng, int(rng.integers(0, 40)))
+            for _ in range(rng.integers(1, 8))]
+    sats += special_series()
+    order = rng.permutation(len(sats))
+    sats = [sats[i] for i in order]
+    # satellites follow each other in time and tec, so only offsets split them
+    end_time, end_tec = 0., 0.
+    for times, tec, _, _, _ in sats:
+        if len(times) == 0:
+            continue
+        times += end_time + 30. - times[0]
+        valid = np.flatnonzero(np.isfinite(tec))
+        if len(valid):
+            tec += end_tec - tec[valid[0]]
+            end_tec = tec[valid[-1]]
+        end_time = times[-1]
+    offsets = np.concatenate([[0], np.cumsum([len(s[0]) for s in sats])])
+    stacked = [np.concatenate([s[k] for s in sats]) for k in range(5)]
+    idx, starts, ends, sat = getContIntBatched(*stacked, offsets)
+    expected_idx = []
+    expected = []
+    for k, series in enumerate(sats):
+        idx_loop, intervals_loop = getContInt_loop(*series)
+        expected_idx.append(idx_loop)
+        expected.extend((offsets[k] + s, offsets[k] + f, k) for s, f in intervals_loop)
+    assert np.array_equal(idx, np.concatenate(expected_idx))
+    assert list(zip(starts.tolist(), ends.tolist(), sat.tolist())) == expected
+
+
+def process_intervals_loop(data, maxgap, maxjump, derivative, short=3600, 
+                           sparse=600):
+    # process_intervals was before savgol_at, smoothed every arc in full
+    result = defaultdict(list)
+    tt = sec_of_day(data['datetime'])
+    idx, intervals = getContInt_loop(tt, data['tec'], data['ipp_lon'],
+                                     data['ipp_lat'], data['el'],
+                                     maxgap=maxgap, maxjump=maxjump)
+    for start, fin in intervals:
+        if (tt[fin] - tt[start]) < short:
+            continue
+        ind_sparse = (tt[start:fin] % sparse == 0)
+        data_sample = data[start:fin].copy()
+        data_sample['tec'] = savgol_filter(data_sample['tec'][:], 21, 2)
+        data_sample = data_sample[ind_sparse]
+        if derivative == True:
+            dtec = data_sample['tec'][1:] - data_sample['tec'][0:-1]
+            data_out = data_sample[1:]
+            data_ref = data_sample[0:-1]
+        if derivative == False:
+            idx_min = np.argmin(data_sample['tec'])
+            data0 = data_sample[idx_min]
+            data_out = np.delete(data_sample, idx_min)
+            dtec = data_out['tec'][:] - data0['tec']
+            data_ref = np.zeros_like(data_out)
+            data_ref[:] = data0
+        result['dtec'].append(dtec)
+        result['out'].append(data_out)
+        result['ref'].append(data_ref)
+    return result
+
+
+def random_arcs(rng, lengths):
+    values = rng.normal(0, 1, int(np.sum(lengths)) + 7)
+    starts = 3 + np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int)
+    return values, starts, starts + np.asarray(lengths)
+
+
+@pytest.mark.parametrize('window, order', [(21, 2), (5, 2), (7, 3), (3, 0)])
+@pytest.mark.parametrize('seed', range(5))
+def test_savgol_at_matches_savgol_filter(window, order, seed):
+    rng = np.random.default_rng(seed)
+    # arcs as long as window and few samples longer, so all points are
+    # near edges, and long arcs
+    lengths = [window, window + 1, window + 2, 2 * window] + \
+        list(rng.integers(window, 10 * window, 5))
+    lengths = rng.permutation(lengths)
+    values, starts, fins = random_arcs(rng, lengths)
+    arcs = np.repeat(np.arange(len(starts)), lengths)
+    points = np.concatenate([np.arange(s, f) for s, f in zip(starts, fins)])
+    # every point and random subset of them
+    for keep in (np.ones(len(points), dtype=bool), rng.random(len(points)) < 0.2):
+        result = savgol_at(values, starts, fins, points[keep], arcs[keep], 
+                           window, order)
+        expected = np.concatenate([
+            savgol_filter(values[s:f], window, order)[points[keep & (arcs == i)] - s]
+            for i, (s, f) in enumerate(zip(starts, fins))])
+        assert np.allclose(result, expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('length', [1, 5, 20])
+def test_savgol_at_rejects_short_arcs(length):
+    rng = np.random.default_rng(length)
+    values, starts, fins = random_arcs(rng, [30, length])
+    with pytest.raises(ValueError):
+        savgol_filter(values[starts[1]:fins[1]], 21, 2)
+    with pytest.raises(ValueError):
+        savgol_at(values, starts, fins, np.array([starts[0]]), np.array([0]))
+
+
+def satellite_data(rng, n):
+    dtype = [('datetime', 'datetime64[s]'), ('tec', float), 
+             ('ipp_lon', float), ('ipp_lat', float), ('el', float)]
+    data = np.zeros(n, dtype=dtype)
+    # samples at multiples of 30 s, so sparse grid points are hit
+    steps = rng.choice([30, 60, 90, 3600], size=n, p=[0.994, 0.002, 0.002, 0.002])
+    data['datetime'] = np.datetime64('2023-03-05T00:00:00') + np.cumsum(steps) - steps[0]
+    data['tec'] = 20 + np.cumsum(rng.normal(0, 0.1, n) + 5 * (rng.random(n) < 0.002))
+    data['ipp_lon'] = rng.uniform(-180, 180, n)
+    data['ipp_lat'] = rng.uniform(-90, 90, n)
+    data['el'] = rng.uniform(11, 90, n)
+    data['el'][rng.random(n) < 0.003] = 5.
+    return data[data['datetime'] < np.datetime64('2023-03-06')]
+
+
+@pytest.mark.parametrize('derivative', [True, False])
+@pytest.mark.parametrize('seed', range(10))
+def test_process_intervals_matches_loop(derivative, seed):
+    rng = np.random.default_rng(seed)
+    data = satellite_data(rng, 2500)
+    result = process_intervals(data, maxgap=35., maxjump=2., derivative=derivative)
+    expected = process_intervals_loop(data, maxgap=35., maxjump=2., 
+                                      derivative=derivative)
+    assert len(result['out']) == len(expected['out']) > 0
+    for field in ('dtec', 'out', 'ref'):
+        assert len(result[field]) == len(expected[field])
+    for dtec, out, ref, dtec_exp, out_exp, ref_exp in zip(
+            result['dtec'], result['out'], result['ref'],
+            expected['dtec'], expected['out'], expected['ref']):
+        assert np.allclose(dtec, dtec_exp, rtol=0, atol=1e-10)
+        assert np.array_equal(out['datetime'], out_exp['datetime'])
+        assert np.allclose(out['tec'], out_exp['tec'], rtol=0, atol=1e-10)
+        # reference of arc is kept once, it was repeated for every observation
+        if not derivative:
+            assert len(ref) == 1
+        assert np.array_equal(np.broadcast_to(ref['datetime'], ref_exp.shape), 
+                              ref_exp['datetime'])
+        assert np.allclose(np.broadcast_to(ref['tec'], ref_exp.shape), 
+                           ref_exp['tec'], rtol=0, atol=1e-10)